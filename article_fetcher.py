@@ -0,0 +1,134 @@
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+import rate_controller
+import snapshot_store
+from page_parser import parse_article_html, PageParseError
+
+# ==== 配置 ====
+UA = 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/138.0.0.0 Safari/537.36'
+BROWSER_HOST = 'xueqiu.com'
+ARTICLE_FETCH_WORKERS = 4  # 同时抓取的长文数量上限
+ARTICLE_TIMEOUT = 15
+
+logger = logging.getLogger(__name__)
+
+class ArticleFetchError(Exception):
+    """长文页面请求失败或页面结构无法解析"""
+
+def fetch_article_with_driver(driver, url, controller=None):
+    """浏览器回退：在新窗口打开长文页提取内容，完成后关闭窗口并切回时间线"""
+    if controller is None:
+        controller = rate_controller.get_controller(BROWSER_HOST)
+    controller.acquire()
+    driver.execute_script(f"window.open('{url}', 'tmp_window');")
+    driver.switch_to.window(driver.window_handles[-1])
+    try:
+        WebDriverWait(driver, 10).until(
+            EC.presence_of_element_located((By.CLASS_NAME, "article__bd"))
+        )
+        # 取一次页面快照在本地解析，不再逐个字段远程查询
+        html = driver.page_source
+        snapshot_store.record(snapshot_store.TRACK_ARTICLE, url, html, url=url)
+        return parse_article_html(html)
+    finally:
+        try:
+            driver.close()
+        except Exception:
+            pass
+        try:
+            driver.switch_to.window(driver.window_handles[0])
+        except Exception:
+            pass
+
+class ArticleFetcher:
+    """
+    并发长文抓取器：时间线翻页时只提交长文URL，由线程池通过HTTP抓取
+    并发数有上限，所有请求仍经过共享的节奏控制器；调用方按时间线顺序取回结果
+    """
+    def __init__(self, cookie_list=None, max_workers=ARTICLE_FETCH_WORKERS, controller=None):
+        self.cookie_list = list(cookie_list or [])
+        self.controller = controller or rate_controller.get_controller(BROWSER_HOST)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='article-fetch')
+        self._local = threading.local()
+        # result() 会在多个爬取线程中调用，计数需要加锁
+        self._lock = threading.Lock()
+        self.fetched = 0
+        self.failed = 0
+
+    def _session(self):
+        """每个抓取线程一个HTTP会话，复用连接与Cookie"""
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.headers.update({'User-Agent': UA, 'Referer': f'https://{BROWSER_HOST}/'})
+            for cookie in self.cookie_list:
+                session.cookies.set(cookie['name'], cookie['value'], domain=cookie['domain'], path=cookie['path'])
+            self._local.session = session
+        return session
+
+    def fetch(self, url):
+        """通过HTTP抓取并解析一篇长文"""
+        self.controller.acquire()
+        start = time.monotonic()
+        try:
+            resp = self._session().get(url, timeout=ARTICLE_TIMEOUT)
+        except requests.RequestException as e:
+            raise ArticleFetchError(f"请求长文失败: {e}")
+        if resp.status_code in (403, 429):
+            self.controller.record_wind_control()
+            raise ArticleFetchError(f"长文返回状态码 {resp.status_code}")
+        if resp.status_code != 200:
+            raise ArticleFetchError(f"长文返回状态码 {resp.status_code}")
+        self.controller.record_latency(time.monotonic() - start)
+        snapshot_store.record(snapshot_store.TRACK_ARTICLE, url, resp.content, url=url)
+        try:
+            # 传入原始字节，由解析器按页面声明识别编码，响应头缺少charset时不会乱码
+            return parse_article_html(resp.content)
+        except PageParseError as e:
+            raise ArticleFetchError(str(e))
+
+    def submit(self, url):
+        """提交一篇长文，返回Future"""
+        return self._executor.submit(self.fetch, url)
+
+    def _count(self, ok):
+        with self._lock:
+            if ok:
+                self.fetched += 1
+            else:
+                self.failed += 1
+
+    def result(self, future, url, driver=None):
+        """
+        取回长文结果；HTTP抓取失败且提供了driver时回退到浏览器抓取
+        两种方式都失败时抛出异常，由调用方记录
+        """
+        try:
+            article = future.result()
+            self._count(True)
+            return article
+        except Exception as e:
+            if driver is None:
+                self._count(False)
+                raise
+            logger.warning(f"HTTP抓取长文失败（{e}），回退到浏览器: {url}")
+        try:
+            article = fetch_article_with_driver(driver, url, self.controller)
+            self._count(True)
+            return article
+        except Exception:
+            self._count(False)
+            raise
+
+    def close(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,151 @@
+import os
+import sys
+import time
+import logging
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from selenium import webdriver
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.chrome.service import Service
+
+# ==== 配置 ====
+UA = 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/138.0.0.0 Safari/537.36'
+# 无头模式：设置 CRAWL_HEADLESS=1 开启
+HEADLESS = os.getenv('CRAWL_HEADLESS', '0') == '1'
+# 轻量模式：屏蔽图片、字体、媒体与第三方统计/广告请求，设置 CRAWL_LIGHTWEIGHT=0 关闭
+LIGHTWEIGHT = os.getenv('CRAWL_LIGHTWEIGHT', '1') == '1'
+# 'eager' 在DOM就绪后即返回，不等待图片等子资源加载完成
+PAGE_LOAD_STRATEGY = 'eager'
+BLOCKED_EXTENSIONS = [
+    'png', 'jpg', 'jpeg', 'gif', 'webp', 'svg', 'ico', 'bmp',
+    'woff', 'woff2', 'ttf', 'otf', 'eot',
+    'mp4', 'webm', 'm3u8', 'mp3',
+]
+# setBlockedURLs的通配符需匹配整个URL：CDN图片常带查询参数（如 a.png?x-oss-process=...），需单独匹配
+BLOCKED_RESOURCE_PATTERNS = [f'*.{ext}' for ext in BLOCKED_EXTENSIONS] + [f'*.{ext}?*' for ext in BLOCKED_EXTENSIONS]
+# 第三方统计与广告主机，以及雪球的图片CDN；页面脚本所在的静态资源主机不能屏蔽
+BLOCKED_HOST_PATTERNS = [
+    '*hm.baidu.com*', '*cnzz.com*', '*google-analytics.com*', '*googletagmanager.com*',
+    '*doubleclick.net*', '*sensorsdata*', '*growingio.com*', '*xqimg.imedao.com*',
+]
+BENCHMARK_ASSET_DELAY = 0.2  # 基准测试夹具中每个子资源的响应延迟（秒）
+BENCHMARK_ASSET_COUNT = 20
+BENCHMARK_RUNS = 5
+
+logger = logging.getLogger(__name__)
+
+def build_chrome_options(ua=UA, headless=HEADLESS, lightweight=LIGHTWEIGHT, extra_args=()):
+    """构造爬虫用的Chrome选项"""
+    options = Options()
+    options.add_argument(f'user-agent={ua}')
+    options.add_experimental_option('excludeSwitches', ['enable-automation'])
+    options.add_experimental_option('useAutomationExtension', False)
+    for arg in extra_args:
+        options.add_argument(arg)
+    if headless:
+        options.add_argument('--headless=new')
+        options.add_argument('--window-size=1920,1080')
+    if lightweight:
+        options.page_load_strategy = PAGE_LOAD_STRATEGY
+        options.add_argument('--blink-settings=imagesEnabled=false')
+        options.add_experimental_option('prefs', {'profile.managed_default_content_settings.images': 2})
+    return options
+
+def apply_resource_blocking(driver, extra_patterns=()):
+    """通过CDP网络拦截屏蔽非必要资源类型与第三方主机"""
+    patterns = BLOCKED_RESOURCE_PATTERNS + BLOCKED_HOST_PATTERNS + list(extra_patterns)
+    driver.execute_cdp_cmd('Network.enable', {})
+    driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': patterns})
+
+def prepare_driver(driver, lightweight=LIGHTWEIGHT, extra_patterns=()):
+    """隐藏webdriver标记，轻量模式下启用资源屏蔽"""
+    driver.execute_cdp_cmd('Page.addScriptToEvaluateOnNewDocument', {
+        'source': '''
+            Object.defineProperty(navigator, 'webdriver', {get: () => undefined});
+        '''
+    })
+    if lightweight:
+        try:
+            apply_resource_blocking(driver, extra_patterns)
+        except Exception as e:
+            logger.warning(f"启用资源屏蔽失败，将加载完整页面: {e}")
+    return driver
+
+def create_crawl_driver(service=None, ua=UA, headless=HEADLESS, lightweight=LIGHTWEIGHT, extra_args=(),
+                        extra_patterns=()):
+    """按爬虫浏览器配置创建WebDriver实例，service为None时由Selenium自动查找驱动"""
+    options = build_chrome_options(ua=ua, headless=headless, lightweight=lightweight, extra_args=extra_args)
+    if service is None:
+        driver = webdriver.Chrome(options=options)
+    else:
+        driver = webdriver.Chrome(service=service, options=options)
+    return prepare_driver(driver, lightweight=lightweight, extra_patterns=extra_patterns)
+
+class _FixtureHandler(BaseHTTPRequestHandler):
+    """基准测试夹具：一个正文页面引用多张图片、字体与第三方脚本，子资源均有固定延迟"""
+    def do_GET(self):
+        host = self.headers.get('Host', '')
+        port = host.rsplit(':', 1)[-1]
+        if self.path in ('/', '/index.html'):
+            # 一半图片带查询参数，与CDN图片链接一致
+            assets = ''.join(
+                f'<img src="/img/{i}.png{"?v=1" if i % 2 else ""}">' for i in range(BENCHMARK_ASSET_COUNT)
+            )
+            body = f'''<html><head>
+<style>@font-face {{font-family: f; src: url(/font/a.woff2);}} body {{font-family: f;}}</style>
+<script src="http://localhost:{port}/analytics.js"></script>
+</head><body><div class="timeline__item__main">正文</div>{assets}</body></html>'''
+            self._send(body.encode('utf-8'), 'text/html; charset=utf-8')
+            return
+        time.sleep(BENCHMARK_ASSET_DELAY)
+        if self.path.endswith('.js'):
+            self._send(b'', 'application/javascript')
+        else:
+            self._send(b'\x00' * 1024, 'application/octet-stream')
+
+    def _send(self, body, content_type):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_fixture_server():
+    """启动本地夹具服务器，返回 (server, 页面URL)"""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _FixtureHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/"
+
+def benchmark_page_load(url, lightweight, runs=BENCHMARK_RUNS, service=None):
+    """测量同一页面在完整/轻量配置下的平均加载耗时（秒）"""
+    # 夹具中的第三方脚本来自localhost，视同第三方主机屏蔽
+    driver = create_crawl_driver(service=service, headless=True, lightweight=lightweight,
+                                 extra_patterns=['*localhost*'])
+    try:
+        timings = []
+        for _ in range(runs):
+            start = time.monotonic()
+            driver.get(url)
+            timings.append(time.monotonic() - start)
+        return sum(timings) / len(timings)
+    finally:
+        driver.quit()
+
+# 基准测试：python browser_profile.py [chromedriver路径]
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    service = Service(sys.argv[1]) if len(sys.argv) > 1 else None
+    server, url = start_fixture_server()
+    try:
+        full = benchmark_page_load(url, lightweight=False, service=service)
+        light = benchmark_page_load(url, lightweight=True, service=service)
+    finally:
+        server.shutdown()
+    print(f"完整配置平均加载耗时: {full:.2f}秒")
+    print(f"轻量配置平均加载耗时: {light:.2f}秒")
+    if light > 0:
+        print(f"加速比: {full / light:.1f}x")
@@ -1,13 +1,13 @@
 import re
 import sys
 import time
-import random
 import hashlib
 import logging
 import json
 import os
+import asyncio
+from urllib.parse import urlparse
 from datetime import datetime, timedelta
-from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
@@ -15,17 +15,38 @@ from selenium.common.exceptions import (
     NoSuchElementException, TimeoutException, InvalidSessionIdException,
     ElementClickInterceptedException
 )
-from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.chrome.service import Service
-from bs4 import BeautifulSoup
+import comment_store
+import snapshot_store
+import vector_index
+import rate_controller
+import session_pool
+import browser_profile
+import page_parser
+import requests
+from requests.adapters import HTTPAdapter
 
 # ==== 配置 ====
 UA = 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/138.0.0.0 Safari/537.36'
 COOKIE_FILE = 'cookie.txt'
 OUTPUT_DIR = 'history_comments'  # JSON文件存储目录
 TXT_OUTPUT_DIR = 'history_comments_txt'  # TXT文件存储目录
-PAUSE_EVERY_N_PAGES = 10
-PAUSE_SECONDS = (30, 120)
+# 抓取后端：'http' 直接请求雪球JSON接口（失败时回退到Selenium），'selenium' 使用浏览器渲染页面
+FETCH_BACKEND = os.getenv('XUEQIU_FETCH_BACKEND', 'http')
+# 可指向本地替身服务器，用于回放录制的接口响应
+XUEQIU_BASE_URL = os.getenv('XUEQIU_BASE_URL', 'https://xueqiu.com').rstrip('/')
+STATUS_API_PATH = '/query/v1/symbol/search/status.json'
+HTTP_PAGE_SIZE = 10
+HTTP_POOL_SIZE = 8
+HTTP_TIMEOUT = 15
+# 浏览器访问的主机，与HTTP后端分别使用各自的节奏控制器
+BROWSER_HOST = 'xueqiu.com'
+# 高水位标记文件后缀，与JSON存档同目录：history_comments/{code}.watermark.json
+WATERMARK_SUFFIX = '.watermark.json'
+# Selenium页面提取模式：'script' 单次脚本调用提取整页，'element' 逐元素提取
+PAGE_EXTRACT_MODE = 'script'
+# 多股票并发爬取的默认并发数
+CRAWL_MANY_CONCURRENCY = 4
 
 # 配置日志
 logging.basicConfig(
@@ -62,11 +83,12 @@ def parse_cookie_str(cookie_str):
             })
     return cookies
 
-def detect_wind_control(driver):
-    """检测是否触发风控"""
-    page = driver.page_source
-    if ("访问异常" in page) or ("请滑动验证" in page):
+def detect_wind_control(driver, controller=None):
+    """检测是否触发风控，命中时通知节奏控制器回退"""
+    if rate_controller.is_wind_control_page(driver.page_source):
         logger.warning("[WARNING] 触发风控页面，暂停或终止本次采集！")
+        if controller is not None:
+            controller.record_wind_control()
         return True
     return False
 
@@ -83,9 +105,9 @@ def remove_from_text(text):
     """移除文本中的'来自XXX'或'· 来自XXX'部分"""
     return re.sub(r'·?\s*来自.*$', '', text).strip()
 
-def normalize_datetime(text):
-    """统一雪球的时间字符串为 YYYY-MM-DD HH:MM 格式"""
-    now = datetime.now()
+def normalize_datetime(text, now=None):
+    """统一雪球的时间字符串为 YYYY-MM-DD HH:MM 格式，now为相对时间的参照（默认当前时间，重建快照时为抓取时间）"""
+    now = now or datetime.now()
     text = text.strip()
     try:
         if '刚刚' in text or '秒前' in text or '分钟前' in text or '小时前' in text:
@@ -119,7 +141,7 @@ def normalize_datetime(text):
         logger.error(f"时间格式化异常: {e}, 文本: {text}")
     return text
 
-def extract_username_and_time(text):
+def extract_username_and_time(text, now=None):
     """从文本中提取用户名和时间"""
     text = remove_modified_text(text)
     text = remove_from_text(text)
@@ -138,7 +160,7 @@ def extract_username_and_time(text):
         if m:
             timestamp_str = m.group(1)
             username = text[:m.start()].strip()
-            normalized_time = normalize_datetime(timestamp_str)
+            normalized_time = normalize_datetime(timestamp_str, now)
             return username, normalized_time
 
     return text.strip(), ''
@@ -165,6 +187,7 @@ def parse_history_comments(file_path):
                 block = [line]
                 current_comment = {}
             elif current_comment is not None and not current_comment.get('username'):
+                block.append(line)
                 line = line.strip()
                 if line:
                     username, timestamp = extract_username_and_time(line)
@@ -172,6 +195,7 @@ def parse_history_comments(file_path):
                     current_comment['timestamp'] = timestamp
                     current_comment['content'] = ''
             elif current_comment is not None:
+                block.append(line)
                 if 'content' not in current_comment:
                     current_comment['content'] = ''
                 current_comment['content'] += line
@@ -187,6 +211,80 @@ def parse_history_comments(file_path):
             comment['content'] = comment['content'].strip()
     return seen_hashes, blocks, comments
 
+def comment_block_lines(nickname, date, content):
+    """构造TXT存档中的单条评论块"""
+    return [
+        f"======\n",
+        f"{nickname} {date}\n",
+        f"{content}\n\n"
+    ]
+
+def comment_hash(nickname, date, content):
+    """计算评论块哈希，与TXT存档中的块文本保持一致"""
+    block_text = ''.join(comment_block_lines(nickname, date, content)).strip()
+    return hashlib.md5(block_text.encode('utf-8')).hexdigest()
+
+def page_record_hashes(records):
+    """一页 (用户名, 时间, 正文) 记录的评论哈希，与采集时的去重规则一致（跳过空正文）"""
+    return [comment_hash(nickname, date, content.strip()) for nickname, date, content in records if content.strip()]
+
+def watermark_path(stock_code):
+    """返回股票高水位标记文件路径"""
+    return os.path.join(OUTPUT_DIR, f"{stock_code}{WATERMARK_SUFFIX}")
+
+def load_watermark(stock_code):
+    """读取股票的高水位标记：已知最新评论的时间与哈希"""
+    path = watermark_path(stock_code)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            watermark = json.load(f)
+        if watermark.get('timestamp'):
+            return watermark
+    except Exception as e:
+        logger.warning(f"读取高水位标记失败: {e}")
+    return None
+
+def save_watermark(stock_code, comments, watermark=None):
+    """根据评论列表推进高水位标记（只前进不后退）"""
+    newest = None
+    for comment in comments:
+        ts = comment.get('timestamp') or ''
+        if re.match(r'^\d{4}-\d{2}-\d{2} \d{2}:\d{2}$', ts) and (newest is None or ts > newest['timestamp']):
+            newest = comment
+    if newest is None:
+        return watermark
+    if watermark and watermark.get('timestamp', '') >= newest['timestamp']:
+        return watermark
+    watermark = {
+        'timestamp': newest['timestamp'],
+        'hash': comment_hash(newest.get('username', ''), newest['timestamp'], newest.get('content', '')),
+        'updated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+    }
+    try:
+        with open(watermark_path(stock_code), 'w', encoding='utf-8') as f:
+            json.dump(watermark, f, ensure_ascii=False, indent=2)
+    except Exception as e:
+        logger.warning(f"写入高水位标记失败: {e}")
+    return watermark
+
+def is_page_known(records, seen_hashes, watermark):
+    """整页评论都已存档，或都早于高水位时间，则认为后续页无需再抓取"""
+    checked = 0
+    mark_ts = watermark.get('timestamp') if watermark else None
+    for nickname, date, content in records:
+        content = content.strip()
+        if not content:
+            continue
+        checked += 1
+        if comment_hash(nickname, date, content) in seen_hashes:
+            continue
+        if mark_ts and date and date < mark_ts:
+            continue
+        return False
+    return checked > 0
+
 def format_stock_code_for_xueqiu(stock_code):
     """将股票代码格式化为雪球网站的标准格式"""
     stock_code = str(stock_code).strip()
@@ -206,43 +304,428 @@ def format_stock_code_for_xueqiu(stock_code):
         return stock_code
 
 def create_driver():
-    """创建并配置WebDriver实例"""
-    options = Options()
-    options.add_argument(f'user-agent={UA}')
-    options.add_experimental_option('excludeSwitches', ['enable-automation'])
-    options.add_experimental_option('useAutomationExtension', False)
-    options.add_argument('--disable-gpu')
-    options.add_argument('--no-sandbox')
-    options.add_argument('--disable-dev-shm-usage')
-    options.add_argument('--remote-debugging-port=9222')
-    # 增加一些反爬措施
-    options.add_argument('--disable-blink-features=AutomationControlled')
-    options.add_argument('--start-maximized')
-    
+    """创建并配置WebDriver实例，使用browser_profile的爬虫浏览器配置（资源屏蔽、DOM就绪即返回、可选无头）"""
+    extra_args = [
+        '--disable-gpu',
+        '--no-sandbox',
+        '--disable-dev-shm-usage',
+        '--remote-debugging-port=9222',
+        # 增加一些反爬措施
+        '--disable-blink-features=AutomationControlled',
+        '--start-maximized',
+    ]
+
     try:
         # 确保chromedriver路径正确
         service = Service(r'G:\RSapp\chromedriver-win64\chromedriver.exe')
-        driver = webdriver.Chrome(service=service, options=options)
-        driver.execute_cdp_cmd('Page.addScriptToEvaluateOnNewDocument', {
-            'source': '''
-                Object.defineProperty(navigator, 'webdriver', {get: () => undefined});
-            '''
-        })
+        driver = browser_profile.create_crawl_driver(service=service, ua=UA, extra_args=extra_args)
         logger.info("成功创建WebDriver实例")
         return driver
     except Exception as e:
         logger.error(f"创建WebDriver实例失败: {e}")
         raise
 
-def get_xueqiu_comments_rich(stock_code, max_pages=10, cookie_file=COOKIE_FILE, detect_duplicates_during_crawl=False):
+class FetchBackendError(Exception):
+    """抓取后端请求失败（网络错误、风控页或非JSON响应）"""
+
+class WindControlError(FetchBackendError):
+    """接口返回风控页或限流状态码"""
+
+def html_to_text(html):
+    """将雪球接口返回的HTML正文转换为与页面展示一致的纯文本（与Selenium的innerText同一套规则）"""
+    return page_parser.fragment_text(html)
+
+def display_time(created_at, now=None):
+    """
+    按讨论区页面的显示规则格式化发帖时间（毫秒时间戳）：
+    刚刚 / N分钟前 / N小时前（当天）/ 昨天 HH:MM / MM-DD HH:MM（当年）/ YYYY-MM-DD HH:MM
+    """
+    now = now or datetime.now()
+    created = datetime.fromtimestamp(int(created_at) / 1000)
+    seconds = (now - created).total_seconds()
+    if seconds < 60:
+        return '刚刚'
+    if seconds < 3600:
+        return f"{int(seconds // 60)}分钟前"
+    if created.date() == now.date():
+        return f"{int(seconds // 3600)}小时前"
+    if created.date() == (now - timedelta(days=1)).date():
+        return created.strftime("昨天 %H:%M")
+    if created.year == now.year:
+        return created.strftime("%m-%d %H:%M")
+    return created.strftime("%Y-%m-%d %H:%M")
+
+def create_http_session(cookie_list):
+    """创建带连接池的HTTP会话，复用parse_cookie_str解析出的Cookie"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update({
+        'User-Agent': UA,
+        'Accept': 'application/json, text/plain, */*',
+        'Referer': XUEQIU_BASE_URL + '/',
+    })
+    for cookie in cookie_list:
+        session.cookies.set(cookie['name'], cookie['value'], domain=cookie['domain'], path=cookie['path'])
+    if not cookie_list:
+        # 未提供Cookie时先访问首页，获取匿名访问所需的token
+        try:
+            session.get(XUEQIU_BASE_URL, timeout=HTTP_TIMEOUT)
+        except requests.RequestException as e:
+            logger.warning(f"访问雪球首页获取匿名Cookie失败: {e}")
+    return session
+
+def status_to_record(status, now=None):
+    """
+    将接口返回的单条帖子转换为 (用户名, 时间, 正文) 三元组
+    先还原成页面上的作者信息文本，再与Selenium提取走同一个blocks_to_records，
+    保证两种后端对同一条评论得到相同的时间、正文与哈希
+    """
+    user = status.get('user') or {}
+    nickname = (user.get('screen_name') or '').strip()
+    created_at = status.get('created_at')
+    shown = ''
+    if created_at:
+        try:
+            shown = display_time(created_at, now)
+        except (TypeError, ValueError, OverflowError, OSError):
+            shown = str(created_at)
+    content = html_to_text(status.get('text') or status.get('description') or '')
+    return blocks_to_records([(f"{nickname} {shown}", content)], now)[0]
+
+def comments_page_records(data, now=None):
+    """解析讨论区接口的一页响应，返回 (记录列表, 最大页数)；now为相对时间的参照（重建快照时为抓取时间）"""
+    statuses = data.get('list') or []
+    return [status_to_record(status, now) for status in statuses], data.get('maxPage')
+
+def fetch_comments_page_http(session, formatted_code, page, page_size=HTTP_PAGE_SIZE):
+    """通过JSON接口获取股票讨论区的一页帖子，返回 (记录列表, 最大页数)"""
+    params = {
+        'count': page_size,
+        'comment': 0,
+        'symbol': formatted_code,
+        'hl': 0,
+        'source': 'all',
+        'sort': 'time',
+        'page': page,
+        'q': '',
+        'type': 11,
+    }
+    try:
+        resp = session.get(XUEQIU_BASE_URL + STATUS_API_PATH, params=params, timeout=HTTP_TIMEOUT)
+    except requests.RequestException as e:
+        raise FetchBackendError(f"请求第{page}页失败: {e}")
+    if resp.status_code in (403, 429):
+        raise WindControlError(f"第{page}页返回状态码 {resp.status_code}")
+    if resp.status_code != 200:
+        raise FetchBackendError(f"第{page}页返回状态码 {resp.status_code}")
+    if rate_controller.is_wind_control_page(resp.text):
+        raise WindControlError("触发风控页面")
+    try:
+        data = resp.json()
+    except ValueError:
+        raise FetchBackendError(f"第{page}页返回内容不是JSON")
+    records, max_page = comments_page_records(data)
+    snapshot_store.record(snapshot_store.COMMENT_API, formatted_code, resp.content, url=resp.url, page=page,
+                          hashes=page_record_hashes(records))
+    return records, max_page
+
+def get_http_controller():
+    """HTTP后端按接口主机共享的节奏控制器"""
+    return rate_controller.get_controller(urlparse(XUEQIU_BASE_URL).netloc)
+
+def get_browser_controller():
+    """Selenium后端共享的节奏控制器"""
+    return rate_controller.get_controller(BROWSER_HOST)
+
+def iter_comment_pages_http(session, formatted_code, max_pages, controller=None, start_page=1):
+    """
+    HTTP后端：从start_page开始逐页产出 [(用户名, 时间, 正文), ...]
+    controller: 节奏控制器，默认使用按主机共享的实例，并发爬取时共同限速
+    """
+    if controller is None:
+        controller = get_http_controller()
+    page = start_page
+    while page <= max_pages:
+        logger.info(f"\n==== [HTTP] 正在采集第 {page} 页评论 ====")
+        controller.acquire()
+        start = time.monotonic()
+        try:
+            records, max_page = fetch_comments_page_http(session, formatted_code, page)
+        except WindControlError:
+            controller.record_wind_control()
+            raise
+        controller.record_latency(time.monotonic() - start)
+        if not records:
+            logger.info("已到最后一页，爬取完成。")
+            break
+        yield records
+        if max_page and page >= int(max_page):
+            logger.info("已到最后一页，爬取完成。")
+            break
+        page += 1
+
+# 一次脚本调用展开当前页所有评论
+EXPAND_ALL_JS = """
+var links = document.querySelectorAll('div[class*="timeline__item__main"] a[class*="timeline__expand__control"]');
+var clicked = 0;
+for (var i = 0; i < links.length; i++) {
+    try { links[i].click(); clicked++; } catch (e) {}
+}
+return clicked;
+"""
+
+# 一次脚本调用取回当前页所有评论块的作者信息与正文
+EXTRACT_PAGE_JS = """
+var blocks = document.querySelectorAll('div[class*="timeline__item__main"]');
+var result = [];
+for (var i = 0; i < blocks.length; i++) {
+    var info = blocks[i].querySelector('div[class*="timeline__item__info"]');
+    var content = blocks[i].querySelector('div[class*="timeline__item__content"]');
+    result.push([info ? info.innerText : '', content ? content.innerText : '']);
+}
+return result;
+"""
+
+def extract_page_records_script(driver, controller=None):
+    """脚本模式：一次展开全部评论，再一次取回整页数据，每页只需两次WebDriver往返"""
+    if controller is None:
+        controller = get_browser_controller()
+    try:
+        expanded = driver.execute_script(EXPAND_ALL_JS)
+        if expanded:
+            # 所有展开请求并行加载，整页只等待一次
+            controller.sleep(1.0, 'expand')
+        raw_blocks = driver.execute_script(EXTRACT_PAGE_JS) or []
+    except Exception as e:
+        logger.warning(f"脚本提取失败（{e}），回退到逐元素提取")
+        return extract_page_records_element(driver, controller)
+    return blocks_to_records(raw_blocks)
+
+def blocks_to_records(raw_blocks, now=None):
+    """将评论块的 (作者信息文本, 正文文本) 转换为 (用户名, 时间, 正文)"""
+    records = []
+    for info_text, content in raw_blocks:
+        nickname, date = extract_username_and_time((info_text or '').strip(), now)
+        records.append((nickname, date, (content or '').strip()))
+    return records
+
+def extract_page_records_element(driver, controller=None):
+    """逐元素模式：逐条查找、滚动并点击“展开”，WebDriver往返次数与评论数成正比"""
+    if controller is None:
+        controller = get_browser_controller()
+    comment_blocks = driver.find_elements(By.XPATH, '//div[contains(@class,"timeline__item__main")]')
+
+    records = []
+    for block in comment_blocks:
+        nickname, date = "", ""
+        content = ""
+
+        # 获取用户信息
+        try:
+            info_elem = block.find_element(By.XPATH, './/div[contains(@class,"timeline__item__info")]')
+            info_text = info_elem.text.strip()
+            nickname, date = extract_username_and_time(info_text)
+        except Exception as e:
+            logger.error(f"提取用户信息异常: {e}")
+
+        # 处理评论内容
+        try:
+            # 优先查找并点击“展开”按钮
+            expand_btns = block.find_elements(By.XPATH, './/a[contains(@class, "timeline__expand__control")]')
+            if expand_btns:
+                expand_btn = expand_btns[0]
+                try:
+                    driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", expand_btn)
+                    driver.execute_script("arguments[0].click();", expand_btn)
+                except Exception:
+                    # 备用点击方法
+                    expand_btn.click()
+                controller.sleep(1.0, 'expand')
+
+            content_elem = block.find_element(By.XPATH, './/div[contains(@class,"timeline__item__content")]')
+            content = content_elem.text.strip()
+        except Exception as e:
+            logger.error(f"评论处理异常: {e}")
+
+        records.append((nickname, date, content))
+
+    return records
+
+def turn_to_next_page(driver, controller):
+    """点击“下一页”并等待翻页开始，已到最后一页或翻页失败时返回False"""
+    try:
+        next_btn = WebDriverWait(driver, 10).until(
+            EC.element_to_be_clickable((By.XPATH, '//a[contains(@class,"pagination__next")]'))
+        )
+        driver.execute_script("arguments[0].scrollIntoView();", next_btn)
+        controller.acquire()
+        start = time.monotonic()
+        try:
+            next_btn.click()
+        except ElementClickInterceptedException:
+            driver.execute_script("arguments[0].click();", next_btn)
+        # 等待旧页面元素失效，确认翻页已开始加载
+        try:
+            WebDriverWait(driver, 15).until(EC.staleness_of(next_btn))
+        except TimeoutException:
+            controller.sleep(2.0, 'render')
+        controller.record_latency(time.monotonic() - start)
+        return True
+    except Exception:
+        return False
+
+def iter_comment_pages_selenium(driver, stock_url, max_pages, extract_mode=PAGE_EXTRACT_MODE,
+                                controller=None, logged_in=False, start_page=1):
+    """
+    Selenium后端：在会话池提供的已登录浏览器中逐页展开评论，从start_page开始产出 [(用户名, 时间, 正文), ...]
+    extract_mode: 'script' 每页一次脚本调用提取，'element' 逐元素提取
+    controller: 节奏控制器，页面访问与翻页前取令牌，触发风控时回退
+    logged_in: 会话池验证过的登录状态，仅用于日志
+    """
+    if controller is None:
+        controller = get_browser_controller()
+    # === 无论是否登录，都尝试访问股票页面并抓取评论 ===
+    logger.info(f"{'已登录状态' if logged_in else '未登录状态'}下访问股票页面: {stock_url}")
+    controller.acquire()
+    start = time.monotonic()
+    driver.get(stock_url)
+
+    # 6. 检查风控
+    if detect_wind_control(driver, controller):
+        logger.error("❌ 触发风控，停止采集")
+        return
+
+    # 7. 验证股票页面加载
+    try:
+        WebDriverWait(driver, 15).until(
+            EC.presence_of_element_located((By.TAG_NAME, "body"))
+        )
+        controller.record_latency(time.monotonic() - start)
+        logger.info("✅ 股票页面加载成功")
+    except TimeoutException:
+        logger.error("❌ 股票页面加载失败")
+        return
+
+    page = 1
+    # 续爬时先翻过已完成的页，不提取内容
+    while page < start_page:
+        if not turn_to_next_page(driver, controller):
+            logger.info(f"续爬翻页在第{page}页失败，爬取完成。")
+            return
+        page += 1
+
+    while page <= max_pages:
+        logger.info(f"\n==== 正在采集第 {page} 页评论 ====")
+        if detect_wind_control(driver, controller):
+            break
+
+        # 等待评论区出现
+        try:
+            WebDriverWait(driver, 15).until(
+                EC.presence_of_element_located((By.CLASS_NAME, "timeline__item__main"))
+            )
+        except TimeoutException:
+            logger.warning("评论区加载超时，跳过本页。")
+            break
+        except InvalidSessionIdException:
+            logger.error("[FATAL] driver session失效，终止采集。")
+            break
+
+        if extract_mode == 'script':
+            records = extract_page_records_script(driver, controller)
+        else:
+            records = extract_page_records_element(driver, controller)
+        if snapshot_store.get_snapshot_store() is not None:
+            # 保存展开后的页面源码，提取逻辑修改后可离线重建
+            snapshot_store.record(snapshot_store.COMMENT_PAGE, stock_url.rstrip('/').rsplit('/', 1)[-1],
+                                  driver.page_source, url=stock_url, page=page, hashes=page_record_hashes(records))
+
+        yield records
+
+        # 翻页处理
+        if not turn_to_next_page(driver, controller):
+            logger.info("已到最后一页或翻页失败，爬取完成。")
+            break
+        page += 1
+
+def _commit_journal(stock_code, journal, archived_hashes, watermark):
+    """
+    将检查点日志中的评论写入JSON与TXT存档，并更新去重索引与高水位标记
+    逐条流式读取日志，内存占用与页数无关；返回写入的评论条数
+    先写JSON追加段并在日志中记录，再写TXT：任一步中断后重新提交都不会重复写入
+    """
+    output_file = os.path.join(TXT_OUTPUT_DIR, f"{stock_code}.txt")
+
+    def pending_comments():
+        # 上次提交中途崩溃时，已写入索引的评论不再重复写入
+        for comment in journal.iter_records():
+            if comment_hash(comment['username'], comment['timestamp'], comment['content']) not in archived_hashes:
+                yield comment
+
+    marker = journal.archived()
+    if marker is None:
+        txt_offset = os.path.getsize(output_file) if os.path.exists(output_file) else 0
+        # JSON存档以追加段写入，读取方通过comment_store看到合并视图
+        count = comment_store.append_comments(stock_code, pending_comments(), base_dir=OUTPUT_DIR)
+        if count == 0:
+            journal.remove()
+            return 0
+        journal.mark_archived(count, txt_offset)
+        logger.info(f"已写入JSON追加段：{os.path.join(OUTPUT_DIR, f'{stock_code}.json')}")
+    elif next(pending_comments(), None) is None:
+        # 去重索引在TXT写完后才更新，索引已包含全部评论说明上次只差删除日志
+        count = marker['count']
+    else:
+        # 上次提交已写入追加段，TXT可能写了一部分：截回写入前的长度后重写
+        count, txt_offset = marker['count'], marker['txt_offset']
+        if os.path.exists(output_file) and os.path.getsize(output_file) > txt_offset:
+            with open(output_file, 'r+b') as f:
+                f.truncate(txt_offset)
+        logger.info(f"JSON追加段已在上次提交中写入，补写TXT存档：{output_file}")
+
+    # 追加写入TXT文件，写入量只与新增评论数相关
+    with open(output_file, "a", encoding="utf-8") as f:
+        for comment in pending_comments():
+            f.writelines(comment_block_lines(comment['username'], comment['timestamp'], comment['content']))
+    logger.info(f"已去重追加写入TXT文件：{output_file}")
+
+    # 存档写入成功后再更新去重索引：中途崩溃最多导致重复，不会丢失评论
+    archived_hashes.add_many(
+        comment_hash(c['username'], c['timestamp'], c['content']) for c in journal.iter_records()
+    )
+
+    # 推进高水位标记，供下次增量爬取提前停止
+    if watermark is None:
+        save_watermark(stock_code, comment_store.load_comments(stock_code, base_dir=OUTPUT_DIR))
+    else:
+        save_watermark(stock_code, journal.iter_records(), watermark)
+
+    journal.remove()
+    return count
+
+def get_xueqiu_comments_rich(stock_code, max_pages=10, cookie_file=COOKIE_FILE, detect_duplicates_during_crawl=False,
+                             backend=FETCH_BACKEND, controller=None, stats=None, incremental=True,
+                             extract_mode=PAGE_EXTRACT_MODE, resume=False):
     """
     获取雪球股票评论，使用修复后的登录逻辑
+    每采集完一页即把新增评论写入检查点日志，全部完成后再统一写入存档
+    detect_duplicates_during_crawl: 保留以兼容旧调用，评论均在每页采集后立即去重
+    backend: 'http' 通过JSON接口抓取（失败时回退到Selenium），'selenium' 直接使用浏览器抓取
+    controller: HTTP后端的节奏控制器，默认使用按主机共享的实例；Selenium后端使用浏览器节奏控制器
+    stats: 可选的字典，用于回传本次采集的页数与评论数
+    incremental: 依据高水位标记提前停止翻页，整页已知或早于标记时不再继续
+    extract_mode: Selenium后端的页面提取模式，'script' 或 'element'
+    resume: 存在上次中断留下的检查点日志时，从最后完成的页之后继续；否则先把日志中的评论补写入存档再重新爬取
     """
+    if stats is None:
+        stats = {}
+    stats.update({'pages': 0, 'comments': 0, 'new_comments': 0, 'early_stop': False, 'resumed_from': None})
     ensure_dir(OUTPUT_DIR)
     ensure_dir(TXT_OUTPUT_DIR)
     
     output_file = os.path.join(TXT_OUTPUT_DIR, f"{stock_code}.txt")
-    json_output_file = os.path.join(OUTPUT_DIR, f"{stock_code}.json")
     
     formatted_code = format_stock_code_for_xueqiu(stock_code)
     stock_url = f"https://xueqiu.com/S/{formatted_code}"
@@ -250,208 +733,106 @@ def get_xueqiu_comments_rich(stock_code, max_pages=10, cookie_file=COOKIE_FILE,
     cookie_str = get_cookie_str_from_file(cookie_file)
     cookie_list = parse_cookie_str(cookie_str)
 
-    global_stop = False
-    comment_index = 1
+    # 持久化去重索引：已存档评论的哈希，仅在写入成功后更新，因此也代表本次爬取之前的存档
+    archived_hashes = comment_store.open_hash_index(stock_code, base_dir=OUTPUT_DIR)
+    if not archived_hashes.is_bootstrapped():
+        # 首次使用索引时，从TXT存档一次性导入历史哈希
+        if os.path.exists(output_file):
+            history_hashes, _, _ = parse_history_comments(output_file)
+            archived_hashes.add_many(history_hashes)
+            logger.info(f"已从TXT存档构建去重索引，共{len(history_hashes)}条哈希")
+        archived_hashes.mark_bootstrapped()
+    watermark = load_watermark(stock_code) if incremental else None
+
+    # 本次爬取中已收集的哈希，评论正文只保存在检查点日志中
+    seen_hashes = set()
+    journal = comment_store.CrawlJournal(stock_code, base_dir=OUTPUT_DIR)
+    start_page = 1
+    last_entry = journal.last_entry() if journal.exists() else None
+    if last_entry is not None and resume and journal.archived() is None:
+        start_page = last_entry['page'] + 1
+        for comment in journal.iter_records():
+            seen_hashes.add(comment_hash(comment['username'], comment['timestamp'], comment['content']))
+        stats['resumed_from'] = start_page
+        logger.info(f"从检查点恢复：已完成{last_entry['page']}页（{len(seen_hashes)}条新评论），从第{start_page}页继续")
+    elif journal.exists():
+        committed = _commit_journal(stock_code, journal, archived_hashes, watermark)
+        logger.info(f"已将上次中断的检查点日志补写入存档，共{committed}条评论")
+        watermark = load_watermark(stock_code) if incremental else None
+
+    def collect(records):
+        """去重一页评论并写入检查点日志，返回True表示可以停止翻页"""
+        page = start_page + stats['pages']
+        stats['pages'] += 1
+        stats['comments'] += len(records)
+        page_comments = []
+        cursor = None
+        for nickname, date, content in records:
+            content = content.strip()
+            if not content:
+                continue
+            h = comment_hash(nickname, date, content)
+            cursor = {'timestamp': date, 'hash': h}
+            if h in seen_hashes or h in archived_hashes:
+                continue
+            seen_hashes.add(h)
+            page_comments.append({
+                'username': nickname,
+                'timestamp': date,
+                'content': content
+            })
+        journal.append_page(page, cursor, page_comments)
+        stats['new_comments'] += len(page_comments)
 
-    seen_hashes, history_blocks, history_comments = parse_history_comments(output_file)
-    new_blocks = []
-    new_comments = []
-    all_new_blocks = []
+        if incremental and is_page_known(records, archived_hashes, watermark):
+            logger.info(f"第{page}页评论均已存档或早于高水位标记，停止翻页。")
+            stats['early_stop'] = True
+            return True
+        return False
 
-    driver = None
+    session = None
     try:
-        driver = create_driver()
-        
-        # === 优化后的访问逻辑 - 支持有/无Cookie情况下都能抓取评论 ===
-        # 1. 直接访问雪球首页
-        logger.info("正在访问雪球首页...")
-        driver.get("https://xueqiu.com")
-        time.sleep(random.uniform(2, 4))
-        
-        # 2. 尝试添加Cookie (如果有)
-        login_status = False
-        if cookie_list:
-            logger.info(f"尝试添加 {len(cookie_list)} 个Cookie...")
-            driver.delete_all_cookies()  # 添加前先清空，避免干扰
-            for cookie in cookie_list:
-                try:
-                    driver.add_cookie(cookie)
-                except Exception as e:
-                    logger.warning(f"添加Cookie {cookie.get('name')} 失败: {e}")
-            
-            # 3. 刷新页面让Cookie生效
-            driver.refresh()
-            time.sleep(random.uniform(3, 5))
-
-            # 4. 验证登录状态（如果验证失败，程序会继续运行）
+        use_selenium = backend != 'http'
+        if not use_selenium:
+            session = create_http_session(cookie_list)
+            fetched_pages = 0
             try:
-                WebDriverWait(driver, 10).until(
-                    EC.presence_of_element_located((By.CSS_SELECTOR, ".nav__user-info"))
-                )
-                logger.info("✅ Cookie登录已生效！")
-                login_status = True
-            except TimeoutException:
-                logger.warning("⚠️ 登录验证失败，将以未登录状态继续操作。")
-        else:
-            logger.info("⚠️ 未提供Cookie，将以未登录状态进行抓取")
-        
-        # === 无论是否登录，都尝试访问股票页面并抓取评论 ===
-        logger.info(f"{'已登录状态' if login_status else '未登录状态'}下访问股票页面: {stock_url}")
-        driver.get(stock_url)
-        time.sleep(random.uniform(3, 5))
-        
-        # 6. 检查风控
-        if detect_wind_control(driver):
-            logger.error("❌ 触发风控，停止采集")
-            return None
-            
-        # 7. 验证股票页面加载
-        try:
-            WebDriverWait(driver, 15).until(
-                EC.presence_of_element_located((By.TAG_NAME, "body"))
-            )
-            logger.info("✅ 股票页面加载成功")
-        except TimeoutException:
-            logger.error("❌ 股票页面加载失败")
-            return None
-
-        page = 1
-        while page <= max_pages:
-            logger.info(f"\n==== 正在采集第 {page} 页评论 ====")
-            if detect_wind_control(driver):
-                global_stop = True
-                break
-
-            # 等待评论区出现
-            try:
-                WebDriverWait(driver, 15).until(
-                    EC.presence_of_element_located((By.CLASS_NAME, "timeline__item__main"))
-                )
-            except TimeoutException:
-                logger.warning("评论区加载超时，跳过本页。")
-                break
-            except InvalidSessionIdException:
-                logger.error("[FATAL] driver session失效，终止采集。")
-                global_stop = True
-                break
-
-            comment_blocks = driver.find_elements(By.XPATH, '//div[contains(@class,"timeline__item__main")]')
-
-            for block in comment_blocks:
-                time.sleep(random.uniform(0.5, 1.2))
-                nickname, date = "", ""
-                content = ""
-
-                # 获取用户信息
-                try:
-                    info_elem = block.find_element(By.XPATH, './/div[contains(@class,"timeline__item__info")]')
-                    info_text = info_elem.text.strip()
-                    nickname, date = extract_username_and_time(info_text)
-                except Exception as e:
-                    logger.error(f"提取用户信息异常: {e}")
-
-                # 处理评论内容
-                try:
-                    # 优先查找并点击“展开”按钮
-                    expand_btns = block.find_elements(By.XPATH, './/a[contains(@class, "timeline__expand__control")]')
-                    if expand_btns:
-                        expand_btn = expand_btns[0]
-                        try:
-                            driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", expand_btn)
-                            time.sleep(random.uniform(0.3, 0.8))
-                            driver.execute_script("arguments[0].click();", expand_btn)
-                            time.sleep(random.uniform(0.8, 1.5))
-                        except Exception:
-                            # 备用点击方法
-                            expand_btn.click()
-                            time.sleep(random.uniform(0.8, 1.5))
-                    
-                    content_elem = block.find_element(By.XPATH, './/div[contains(@class,"timeline__item__content")]')
-                    content = content_elem.text.strip()
-                except Exception as e:
-                    logger.error(f"评论处理异常: {e}")
-
-                if content:
-                    block_lines = [
-                        f"======\n",
-                        f"{nickname} {date}\n",
-                        f"{content}\n\n"
-                    ]
-                    block_text = ''.join(block_lines).strip()
-                    h = hashlib.md5(block_text.encode('utf-8')).hexdigest()
-                      
-                    # 动态去重或全部收集后去重
-                    if detect_duplicates_during_crawl:
-                        if h not in seen_hashes:
-                            new_blocks.append(block_lines)
-                            seen_hashes.add(h)
-                            new_comment = {
-                                'username': nickname,
-                                'timestamp': date,
-                                'content': content.strip()
-                            }
-                            new_comments.append(new_comment)
-                    else:
-                        all_new_blocks.append((h, block_lines, content.strip(), nickname, date))
-
-                comment_index += 1
-
-            # 翻页处理
-            try:
-                next_btn = WebDriverWait(driver, 10).until(
-                    EC.element_to_be_clickable((By.XPATH, '//a[contains(@class,"pagination__next")]'))
-                )
-                driver.execute_script("arguments[0].scrollIntoView();", next_btn)
-                time.sleep(random.uniform(0.6, 1.5))
-                try:
-                    next_btn.click()
-                except ElementClickInterceptedException:
-                    driver.execute_script("arguments[0].click();", next_btn)
-                page += 1
-                time.sleep(random.uniform(2, 5))
-            except Exception as e:
-                logger.info("已到最后一页或翻页失败，爬取完成。")
-                break
-
-            # 定时暂停
-            if page % PAUSE_EVERY_N_PAGES == 0 and page < max_pages:
-                pause_time = random.randint(*PAUSE_SECONDS)
-                logger.info(f"已爬取{page}页，休息{pause_time}秒以防风控...")
-                time.sleep(pause_time)
-
-        # 爬取后去重
-        if not detect_duplicates_during_crawl and all_new_blocks:
-            logger.info("开始爬取后去重处理...")
-            for h, block_lines, content, nickname, date in all_new_blocks:
-                if h not in seen_hashes:
-                    new_blocks.append(block_lines)
-                    seen_hashes.add(h) # 更新seen_hashes以防重复添加
-                    new_comment = {
-                        'username': nickname,
-                        'timestamp': date,
-                        'content': content
-                    }
-                    new_comments.append(new_comment)
-            logger.info(f"去重完成，共新增{len(new_blocks)}条评论")
-        
-        if not new_blocks:
+                for records in iter_comment_pages_http(session, formatted_code, max_pages, controller=controller,
+                                                       start_page=start_page):
+                    fetched_pages += 1
+                    if collect(records):
+                        break
+            except FetchBackendError as e:
+                if fetched_pages == 0:
+                    logger.warning(f"HTTP后端抓取失败（{e}），回退到Selenium后端")
+                    use_selenium = True
+                else:
+                    logger.warning(f"HTTP后端在第{start_page + fetched_pages}页失败（{e}），保留已采集的{fetched_pages}页")
+
+        if use_selenium:
+            # 会话池常驻已登录的浏览器，池大小为1时同时只有一个爬取在使用浏览器
+            pool = session_pool.get_shared_pool(create_driver, cookie_list)
+            with pool.session() as browser:
+                for records in iter_comment_pages_selenium(browser.driver, stock_url, max_pages,
+                                                           extract_mode=extract_mode,
+                                                           logged_in=browser.logged_in,
+                                                           start_page=start_page):
+                    if collect(records):
+                        break
+
+        # 续爬时检查点日志中还包含之前已完成页的评论
+        stats['new_comments'] = len(seen_hashes)
+        if not seen_hashes:
             logger.info("本次运行没有采集到新的评论。")
+            journal.remove()
+            if incremental and watermark is None:
+                save_watermark(stock_code, comment_store.load_comments(stock_code, base_dir=OUTPUT_DIR))
             return None
 
-        logger.info(f"全部主评论数据已采集，准备写入文件：{output_file}")
-
-        # 写入TXT文件
-        all_blocks = history_blocks + new_blocks
-        with open(output_file, "w", encoding="utf-8") as f:
-            for block in all_blocks:
-                f.writelines(block)
-        logger.info(f"已去重合并写入TXT文件：{output_file}")
-
-        # 写入JSON文件
-        all_comments = history_comments + new_comments
-        with open(json_output_file, "w", encoding="utf-8") as f:
-            json.dump(all_comments, f, ensure_ascii=False, indent=2)
-        logger.info(f"已写入JSON文件：{json_output_file}")
+        logger.info(f"全部主评论数据已采集，共新增{len(seen_hashes)}条评论，准备写入文件：{output_file}")
+        _commit_journal(stock_code, journal, archived_hashes, watermark)
+        # 在后台为新评论计算嵌入并追加到向量索引，搜索时只需请求查询词的嵌入
+        vector_index.update_stock_index_in_background(stock_code)
 
         # # 如果有存档函数，则调用
         # if 'save_stock_comment_archive' in globals():
@@ -461,15 +842,12 @@ def get_xueqiu_comments_rich(stock_code, max_pages=10, cookie_file=COOKIE_FILE,
         return output_file
 
     except Exception as e:
-        logger.error(f"爬取过程中发生严重错误: {e}")
+        logger.error(f"爬取过程中发生严重错误: {e}，已完成的页保存在检查点日志中，可使用resume=True续爬")
         return None
     finally:
-        try:
-            if driver:
-                driver.quit()
-                logger.info("浏览器已关闭。")
-        except Exception as e:
-            logger.warning(f"关闭浏览器时出错: {e}")
+        if session is not None:
+            session.close()
+        archived_hashes.close()
 
 def is_valid_stock_code(code):
     """验证股票代码格式"""
@@ -503,6 +881,90 @@ def crawl_stock_comments(stock_code: str, pages: int):
     else:
         return f"股票 {stock_code} 爬取失败，请检查网络或股票代码。"
 
+async def _crawl_stock_comments_many_async(codes, pages, max_concurrency, backend, controller):
+    semaphore = asyncio.Semaphore(max_concurrency)
+    results = {}
+    per_stock_stats = {}
+
+    async def crawl_one(code):
+        async with semaphore:
+            stats = {}
+            per_stock_stats[code] = stats
+            start = time.monotonic()
+            # 每只股票在完成后立即写入 history_comments/{code}.json
+            try:
+                result = await asyncio.to_thread(
+                    get_xueqiu_comments_rich, code, max_pages=pages, backend=backend, controller=controller, stats=stats
+                )
+            except Exception as e:
+                # 单只股票的异常不能中断其余股票的爬取
+                logger.error(f"股票 {code} 爬取异常: {e}")
+                result = None
+                stats.clear()
+            elapsed = time.monotonic() - start
+            if result:
+                results[code] = f"股票 {code} 爬取完成，{stats['pages']}页，新增{stats['new_comments']}条评论，耗时{elapsed:.1f}秒。"
+            elif stats.get('pages'):
+                results[code] = f"股票 {code} 爬取完成，{stats['pages']}页，没有新的评论。"
+            else:
+                results[code] = f"股票 {code} 爬取失败，请检查网络或股票代码。"
+            logger.info(results[code])
+
+    await asyncio.gather(*(crawl_one(code) for code in codes))
+    return results, per_stock_stats
+
+def crawl_stock_comments_many(codes, pages, max_concurrency=CRAWL_MANY_CONCURRENCY, backend=FETCH_BACKEND):
+    """
+    并发爬取多只股票的评论，所有爬取共享同一个按主机的请求节奏预算
+    codes: 股票代码列表
+    pages: 每只股票要采集的评论页数
+    返回: 包含每只股票结果描述与汇总吞吐量的字典
+    """
+    results = {}
+    valid_codes = []
+    for code in codes:
+        code = str(code).strip().upper()
+        if not code or code in valid_codes:
+            continue
+        if not is_valid_stock_code(code):
+            results[code] = f"股票代码 {code} 格式不正确，已跳过。"
+            continue
+        valid_codes.append(code)
+
+    # 所有股票共享按主机的节奏控制器，统计取本次批量爬取前后的差值
+    controller = get_http_controller()
+    before = controller.stats()
+    start = time.monotonic()
+    crawl_results, per_stock_stats = asyncio.run(
+        _crawl_stock_comments_many_async(valid_codes, pages, max(1, max_concurrency), backend, controller)
+    )
+    after = controller.stats()
+    requests_made = after['requests'] - before['requests']
+    wait_seconds = after['wait_seconds'] - before['wait_seconds']
+    results.update(crawl_results)
+    elapsed = time.monotonic() - start
+
+    total_pages = sum(s.get('pages', 0) for s in per_stock_stats.values())
+    total_comments = sum(s.get('comments', 0) for s in per_stock_stats.values())
+    total_new = sum(s.get('new_comments', 0) for s in per_stock_stats.values())
+    pages_per_minute = total_pages / elapsed * 60 if elapsed > 0 else 0.0
+    logger.info(
+        f"批量爬取完成：{len(valid_codes)}只股票，共{total_pages}页、{total_comments}条评论（新增{total_new}条），"
+        f"HTTP请求{requests_made}次（累计等待{wait_seconds:.1f}秒，当前速率{after['rate']:.2f}次/秒），"
+        f"耗时{elapsed:.1f}秒，吞吐量{pages_per_minute:.1f}页/分钟"
+    )
+    return {
+        'results': results,
+        'stocks': len(valid_codes),
+        'pages': total_pages,
+        'comments': total_comments,
+        'new_comments': total_new,
+        'elapsed': elapsed,
+        'pages_per_minute': pages_per_minute,
+        'wait_seconds': wait_seconds,
+        'rate': after['rate'],
+    }
+
 # 保留命令行入口方便测试
 if __name__ == '__main__':
     # 示例用法:
@@ -510,6 +972,15 @@ if __name__ == '__main__':
     # 2. 确保 'chromedriver.exe' 的路径在 create_driver 函数中配置正确。
     # 3. 可根据需要选择使用crawl_stock_comments或get_xueqiu_comments_rich函数
     
+    # 命令行方式0: 传入多个股票代码时并发批量爬取，例如 python comment_spider.py 000426 000651 PDD
+    if len(sys.argv) > 1:
+        max_pages = int(os.getenv('CRAWL_PAGES', '10'))
+        summary = crawl_stock_comments_many(sys.argv[1:], max_pages)
+        for message in summary['results'].values():
+            print(message)
+        print(f"吞吐量: {summary['pages_per_minute']:.1f}页/分钟")
+        sys.exit(0)
+
     # 命令行测试方式1: 使用统一的股票评论爬取方法
     stock_code = input("请输入股票代码（A股6位数字，港股5位数字，美股代码字母）: ").strip().upper()
     if is_valid_stock_code(stock_code):
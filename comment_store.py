@@ -0,0 +1,348 @@
+import os
+import json
+import logging
+import sqlite3
+import threading
+from datetime import datetime
+
+# ==== 配置 ====
+OUTPUT_DIR = 'history_comments'  # JSON文件存储目录（压缩后的基础快照 {code}.json）
+SEGMENT_DIR_NAME = 'segments'  # 追加段目录：history_comments/segments/{code}/
+MANIFEST_FILE = 'manifest.json'
+COMPACT_SEGMENT_THRESHOLD = 8  # 追加段数量达到该值时在后台压缩
+HASH_INDEX_SUFFIX = '.hashes.db'  # 去重哈希索引：history_comments/{code}.hashes.db
+JOURNAL_SUFFIX = '.journal.jsonl'  # 爬取检查点日志：history_comments/{code}.journal.jsonl
+
+logger = logging.getLogger(__name__)
+
+# 每只股票一把锁，保证追加与压缩互斥
+_locks = {}
+_locks_guard = threading.Lock()
+_compacting = set()
+
+def _get_lock(stock_code):
+    with _locks_guard:
+        if stock_code not in _locks:
+            _locks[stock_code] = threading.RLock()
+        return _locks[stock_code]
+
+def _atomic_write_json(path, data, indent=None):
+    """先写临时文件再替换，避免写入中途崩溃留下半个文件"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=indent)
+    os.replace(tmp_path, path)
+
+def base_path(stock_code, base_dir=OUTPUT_DIR):
+    """压缩后的基础快照，即原有的 history_comments/{code}.json"""
+    return os.path.join(base_dir, f"{stock_code}.json")
+
+def segment_dir(stock_code, base_dir=OUTPUT_DIR):
+    return os.path.join(base_dir, SEGMENT_DIR_NAME, stock_code)
+
+def load_manifest(stock_code, base_dir=OUTPUT_DIR):
+    """读取追加段清单，不存在时返回空清单"""
+    path = os.path.join(segment_dir(stock_code, base_dir), MANIFEST_FILE)
+    if os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            logger.error(f"读取追加段清单失败: {e}")
+    return {'next_seq': 1, 'segments': [], 'pending': None}
+
+def _save_manifest(stock_code, manifest, base_dir=OUTPUT_DIR):
+    _atomic_write_json(os.path.join(segment_dir(stock_code, base_dir), MANIFEST_FILE), manifest, indent=2)
+
+def _load_base(stock_code, base_dir=OUTPUT_DIR):
+    path = base_path(stock_code, base_dir)
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def _read_segment(stock_code, segment, base_dir=OUTPUT_DIR):
+    path = os.path.join(segment_dir(stock_code, base_dir), segment['file'])
+    comments = []
+    if not os.path.exists(path):
+        logger.warning(f"追加段文件缺失: {path}")
+        return comments
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                comments.append(json.loads(line))
+    return comments
+
+def _live_segments(manifest, base_len):
+    """
+    返回尚未并入基础快照的追加段
+    压缩在替换基础快照后、更新清单前中断时，依据pending记录跳过已并入的段
+    """
+    segments = manifest.get('segments', [])
+    pending = manifest.get('pending')
+    if pending and base_len == pending.get('base_count'):
+        return [seg for seg in segments if seg['seq'] > pending['through']]
+    return segments
+
+def load_comments(stock_code, base_dir=OUTPUT_DIR):
+    """读取合并视图：基础快照 + 按顺序排列的追加段"""
+    with _get_lock(stock_code):
+        comments = _load_base(stock_code, base_dir)
+        manifest = load_manifest(stock_code, base_dir)
+        for segment in _live_segments(manifest, len(comments)):
+            comments.extend(_read_segment(stock_code, segment, base_dir))
+    return comments
+
+def append_comments(stock_code, comments, base_dir=OUTPUT_DIR):
+    """
+    以新追加段的形式写入评论，写入量只与新增评论数成正比
+    comments可以是生成器，逐条写入而不整体载入内存
+    返回写入的评论条数
+    """
+    with _get_lock(stock_code):
+        os.makedirs(segment_dir(stock_code, base_dir), exist_ok=True)
+        manifest = load_manifest(stock_code, base_dir)
+        seq = manifest.get('next_seq', 1)
+        file_name = f"{seq:06d}.jsonl"
+        seg_path = os.path.join(segment_dir(stock_code, base_dir), file_name)
+        tmp_path = f"{seg_path}.tmp"
+        count = 0
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for comment in comments:
+                f.write(json.dumps(comment, ensure_ascii=False) + '\n')
+                count += 1
+        if count == 0:
+            os.remove(tmp_path)
+            return 0
+        os.replace(tmp_path, seg_path)
+
+        # 首次写入时创建空的基础快照，保证页面能按文件名列出该股票
+        if not os.path.exists(base_path(stock_code, base_dir)):
+            _atomic_write_json(base_path(stock_code, base_dir), [])
+
+        manifest['segments'] = manifest.get('segments', []) + [{
+            'seq': seq,
+            'file': file_name,
+            'count': count,
+            'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        }]
+        manifest['next_seq'] = seq + 1
+        _save_manifest(stock_code, manifest, base_dir)
+        segment_count = len(manifest['segments'])
+
+    logger.info(f"已追加{count}条评论到追加段：{seg_path}")
+    if segment_count >= COMPACT_SEGMENT_THRESHOLD:
+        compact_in_background(stock_code, base_dir)
+    return count
+
+def compact(stock_code, base_dir=OUTPUT_DIR):
+    """将所有追加段并入基础快照 {code}.json，并删除已并入的段文件"""
+    with _get_lock(stock_code):
+        base = _load_base(stock_code, base_dir)
+        manifest = load_manifest(stock_code, base_dir)
+        segments = _live_segments(manifest, len(base))
+        if not segments:
+            return 0
+        merged = list(base)
+        for segment in segments:
+            merged.extend(_read_segment(stock_code, segment, base_dir))
+        through = max(seg['seq'] for seg in segments)
+
+        # 先记录pending，再替换基础快照，最后清理清单，任一步中断都不会重复或丢失评论
+        manifest['pending'] = {'through': through, 'base_count': len(merged)}
+        _save_manifest(stock_code, manifest, base_dir)
+        _atomic_write_json(base_path(stock_code, base_dir), merged, indent=2)
+        manifest['segments'] = [seg for seg in manifest['segments'] if seg['seq'] > through]
+        manifest['pending'] = None
+        manifest['compacted_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        _save_manifest(stock_code, manifest, base_dir)
+
+        for segment in segments:
+            try:
+                os.remove(os.path.join(segment_dir(stock_code, base_dir), segment['file']))
+            except OSError as e:
+                logger.warning(f"删除已压缩的追加段失败: {e}")
+
+    logger.info(f"已压缩{len(segments)}个追加段到 {base_path(stock_code, base_dir)}，共{len(merged)}条评论")
+    return len(segments)
+
+def replace_comments(stock_code, comments, base_dir=OUTPUT_DIR):
+    """以完整的评论列表替换存档（离线重建时使用），写入新的基础快照并清空追加段"""
+    with _get_lock(stock_code):
+        os.makedirs(segment_dir(stock_code, base_dir), exist_ok=True)
+        manifest = load_manifest(stock_code, base_dir)
+        segments = manifest.get('segments', [])
+        # 与压缩相同：先记录pending，替换基础快照中途中断时旧的追加段不会再被读入
+        if segments:
+            manifest['pending'] = {'through': max(seg['seq'] for seg in segments), 'base_count': len(comments)}
+            _save_manifest(stock_code, manifest, base_dir)
+        _atomic_write_json(base_path(stock_code, base_dir), comments, indent=2)
+        manifest['segments'] = []
+        manifest['pending'] = None
+        manifest['rebuilt_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        _save_manifest(stock_code, manifest, base_dir)
+        for segment in segments:
+            try:
+                os.remove(os.path.join(segment_dir(stock_code, base_dir), segment['file']))
+            except OSError as e:
+                logger.warning(f"删除已替换的追加段失败: {e}")
+    logger.info(f"已重建 {base_path(stock_code, base_dir)}，共{len(comments)}条评论")
+    return len(comments)
+
+def compact_in_background(stock_code, base_dir=OUTPUT_DIR):
+    """在后台线程中压缩追加段，同一股票同时只运行一个压缩任务"""
+    with _locks_guard:
+        if stock_code in _compacting:
+            return None
+        _compacting.add(stock_code)
+
+    def run():
+        try:
+            compact(stock_code, base_dir)
+        except Exception as e:
+            logger.error(f"压缩追加段失败: {e}")
+        finally:
+            with _locks_guard:
+                _compacting.discard(stock_code)
+
+    thread = threading.Thread(target=run, name=f"compact-{stock_code}")
+    thread.start()
+    return thread
+
+def hash64(hex_digest):
+    """取MD5十六进制摘要的前64位，转换为SQLite可存储的有符号整数"""
+    value = int(hex_digest[:16], 16)
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+class CommentHashIndex:
+    """
+    单只股票的持久化去重索引，存储评论块哈希的64位前缀
+    打开即可使用，无需重新解析TXT存档，写入时增量更新
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS hashes (h INTEGER PRIMARY KEY) WITHOUT ROWID")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._conn.commit()
+
+    def __contains__(self, hex_digest):
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM hashes WHERE h = ?", (hash64(hex_digest),)).fetchone()
+        return row is not None
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM hashes").fetchone()[0]
+
+    def add_many(self, hex_digests):
+        """批量写入哈希，已存在的忽略"""
+        rows = [(hash64(h),) for h in hex_digests]
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany("INSERT OR IGNORE INTO hashes (h) VALUES (?)", rows)
+            self._conn.commit()
+
+    def is_bootstrapped(self):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'bootstrapped_at'").fetchone()
+        return row is not None
+
+    def mark_bootstrapped(self):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('bootstrapped_at', ?)",
+                (datetime.now().strftime('%Y-%m-%d %H:%M:%S'),)
+            )
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+def hash_index_path(stock_code, base_dir=OUTPUT_DIR):
+    return os.path.join(base_dir, f"{stock_code}{HASH_INDEX_SUFFIX}")
+
+def open_hash_index(stock_code, base_dir=OUTPUT_DIR):
+    """打开（必要时创建）股票的去重哈希索引"""
+    os.makedirs(base_dir, exist_ok=True)
+    return CommentHashIndex(hash_index_path(stock_code, base_dir))
+
+def journal_path(stock_code, base_dir=OUTPUT_DIR):
+    return os.path.join(base_dir, f"{stock_code}{JOURNAL_SUFFIX}")
+
+class CrawlJournal:
+    """
+    单次评论爬取的检查点日志，每采集完一页追加一行并立即落盘
+    行格式：{"page": 页码, "cursor": 本页最后一条评论的时间与哈希, "records": 本页新增评论}
+    提交时JSON追加段写入后追加一行 {"archived": {"count", "txt_offset"}}，补写时据此跳过追加段、回退TXT
+    爬取成功写入存档后删除；中途崩溃时保留，可续爬或在下次爬取前补写
+    """
+    def __init__(self, stock_code, base_dir=OUTPUT_DIR):
+        self.stock_code = stock_code
+        self.path = journal_path(stock_code, base_dir)
+        os.makedirs(base_dir, exist_ok=True)
+        self._repair()
+
+    def _repair(self):
+        """截掉崩溃时写了一半的最后一行，保证后续追加从完整行开始"""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb+') as f:
+            data = f.read()
+            if data and not data.endswith(b'\n'):
+                f.truncate(data.rfind(b'\n') + 1)
+                logger.warning(f"检查点日志末尾存在不完整记录，已截断：{self.path}")
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def _append(self, entry):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def append_page(self, page, cursor, records):
+        """记录一页的采集结果，写入后fsync，崩溃最多丢失当前页"""
+        self._append({'page': page, 'cursor': cursor, 'records': records})
+
+    def mark_archived(self, count, txt_offset):
+        """记录评论已写入JSON追加段，以及写入TXT前TXT文件的长度"""
+        self._append({'archived': {'count': count, 'txt_offset': txt_offset}})
+
+    def archived(self):
+        """已写入JSON追加段时返回 {'count', 'txt_offset'}，否则返回None"""
+        marker = None
+        for entry in self.iter_entries():
+            marker = entry.get('archived', marker)
+        return marker
+
+    def iter_entries(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+
+    def iter_records(self):
+        """按采集顺序逐条产出日志中的评论"""
+        for entry in self.iter_entries():
+            yield from entry.get('records', [])
+
+    def last_entry(self):
+        """最后一个已完成页的记录，日志为空时返回None"""
+        last = None
+        for entry in self.iter_entries():
+            if 'page' in entry:
+                last = entry
+        return last
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,211 @@
+import os
+import time
+import random
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import openai
+import embedding_store
+
+# ==== 配置 ====
+# 所有AI模块共用的嵌入服务，向量按 (模型, 维度, 文本哈希) 缓存，已有的文本不会重复请求
+EMBEDDING_MODEL = os.getenv('QWEN_EMBEDDING_MODEL', 'text-embedding-v4')
+# text-embedding-v4 支持 2048/1536/1024/768/512/256/128/64 维输出，维度越小存储与相似度计算越省
+EMBEDDING_DIM = int(os.getenv('QWEN_EMBEDDING_DIM', '1024'))
+DEFAULT_BASE_URL = "https://dashscope.aliyuncs.com/compatible-mode/v1"
+MAX_RETRIES = 3
+RETRY_DELAY = 2
+# 批量请求：未缓存的文本按条数与估算的token数分批，每批一次请求，各批分配到不同的API密钥并行
+# DashScope 的 text-embedding-v4 每次最多10条，其他兼容接口可调大
+BATCH_MAX_ITEMS = int(os.getenv('QWEN_EMBEDDING_BATCH_SIZE', '10'))
+BATCH_MAX_TOKENS = int(os.getenv('QWEN_EMBEDDING_BATCH_TOKENS', '16000'))
+WORKERS_PER_KEY = 2  # 每个API密钥同时进行的请求数
+# 原JSON缓存（text-embedding-v4 的1024维向量，部分被补零到1536维），只导入同模型同维度的库
+LEGACY_MODEL = 'text-embedding-v4'
+LEGACY_DIM = 1024
+LEGACY_CACHE_FILES = ('embeddings_cache.json', 'comment_embeddings_cache.json')
+
+logger = logging.getLogger(__name__)
+
+def load_api_keys():
+    api_key_str = os.getenv('QWEN_API_KEY', '')
+    return [key.strip() for key in api_key_str.split(',') if key.strip()]
+
+def store_name(model, dim):
+    """向量库按模型与维度分开存放：embeddings/{model}-{dim}.f32"""
+    return f"{model}-{dim}"
+
+def estimate_tokens(text):
+    """粗略估算token数：中文约每字一个token，其他字符约每4个一个，宁可高估"""
+    ascii_count = sum(1 for ch in text if ord(ch) < 128)
+    return len(text) - ascii_count + ascii_count // 4 + 1
+
+def make_batches(texts, max_items=BATCH_MAX_ITEMS, max_tokens=BATCH_MAX_TOKENS):
+    """按顺序把文本分批，每批不超过max_items条与max_tokens个估算token（单条超出的独占一批）"""
+    batches = []
+    batch = []
+    tokens = 0
+    for text in texts:
+        cost = estimate_tokens(text)
+        if batch and (len(batch) >= max_items or tokens + cost > max_tokens):
+            batches.append(batch)
+            batch = []
+            tokens = 0
+        batch.append(text)
+        tokens += cost
+    if batch:
+        batches.append(batch)
+    return batches
+
+class EmbeddingService:
+    """
+    嵌入服务：先查向量库，没有时才请求API；返回的向量维度与配置不符时视为失败，不做补零或截断
+    """
+    def __init__(self, model=EMBEDDING_MODEL, dim=EMBEDDING_DIM, api_keys=None, base_url=None):
+        self.model = model
+        self.dim = dim
+        self.api_keys = list(api_keys) if api_keys is not None else load_api_keys()
+        self.base_url = base_url or os.getenv('QWEN_BASE_URL', DEFAULT_BASE_URL)
+        legacy = LEGACY_CACHE_FILES if (model, dim) == (LEGACY_MODEL, LEGACY_DIM) else None
+        self.store = embedding_store.get_embedding_store(store_name(model, dim), legacy_json=legacy, dim=dim)
+        self._clients = {}
+        self._clients_lock = threading.Lock()
+
+    def _client(self, api_key):
+        """每个API密钥一个客户端，复用连接"""
+        with self._clients_lock:
+            client = self._clients.get(api_key)
+            if client is None:
+                client = openai.OpenAI(api_key=api_key, base_url=self.base_url)
+                self._clients[api_key] = client
+            return client
+
+    def zeros(self):
+        return np.zeros(self.dim, dtype=np.float32)
+
+    def cached(self, text):
+        """只查向量库，不请求API"""
+        vector = self.store.get(text)
+        if vector is not None and vector.size != self.dim:
+            logger.warning(f"向量库中的向量维度为{vector.size}，与配置的{self.dim}不符，忽略")
+            return None
+        return vector
+
+    def _request(self, text, api_key):
+        response = self._client(api_key).embeddings.create(model=self.model, input=text, dimensions=self.dim)
+        vector = np.asarray(response.data[0].embedding, dtype=np.float32)
+        if vector.size != self.dim:
+            raise ValueError(f"返回的向量维度为{vector.size}，与请求的{self.dim}不符")
+        return vector
+
+    def _request_batch(self, texts, api_key):
+        """一次请求多条文本，返回与texts顺序一致的向量列表"""
+        response = self._client(api_key).embeddings.create(model=self.model, input=texts, dimensions=self.dim)
+        if len(response.data) != len(texts):
+            raise ValueError(f"请求{len(texts)}条文本，返回了{len(response.data)}个向量")
+        vectors = [None] * len(texts)
+        for item in response.data:
+            vector = np.asarray(item.embedding, dtype=np.float32)
+            if vector.size != self.dim:
+                raise ValueError(f"返回的向量维度为{vector.size}，与请求的{self.dim}不符")
+            vectors[item.index] = vector
+        return vectors
+
+    def _embed_batch(self, texts, keys, start):
+        """
+        请求一批文本并写入向量库，返回 {文本: 向量}，失败的文本不在其中
+        网络或限流等错误换下一个密钥重试；接口拒绝输入（400）时把该批对半拆分，避免一条文本拖累整批
+        """
+        for attempt in range(MAX_RETRIES):
+            key = keys[(start + attempt) % len(keys)]
+            try:
+                vectors = self._request_batch(texts, key)
+            except openai.BadRequestError as e:
+                if len(texts) == 1:
+                    logger.error(f"接口拒绝了该文本，跳过: {e}")
+                    return {}
+                mid = len(texts) // 2
+                results = self._embed_batch(texts[:mid], keys, start)
+                results.update(self._embed_batch(texts[mid:], keys, start + 1))
+                return results
+            except Exception as e:
+                logger.error(f"使用API密钥...{key[-4:]}获取{len(texts)}条嵌入失败（第{attempt + 1}次）: {e}")
+                if attempt < MAX_RETRIES - 1:
+                    time.sleep(RETRY_DELAY)
+                continue
+            for text, vector in zip(texts, vectors):
+                self.store.put(text, vector)
+            return dict(zip(texts, vectors))
+        return {}
+
+    def embed(self, text, api_key=None):
+        """
+        返回文本的向量，失败时返回None
+        指定api_key时只用该密钥请求一次（由调用方分配密钥并处理重试），否则随机选取密钥重试MAX_RETRIES次
+        """
+        vector = self.cached(text)
+        if vector is not None:
+            return vector
+        keys = [api_key] if api_key else self.api_keys
+        if not keys:
+            logger.error("未配置QWEN_API_KEY，无法获取嵌入向量")
+            return None
+        attempts = 1 if api_key else MAX_RETRIES
+        for attempt in range(attempts):
+            key = keys[0] if api_key else random.choice(keys)
+            try:
+                vector = self._request(text, key)
+                self.store.put(text, vector)
+                return vector
+            except Exception as e:
+                if '401' in str(e) or 'Incorrect API key' in str(e):
+                    logger.error(f"API密钥...{key[-4:]}无效，请检查.env文件中的QWEN_API_KEY配置: {e}")
+                else:
+                    logger.error(f"使用API密钥...{key[-4:]}获取嵌入失败（第{attempt + 1}次）: {e}")
+            if attempt < attempts - 1:
+                time.sleep(RETRY_DELAY)
+        return None
+
+    def embed_many(self, texts, api_keys=None):
+        """
+        批量获取向量，返回与texts顺序一致的列表，失败或空文本对应None
+        已缓存的直接读取，其余去重后按条数与token预算分批，各批轮流分配API密钥并行请求
+        """
+        vectors = [self.cached(text) if text else None for text in texts]
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if text and vector is None))
+        if not missing:
+            return vectors
+        keys = list(api_keys) if api_keys else self.api_keys
+        if not keys:
+            logger.error("未配置QWEN_API_KEY，无法获取嵌入向量")
+            return vectors
+        batches = make_batches(missing)
+        logger.info(f"需要计算嵌入的文本{len(missing)}条，分为{len(batches)}批请求，使用{len(keys)}个API密钥")
+        fetched = {}
+        workers = min(len(batches), len(keys) * WORKERS_PER_KEY)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='Embedding_Batch') as executor:
+            futures = [executor.submit(self._embed_batch, batch, keys, i)
+                       for i, batch in enumerate(batches)]
+            for future in futures:
+                fetched.update(future.result())
+        if len(fetched) < len(missing):
+            logger.warning(f"{len(missing) - len(fetched)}条文本未能获取嵌入")
+        return [vector if vector is not None else fetched.get(text) for text, vector in zip(texts, vectors)]
+
+    def embed_or_zeros(self, text, api_key=None):
+        """与原有各模块的行为一致：失败时返回零向量"""
+        vector = self.embed(text, api_key)
+        return vector if vector is not None else self.zeros()
+
+_services = {}
+_services_guard = threading.Lock()
+
+def get_embedding_service(model=EMBEDDING_MODEL, dim=EMBEDDING_DIM):
+    """按 (模型, 维度) 共享的嵌入服务，API密钥取自环境变量QWEN_API_KEY"""
+    with _services_guard:
+        service = _services.get((model, dim))
+        if service is None:
+            service = EmbeddingService(model, dim)
+            _services[(model, dim)] = service
+        return service
@@ -0,0 +1,225 @@
+import os
+import json
+import atexit
+import struct
+import hashlib
+import logging
+import threading
+import numpy as np
+
+# ==== 配置 ====
+EMBEDDING_DIR = 'embeddings'  # 向量文件 embeddings/{name}.f32 与索引 embeddings/{name}.idx
+FLUSH_INTERVAL = 2.0  # 后台写入间隔（秒）
+FLUSH_BATCH = 256  # 待写入向量达到该数量时立即唤醒后台写入
+# 索引记录：文本MD5（16字节）、向量在数据文件中的起始位置（以float32个数计）、维度
+INDEX_RECORD = struct.Struct('<16sQI')
+DTYPE = np.float32
+
+logger = logging.getLogger(__name__)
+
+def text_key(text):
+    return hashlib.md5(text.encode('utf-8')).digest()
+
+class EmbeddingStore:
+    """
+    只追加的二进制嵌入向量库：向量以float32顺序写入数据文件，索引文件记录 文本哈希 -> 位置与维度
+    首次读写时才加载索引，向量按需从数据文件读取；新向量先放在内存中，由后台线程批量追加写入
+    所有方法线程安全，写入量只与新增向量数成正比
+    """
+    def __init__(self, name, base_dir=EMBEDDING_DIR, legacy_json=None, dim=None):
+        self.name = name
+        self.data_path = os.path.join(base_dir, f"{name}.f32")
+        self.index_path = os.path.join(base_dir, f"{name}.idx")
+        # 原JSON缓存（路径或路径列表），首次创建库时导入；指定dim时只导入该维度的向量
+        if isinstance(legacy_json, str):
+            legacy_json = [legacy_json]
+        self.legacy_json = list(legacy_json or [])
+        self.dim = dim
+        self._lock = threading.RLock()
+        self._index = None  # 文本哈希 -> (位置, 维度)
+        self._pending = {}  # 文本哈希 -> 尚未写入的向量
+        self._data_len = 0  # 数据文件中的float32个数
+        self._reader = None
+        self._wakeup = threading.Event()
+        self._flusher = None
+        self._closed = False
+
+    def _ensure_loaded(self):
+        """加载索引，忽略写入中途崩溃留下的不完整记录；调用方持有锁"""
+        if self._index is not None:
+            return
+        os.makedirs(os.path.dirname(self.data_path) or '.', exist_ok=True)
+        index = {}
+        data_len = os.path.getsize(self.data_path) // DTYPE().itemsize if os.path.exists(self.data_path) else 0
+        valid_bytes = 0
+        data_end = 0  # 已写入索引的数据末尾（以float32个数计）
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'rb') as f:
+                raw = f.read()
+            for pos in range(0, len(raw) - INDEX_RECORD.size + 1, INDEX_RECORD.size):
+                key, offset, dim = INDEX_RECORD.unpack_from(raw, pos)
+                if offset + dim > data_len:
+                    break
+                index[key] = (offset, dim)
+                valid_bytes = pos + INDEX_RECORD.size
+                data_end = max(data_end, offset + dim)
+            if valid_bytes < len(raw):
+                logger.warning(f"嵌入索引{self.index_path}末尾有不完整的记录，已忽略")
+                with open(self.index_path, 'r+b') as f:
+                    f.truncate(valid_bytes)
+        if os.path.exists(self.data_path) and os.path.getsize(self.data_path) > data_end * DTYPE().itemsize:
+            # 数据已写入但索引未写入（或只写了半个向量）的部分截掉，之后的追加从索引记录的末尾开始
+            logger.warning(f"嵌入数据{self.data_path}末尾有未写入索引的数据，已截断")
+            with open(self.data_path, 'r+b') as f:
+                f.truncate(data_end * DTYPE().itemsize)
+        self._index = index
+        self._data_len = data_end
+        if not os.path.exists(self.index_path):
+            for path in self.legacy_json:
+                if os.path.exists(path):
+                    self._import_legacy(path)
+
+    def _adapt_legacy(self, vector):
+        """原缓存中被补零加长的向量去掉补零部分，维度仍不符的返回None"""
+        if self.dim is None or vector.size == self.dim:
+            return vector
+        if vector.size > self.dim and not vector[self.dim:].any():
+            return vector[:self.dim].copy()
+        return None
+
+    def _import_legacy(self, path):
+        """一次性导入原JSON缓存 {文本: 向量列表}"""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                legacy = json.load(f)
+        except Exception as e:
+            logger.warning(f"读取原嵌入缓存{path}失败: {e}")
+            return
+        imported = 0
+        for text, vector in legacy.items():
+            vector = self._adapt_legacy(np.asarray(vector, dtype=DTYPE).ravel())
+            if vector is not None and vector.any():
+                self._pending[text_key(text)] = vector
+                imported += 1
+        self._write_pending()
+        logger.info(f"已将{path}中的{imported}/{len(legacy)}个向量导入{self.data_path}")
+
+    def _read(self, offset, dim):
+        if self._reader is None:
+            self._reader = open(self.data_path, 'rb')
+        self._reader.seek(offset * DTYPE().itemsize)
+        return np.frombuffer(self._reader.read(dim * DTYPE().itemsize), dtype=DTYPE).copy()
+
+    def get(self, text):
+        """返回文本的向量（float32），不存在时返回None"""
+        key = text_key(text)
+        with self._lock:
+            self._ensure_loaded()
+            vector = self._pending.get(key)
+            if vector is not None:
+                return vector.copy()
+            location = self._index.get(key)
+            if location is None:
+                return None
+            return self._read(*location)
+
+    def get_many(self, texts):
+        """批量读取，返回与texts对应的向量列表，不存在的为None"""
+        with self._lock:
+            return [self.get(text) for text in texts]
+
+    def put(self, text, vector):
+        """写入向量：先放入内存，由后台线程追加写入文件"""
+        vector = np.asarray(vector, dtype=DTYPE).ravel()
+        with self._lock:
+            self._ensure_loaded()
+            self._pending[text_key(text)] = vector
+            pending = len(self._pending)
+            self._start_flusher()
+        if pending >= FLUSH_BATCH:
+            self._wakeup.set()
+
+    def __contains__(self, text):
+        key = text_key(text)
+        with self._lock:
+            self._ensure_loaded()
+            return key in self._pending or key in self._index
+
+    def __len__(self):
+        with self._lock:
+            self._ensure_loaded()
+            return len(self._index) + sum(1 for key in self._pending if key not in self._index)
+
+    def _write_pending(self):
+        """追加写入待写向量：先写数据并落盘，再写索引，中途崩溃只会留下无索引的数据；调用方持有锁"""
+        if not self._pending:
+            return 0
+        items = list(self._pending.items())
+        records = []
+        offset = self._data_len
+        with open(self.data_path, 'ab') as f:
+            for key, vector in items:
+                f.write(vector.tobytes())
+                records.append(INDEX_RECORD.pack(key, offset, vector.size))
+                offset += vector.size
+            f.flush()
+            os.fsync(f.fileno())
+        with open(self.index_path, 'ab') as f:
+            f.write(b''.join(records))
+        for (key, vector), record in zip(items, records):
+            self._index[key] = (INDEX_RECORD.unpack(record)[1], vector.size)
+        self._data_len = offset
+        self._pending.clear()
+        return len(items)
+
+    def flush(self):
+        """立即写入全部待写向量，返回写入数量"""
+        with self._lock:
+            if self._index is None:
+                return 0
+            try:
+                return self._write_pending()
+            except Exception as e:
+                logger.error(f"写入嵌入向量失败: {e}")
+                return 0
+
+    def _start_flusher(self):
+        if self._flusher is None and not self._closed:
+            self._flusher = threading.Thread(target=self._flush_loop, name=f"embedding-flush-{self.name}",
+                                             daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self):
+        while not self._closed:
+            self._wakeup.wait(FLUSH_INTERVAL)
+            self._wakeup.clear()
+            self.flush()
+
+    def close(self):
+        self._closed = True
+        self._wakeup.set()
+        self.flush()
+        with self._lock:
+            if self._reader is not None:
+                self._reader.close()
+                self._reader = None
+
+_stores = {}
+_stores_guard = threading.Lock()
+
+def get_embedding_store(name, legacy_json=None, base_dir=EMBEDDING_DIR, dim=None):
+    """按名称共享的向量库，同一进程内的多个分析实例共用同一个库与后台写入线程"""
+    with _stores_guard:
+        store = _stores.get((base_dir, name))
+        if store is None:
+            store = EmbeddingStore(name, base_dir, legacy_json, dim)
+            _stores[(base_dir, name)] = store
+        return store
+
+@atexit.register
+def _flush_all():
+    """进程退出前写入所有库的待写向量"""
+    with _stores_guard:
+        stores = list(_stores.values())
+    for store in stores:
+        store.flush()
@@ -6,20 +6,17 @@ import random
 import logging
 import openai
 import os
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from sklearn.metrics.pairwise import cosine_similarity
 import tqdm
-from queue import Queue, Empty
 import score_stock_comments
+import embedding_service
+import vector_index
 
 # 配置日志
 logger = logging.getLogger(__name__)
 
-# 配置嵌入模型
-EMBEDDING_MODEL = "text-embedding-v4"
-
-# 默认嵌入向量维度，与API实际返回的维度保持一致
-DEFAULT_EMBEDDING_DIM = 1024
+# 嵌入向量维度，由嵌入服务统一配置（环境变量QWEN_EMBEDDING_DIM）
+DEFAULT_EMBEDDING_DIM = embedding_service.EMBEDDING_DIM
 
 class CommentLLMSearch:
     """
@@ -28,8 +25,8 @@ class CommentLLMSearch:
     添加多API并行支持
     """
     def __init__(self, custom_api_keys=None):
-        self.embeddings_cache = {}
-        self.cache_file = "comment_embeddings_cache.json"
+        # 所有AI模块共用的嵌入服务，按 (模型, 维度, 文本哈希) 缓存
+        self.embeddings = embedding_service.get_embedding_service()
         
         # 初始化API密钥
         env_api_key = os.getenv('QWEN_API_KEY')
@@ -50,28 +47,6 @@ class CommentLLMSearch:
         self.max_retries = 3
         self.retry_delay = 2
         self.base_url = os.environ.get("QWEN_BASE_URL", "https://dashscope.aliyuncs.com/compatible-mode/v1")
-        
-        # 加载缓存
-        self._load_cache()
-
-    def _load_cache(self):
-        """加载嵌入缓存"""
-        if os.path.exists(self.cache_file):
-            try:
-                with open(self.cache_file, 'r', encoding='utf-8') as f:
-                    self.embeddings_cache = json.load(f)
-            except Exception as e:
-                logger.debug(f"加载缓存失败: {e}")
-
-    def _save_cache(self):
-        """保存嵌入缓存，创建字典副本以避免并发修改问题"""
-        try:
-            # 创建字典副本，避免并发修改问题
-            cache_copy = dict(self.embeddings_cache)
-            with open(self.cache_file, 'w', encoding='utf-8') as f:
-                json.dump(cache_copy, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            logger.error(f"保存缓存失败: {e}")
 
     def _preprocess_text(self, text):
         """预处理文本：去除冗余符号，标准化格式"""
@@ -91,82 +66,29 @@ class CommentLLMSearch:
         )
     
     def _get_embedding_single(self, text, api_key):
-        """使用指定API密钥获取单个文本嵌入向量"""
-        # 检查缓存
-        if text in self.embeddings_cache:
-            cached_embedding = np.array(self.embeddings_cache[text])
-            # 确保缓存的嵌入向量形状一致
-            if cached_embedding.shape == (DEFAULT_EMBEDDING_DIM,):
-                return cached_embedding, True
-            else:
-                # 如果缓存的形状不正确，重新计算
-                logger.warning(f"缓存的嵌入向量形状不正确: {cached_embedding.shape}，重新计算")
-
-        try:
-            client = self._create_openai_client(api_key)
-            response = client.embeddings.create(
-                model=EMBEDDING_MODEL,
-                input=text
-            )
-            embedding = response.data[0].embedding
-            # 确保嵌入向量形状正确
-            embedding_array = np.array(embedding)
-            if embedding_array.shape != (DEFAULT_EMBEDDING_DIM,):
-                logger.warning(f"获取的嵌入向量形状不正确: {embedding_array.shape}，调整为标准形状")
-                # 调整形状或创建零向量
-                if len(embedding_array) > DEFAULT_EMBEDDING_DIM:
-                    embedding_array = embedding_array[:DEFAULT_EMBEDDING_DIM]  # 截断过长的向量
-                else:
-                    # 填充零到标准长度
-                    padded_embedding = np.zeros(DEFAULT_EMBEDDING_DIM)
-                    padded_embedding[:len(embedding_array)] = embedding_array
-                    embedding_array = padded_embedding
-            # 存入缓存
-            self.embeddings_cache[text] = embedding_array.tolist()
-            self._save_cache()
-            return embedding_array, True
-        except Exception as e:
-            logger.error(f"使用API密钥...{api_key[-4:]}获取嵌入失败: {e}")
-            return np.zeros(DEFAULT_EMBEDDING_DIM), False
+        """使用指定API密钥获取单个文本嵌入向量，返回 (向量, 是否成功)"""
+        embedding = self.embeddings.embed(text, api_key)
+        if embedding is None:
+            return self.embeddings.zeros(), False
+        return embedding, True
     
     def _get_embedding(self, text):
-        """获取文本嵌入向量"""
-        # 检查缓存
-        if text in self.embeddings_cache:
-            cached_embedding = np.array(self.embeddings_cache[text])
-            # 确保缓存的嵌入向量形状一致
-            if cached_embedding.shape == (DEFAULT_EMBEDDING_DIM,):
-                return cached_embedding
-            else:
-                # 如果缓存的形状不正确，重新计算
-                logger.warning(f"缓存的嵌入向量形状不正确: {cached_embedding.shape}，重新计算")
-                return self._get_embedding_single(text, random.choice(self.api_keys))[0]
-        
-        # 对于单个文本，使用随机API密钥重试获取
+        """获取文本嵌入向量，未缓存时使用随机API密钥重试获取"""
+        cached_embedding = self.embeddings.cached(text)
+        if cached_embedding is not None:
+            return cached_embedding
+        if not self.api_keys:
+            logger.error("未配置API密钥，无法获取文本嵌入")
+            return self.embeddings.zeros()
         for attempt in range(self.max_retries):
-            api_key = random.choice(self.api_keys)
-            try:
-                embedding, success = self._get_embedding_single(text, api_key)
-                if success and embedding.shape == (DEFAULT_EMBEDDING_DIM,):
-                    return embedding
-                elif success:
-                    logger.warning(f"获取的嵌入向量形状不正确: {embedding.shape}，调整为标准形状")
-                    # 调整形状或创建零向量
-                    if len(embedding) > DEFAULT_EMBEDDING_DIM:
-                        return embedding[:DEFAULT_EMBEDDING_DIM]  # 截断过长的向量
-                    else:
-                        # 填充零到标准长度
-                        padded_embedding = np.zeros(DEFAULT_EMBEDDING_DIM)
-                        padded_embedding[:len(embedding)] = embedding
-                        return padded_embedding
-            except Exception as e:
-                logger.error(f"获取嵌入尝试 {attempt+1} 失败: {e}")
-            
+            embedding, success = self._get_embedding_single(text, random.choice(self.api_keys))
+            if success:
+                return embedding
             if attempt < self.max_retries - 1:
                 time.sleep(self.retry_delay)
         
         logger.error(f"获取文本嵌入失败，已达最大重试次数")
-        return np.zeros(DEFAULT_EMBEDDING_DIM)  # 返回零向量作为默认值
+        return self.embeddings.zeros()  # 返回零向量作为默认值
 
     def calculate_quality_score(self, comment):
         """计算评论质量分数"""
@@ -417,8 +339,11 @@ def get_comment_llm(custom_api_keys=None):
     return _comment_llm_instance
 
 # 基于embedding的AI智能搜索功能，与history_track_llm类似
-def ai_smart_search(comments, keywords, top_k=50, custom_api_keys=None):
-    """使用embedding搜索相关性高的评论，与history_track_llm类似的实现方式"""
+def ai_smart_search(comments, keywords, top_k=50, custom_api_keys=None, stock_code=None):
+    """
+    使用embedding搜索相关性高的评论，与history_track_llm类似的实现方式
+    指定stock_code时从该股票的向量索引读取评论向量，爬取后已建好索引时只需请求关键词的嵌入
+    """
     try:
         llm_search = get_comment_llm(custom_api_keys=custom_api_keys)
         
@@ -444,76 +369,18 @@ def ai_smart_search(comments, keywords, top_k=50, custom_api_keys=None):
         if not processed_comments:
             return []
         
-        # 计算所有评论的嵌入和相似度（使用并行处理）
-        comment_embeddings = []
-        
-        # 筛选需要计算嵌入的评论（不在缓存中的）
-        texts_to_process = []
-        indices_to_process = []
-        
-        for i, comment in enumerate(processed_comments):
-            text = comment['content_clean']
-            if text in llm_search.embeddings_cache:
-                # 直接从缓存获取
-                comment_embeddings.append(np.array(llm_search.embeddings_cache[text]))
-            else:
-                texts_to_process.append(text)
-                indices_to_process.append(i)
-                # 先占位，后续会填充
-                comment_embeddings.append(None)
-        
-        # 如果有需要计算的文本，使用并行处理
-        if texts_to_process:
-            logger.info(f"需要计算嵌入的文本数量: {len(texts_to_process)}")
-            
-            # 创建任务队列
-            task_queue = Queue()
-            for i, text in enumerate(texts_to_process):
-                task_queue.put({
-                    'text': text,
-                    'index': i
-                })
-            
-            results = [None] * len(texts_to_process)
-            
-            def worker(api_key):
-                """工作线程，使用独立API密钥处理任务"""
-                while not task_queue.empty():
-                    try:
-                        task = task_queue.get_nowait()
-                    except Empty:
-                        break
-                    
-                    text = task['text']
-                    idx = task['index']
-                    
-                    try:
-                        # 先再次检查缓存，避免重复计算
-                        if text in llm_search.embeddings_cache:
-                            results[idx] = np.array(llm_search.embeddings_cache[text])
-                        else:
-                            embedding, success = llm_search._get_embedding_single(text, api_key)
-                            if success:
-                                results[idx] = embedding
-                            else:
-                                results[idx] = np.zeros(DEFAULT_EMBEDDING_DIM)
-                    except Exception as e:
-                        logger.error(f"处理文本 {idx} 时出错: {e}")
-                        results[idx] = np.zeros(DEFAULT_EMBEDDING_DIM)
-                    finally:
-                        task_queue.task_done()
-            
-            # 启动线程池
-            num_workers = min(len(llm_search.api_keys), len(texts_to_process))
-            with ThreadPoolExecutor(max_workers=num_workers, thread_name_prefix='Embedding_Worker') as executor:
-                executor.map(worker, llm_search.api_keys[:num_workers])
-            
-            # 填充计算结果到comment_embeddings
-            for i, idx in enumerate(indices_to_process):
-                comment_embeddings[idx] = results[i]
-        
-        # 计算相似度
-        similarities = cosine_similarity([keyword_embedding], comment_embeddings)[0]
+        # 计算相似度：有向量索引时与归一化的索引矩阵做一次矩阵-向量乘法，
+        # 否则分批请求嵌入，各批分配到不同的API密钥并行
+        texts = [comment['content_clean'] for comment in processed_comments]
+        if stock_code:
+            index = vector_index.stock_index(stock_code, llm_search.embeddings)
+            similarities = index.similarities(keyword_embedding, texts, llm_search.embeddings,
+                                              api_keys=llm_search.api_keys)
+        else:
+            comment_embeddings = llm_search.embeddings.embed_many(texts, api_keys=llm_search.api_keys)
+            comment_embeddings = [embedding if embedding is not None else llm_search.embeddings.zeros()
+                                  for embedding in comment_embeddings]
+            similarities = cosine_similarity([keyword_embedding], comment_embeddings)[0]
         
         # 按相似度排序，先筛选出相关性高于0.4的评论
         sorted_indices = np.argsort(similarities)[::-1]
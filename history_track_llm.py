@@ -1,5 +1,4 @@
 import openai
-import json
 import re
 import os
 import numpy as np
@@ -14,6 +13,9 @@ logger = logging.getLogger(__name__)
 
 # 导入并调用环境变量加载函数
 from utils import load_environment_variables
+import track_store
+import embedding_service
+import vector_index
 load_environment_variables()
 
 # 处理多个API密钥的情况
@@ -36,35 +38,12 @@ client = openai.OpenAI(
     base_url=os.getenv("QWEN_BASE_URL", "https://dashscope.aliyuncs.com/compatible-mode/v1")
 )
 
-# 配置嵌入模型
-EMBEDDING_MODEL = "text-embedding-v4"
 
 class HistoryTrackLLM:
     def __init__(self, history_dir="history_track"):
         self.history_dir = history_dir
-        self.embeddings_cache = {}
-        self.cache_file = "embeddings_cache.json"
-        # 加载缓存
-        self._load_cache()
-
-    def _load_cache(self):
-        """加载嵌入缓存"""
-        if os.path.exists(self.cache_file):
-            try:
-                with open(self.cache_file, 'r', encoding='utf-8') as f:
-                    self.embeddings_cache = json.load(f)
-            except Exception as e:
-                logger.error(f"加载缓存失败: {e}")
-
-    def _save_cache(self):
-        """保存嵌入缓存，创建字典副本以避免并发修改问题"""
-        try:
-            # 创建字典副本，避免并发修改问题
-            cache_copy = dict(self.embeddings_cache)
-            with open(self.cache_file, 'w', encoding='utf-8') as f:
-                json.dump(cache_copy, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            logger.error(f"保存缓存失败: {e}")
+        # 所有AI模块共用的嵌入服务，按 (模型, 维度, 文本哈希) 缓存
+        self.embeddings = embedding_service.get_embedding_service()
 
     def _preprocess_text(self, text):
         """预处理文本：去除冗余符号，标准化格式"""
@@ -77,56 +56,34 @@ class HistoryTrackLLM:
         return text
 
     def _get_embedding(self, text):
-        """获取文本嵌入向量"""
-        # 检查缓存
-        if text in self.embeddings_cache:
-            cached_embedding = np.array(self.embeddings_cache[text])
-            # 确保缓存的嵌入向量形状一致
-            if cached_embedding.shape == (1536,):
-                return cached_embedding
-            else:
-                # 如果缓存的形状不正确，重新计算
-                logger.warning(f"缓存的嵌入向量形状不正确: {cached_embedding.shape}，重新计算")
-
-        try:
-            response = client.embeddings.create(
-                model=EMBEDDING_MODEL,
-                input=text
-            )
-            embedding = response.data[0].embedding
-            # 确保嵌入向量形状正确
-            embedding_array = np.array(embedding)
-            if embedding_array.shape != (1536,):
-                logger.warning(f"获取的嵌入向量形状不正确: {embedding_array.shape}，调整为标准形状")
-                # 调整形状或创建零向量
-                if len(embedding_array) > 1536:
-                    embedding_array = embedding_array[:1536]  # 截断过长的向量
-                else:
-                    # 填充零到标准长度
-                    padded_embedding = np.zeros(1536)
-                    padded_embedding[:len(embedding_array)] = embedding_array
-                    embedding_array = padded_embedding
-            # 存入缓存
-            self.embeddings_cache[text] = embedding_array.tolist()
-            self._save_cache()
-            return embedding_array
-        except Exception as e:
-            # 更详细的错误信息
-            if '401' in str(e) or 'Incorrect API key' in str(e):
-                logger.error(f"API密钥无效，请检查.env文件中的QWEN_API_KEY配置: {e}")
+        """获取文本嵌入向量，已缓存的文本不会重复请求，失败时返回零向量"""
+        return self.embeddings.embed_or_zeros(text)
+
+    def _article_similarities(self, articles, keyword_embedding):
+        """
+        返回关键词与各文章的余弦相似度数组，无法获取嵌入的文章为0
+        按用户与向量索引的归一化矩阵做一次矩阵-向量乘法，爬取后已建好索引时不发起请求；没有用户名的文章直接批量请求
+        """
+        similarities = np.zeros(len(articles), dtype=np.float32)
+        groups = {}
+        for i, article in enumerate(articles):
+            groups.setdefault(article.get('user_name'), []).append(i)
+        for user_name, positions in groups.items():
+            texts = [articles[i]['combined_text'] for i in positions]
+            if user_name:
+                index = vector_index.user_index(user_name, self.embeddings, self.history_dir)
+                similarities[positions] = index.similarities(keyword_embedding, texts, self.embeddings)
             else:
-                logger.error(f"获取嵌入失败: {e}")
-            return np.zeros(1536)  # 返回零向量作为默认值
+                vectors = [vector if vector is not None else self.embeddings.zeros()
+                           for vector in self.embeddings.embed_many(texts)]
+                similarities[positions] = cosine_similarity([keyword_embedding], vectors)[0]
+        return similarities
 
     def load_user_articles(self, user_name):
         """加载指定用户的文章"""
-        user_file = os.path.join(self.history_dir, f"{user_name}_all.json")
-        if not os.path.exists(user_file):
-            return []
-
         try:
-            with open(user_file, 'r', encoding='utf-8') as f:
-                articles = json.load(f)
+            # 优先读取文章库，尚未迁移的用户读取原JSON存档
+            articles = track_store.load_user_history(user_name, self.history_dir)
 
             # 预处理文章
             for article in articles:
@@ -234,50 +191,8 @@ class HistoryTrackLLM:
             # 获取关键词嵌入
             keyword_embedding = self._get_embedding(self._preprocess_text(keywords))
 
-            # 计算所有文章的嵌入和相似度，确保嵌入向量形状一致
-            article_embeddings = []
-            valid_articles = []  # 保存有效的文章，与article_embeddings保持同步
-            for article in tqdm.tqdm(all_articles, desc="计算嵌入"):
-                try:
-                    embedding = self._get_embedding(article['combined_text'])
-                    # 验证嵌入向量的形状
-                    if embedding.shape == (1536,):
-                        article_embeddings.append(embedding)
-                        valid_articles.append(article)
-                    else:
-                        logger.warning(f"嵌入向量形状不一致，跳过此文章: {embedding.shape}")
-                except Exception as e:
-                    logger.error(f"处理文章嵌入时出错: {e}")
-                    continue
-
-            if not article_embeddings:
-                logger.warning("没有有效的嵌入向量，无法进行相似度计算")
-                return []
-
-            # 转换为numpy数组并确保形状一致
-            try:
-                article_embeddings_array = np.vstack(article_embeddings)
-            except ValueError as e:
-                logger.error(f"合并嵌入向量时出错: {e}")
-                # 尝试修复形状不一致的问题
-                fixed_embeddings = []
-                for emb in article_embeddings:
-                    if emb.shape != (1536,):
-                        # 创建标准形状的零向量
-                        fixed_emb = np.zeros(1536)
-                        # 尽可能填充有效数据
-                        valid_length = min(len(emb), 1536)
-                        fixed_emb[:valid_length] = emb[:valid_length]
-                        fixed_embeddings.append(fixed_emb)
-                    else:
-                        fixed_embeddings.append(emb)
-                article_embeddings_array = np.vstack(fixed_embeddings)
-
-            # 计算相似度
-            similarities = cosine_similarity([keyword_embedding], article_embeddings_array)[0]
-            
-            # 更新all_articles为有效的文章列表
-            all_articles = valid_articles
+            # 计算所有文章与关键词的相似度
+            similarities = self._article_similarities(all_articles, keyword_embedding)
 
             # 按相似度排序，先筛选出相关性高于0.4的帖子
             sorted_indices = np.argsort(similarities)[::-1]
@@ -383,52 +298,8 @@ class HistoryTrackLLM:
             # 获取关键词嵌入
             keyword_embedding = self._get_embedding(self._preprocess_text(keywords))
 
-            # 计算所有文章的嵌入和相似度，确保嵌入向量形状一致
-            article_embeddings = []
-            valid_articles = []  # 保存有效的文章，与article_embeddings保持同步
-            for article in tqdm.tqdm(articles, desc="计算嵌入"):
-                try:
-                    embedding = self._get_embedding(article['combined_text'])
-                    # 验证嵌入向量的形状
-                    if embedding.shape == (1536,):
-                        article_embeddings.append(embedding)
-                        valid_articles.append(article)
-                    else:
-                        logger.warning(f"嵌入向量形状不一致，跳过此文章: {embedding.shape}")
-                except Exception as e:
-                    logger.error(f"计算文章嵌入时出错: {e}")
-                    # 添加零向量作为替代
-                    article_embeddings.append(np.zeros(1536))
-                    valid_articles.append(article)
-
-            if not article_embeddings:
-                logger.warning("没有有效的嵌入向量，无法进行相似度计算")
-                return []
-
-            # 转换为numpy数组并确保形状一致
-            try:
-                article_embeddings_array = np.vstack(article_embeddings)
-            except ValueError as e:
-                logger.error(f"合并嵌入向量时出错: {e}")
-                # 尝试修复形状不一致的问题
-                fixed_embeddings = []
-                for emb in article_embeddings:
-                    if emb.shape != (1536,):
-                        # 创建标准形状的零向量
-                        fixed_emb = np.zeros(1536)
-                        # 尽可能填充有效数据
-                        valid_length = min(len(emb), 1536)
-                        fixed_emb[:valid_length] = emb[:valid_length]
-                        fixed_embeddings.append(fixed_emb)
-                    else:
-                        fixed_embeddings.append(emb)
-                article_embeddings_array = np.vstack(fixed_embeddings)
-
-            # 计算相似度
-            similarities = cosine_similarity([keyword_embedding], article_embeddings_array)[0]
-            
-            # 更新articles为有效的文章列表
-            articles = valid_articles
+            # 计算所有文章与关键词的相似度
+            similarities = self._article_similarities(articles, keyword_embedding)
 
             # 计算质量分数并综合排序
             results = []
@@ -0,0 +1,232 @@
+import re
+import sys
+import time
+import logging
+from urllib.parse import urljoin
+from bs4 import BeautifulSoup, NavigableString, Comment
+import rate_controller
+
+try:
+    import lxml  # noqa: F401
+    PARSER = 'lxml'
+except ImportError:
+    PARSER = 'html.parser'
+
+# ==== 配置 ====
+BASE_URL = 'https://xueqiu.com'
+TIMELINE_CLASS = 'profiles__timeline__bd'
+# 时间线条目内需要的元素，以必须同时具备的class集合标识
+ITEM_TARGETS = {
+    'longtext': {'timeline__item__content', 'timeline__item__content--longtext'},
+    'time': {'date-and-source'},
+    'expand': {'timeline__expand__control'},
+    'description': {'content', 'content--description'},
+}
+COMMENT_ITEM_CLASS = 'timeline__item__main'
+COMMENT_INFO_CLASS = 'timeline__item__info'
+COMMENT_CONTENT_CLASS = 'timeline__item__content'
+STATUS_URL_PATTERN = re.compile(r'/(\d+)/(\d+)(?:[/?#]|$)')  # 帖子链接 /{用户ID}/{帖子ID}
+BLOCK_TAGS = {'p', 'div', 'li', 'ul', 'ol', 'blockquote', 'section', 'article', 'pre',
+              'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'table', 'tr'}
+SKIP_TAGS = {'script', 'style', 'noscript', 'template'}
+BENCHMARK_PAGES = 200
+
+logger = logging.getLogger(__name__)
+
+class PageParseError(Exception):
+    """页面快照中缺少需要的结构"""
+
+def element_text(tag):
+    """
+    近似浏览器可见文本（与Selenium的element.text一致）：
+    <br>与块级元素处换行，源码中的换行与行内空白合并为一个空格（<pre>内保留换行），去掉首尾空白与空行
+    """
+    parts = []
+
+    def walk(node, pre):
+        for child in node.children:
+            if isinstance(child, Comment):
+                continue
+            if isinstance(child, NavigableString):
+                parts.append(str(child) if pre else re.sub(r'[ \t\n\r\f\v]+', ' ', str(child)))
+                continue
+            if child.name in SKIP_TAGS:
+                continue
+            if child.name == 'br':
+                parts.append('\n')
+                continue
+            block = child.name in BLOCK_TAGS
+            if block:
+                parts.append('\n')
+            walk(child, pre or child.name == 'pre')
+            if block:
+                parts.append('\n')
+
+    walk(tag, tag.name == 'pre')
+    lines = (re.sub(r'[ \t\r\f\v\xa0]+', ' ', line).strip() for line in ''.join(parts).split('\n'))
+    return '\n'.join(line for line in lines if line)
+
+def fragment_text(html):
+    """接口返回的HTML正文片段转换为可见文本，规则与element_text相同"""
+    if not html:
+        return ''
+    return element_text(BeautifulSoup(html, PARSER))
+
+def status_id_from_url(url):
+    """从帖子链接中取帖子ID，不是帖子链接时返回None"""
+    m = STATUS_URL_PATTERN.search(url or '')
+    return m.group(2) if m else None
+
+def _scan_item(item):
+    """一次遍历条目的全部后代，取各目标元素的第一个匹配"""
+    found = {}
+    for tag in item.find_all(True):
+        classes = tag.get('class')
+        if not classes:
+            continue
+        for key, required in ITEM_TARGETS.items():
+            if key not in found and required.issubset(classes):
+                found[key] = tag
+    return found
+
+def parse_timeline_html(html, base_url=BASE_URL):
+    """
+    从用户时间线快照（整页page_source或时间线区域的outerHTML）中一次性提取本页全部文章
+    返回按页面顺序排列的条目列表，每条为
+    {'index', 'is_top', 'status_id', 'time_text', 'longtext_url', 'is_longtext', 'expandable', 'description'}
+    index为条目在时间线区域子元素中的位置，需要浏览器展开时据此定位；首个子元素不是文章，跳过
+    status_id取自发布时间链接（长文取正文链接），编辑后的帖子ID不变，用于识别同一篇文章的修订
+    """
+    soup = BeautifulSoup(html, PARSER)
+    area = soup.find(class_=TIMELINE_CLASS)
+    if area is None:
+        if rate_controller.is_wind_control_page(soup.get_text()):
+            raise PageParseError("触发风控页面")
+        raise PageParseError("页面中没有时间线区域")
+    children = [child for child in area.children if getattr(child, 'name', None)]
+    items = []
+    for index, item in enumerate(children[1:], start=1):
+        found = _scan_item(item)
+        longtext = found.get('longtext')
+        longtext_url = None
+        if longtext is not None:
+            link = next((child for child in longtext.children if getattr(child, 'name', None)), None)
+            href = link.get('href') if link is not None else None
+            longtext_url = urljoin(base_url, href) if href else None
+        time_tag = found.get('time')
+        items.append({
+            'index': index,
+            'is_top': '置顶' in item.get_text(),
+            'status_id': status_id_from_url(time_tag.get('href') if time_tag is not None else None)
+            or status_id_from_url(longtext_url),
+            'time_text': element_text(time_tag) if time_tag is not None else None,
+            'is_longtext': longtext is not None,
+            'longtext_url': longtext_url,
+            'expandable': 'expand' in found,
+            'description': element_text(found['description']) if 'description' in found else None,
+        })
+    return items
+
+def _class_contains(fragment):
+    """匹配class属性中包含fragment的元素，与CSS选择器 [class*=fragment] 一致"""
+    return lambda tag: fragment in ' '.join(tag.get('class') or ())
+
+def parse_comment_page_html(html):
+    """
+    从展开后的股票讨论区页面快照中提取评论块，返回 [(作者信息文本, 正文文本), ...]
+    与浏览器中的EXTRACT_PAGE_JS一致；已展开的评论只取全文（content--detail），不重复计入摘要
+    """
+    soup = BeautifulSoup(html, PARSER)
+    blocks = soup.find_all(_class_contains(COMMENT_ITEM_CLASS))
+    if not blocks and rate_controller.is_wind_control_page(soup.get_text()):
+        raise PageParseError("触发风控页面")
+    result = []
+    for block in blocks:
+        info = block.find(_class_contains(COMMENT_INFO_CLASS))
+        content = block.find(_class_contains(COMMENT_CONTENT_CLASS))
+        if content is not None:
+            content = content.find(class_='content--detail') or content
+        result.append((element_text(info) if info is not None else '',
+                       element_text(content) if content is not None else ''))
+    return result
+
+def parse_article_html(html):
+    """
+    从长文页面HTML中提取标题、时间文本与正文段落
+    返回 {'title', 'time_text', 'paragraphs'}，正文缺失时paragraphs为None
+    """
+    soup = BeautifulSoup(html, PARSER)
+    if rate_controller.is_wind_control_page(soup.get_text()):
+        raise PageParseError("触发风控页面")
+    article_area = soup.select_one('.article__bd')
+    time_elem = soup.select_one('.time')
+    if article_area is None or time_elem is None:
+        raise PageParseError("页面中没有长文正文区域")
+    title_elem = next((child for child in article_area.children if getattr(child, 'name', None)), None)
+    detail = article_area.select_one('.article__bd__detail')
+    paragraphs = None
+    if detail is not None:
+        paragraphs = [
+            child.get_text().replace('\n', '')
+            for child in detail.children if getattr(child, 'name', None)
+        ]
+    return {
+        'title': title_elem.get_text().strip() if title_elem is not None else '',
+        'time_text': time_elem.get_text().strip(),
+        'paragraphs': paragraphs,
+    }
+
+def build_timeline_fixture(count=20, pinned=True, longtext_every=5, expand_every=4, start_day=16):
+    """
+    生成结构与雪球用户时间线一致的HTML夹具，用于解析校验与基准测试
+    每longtext_every条为长文，每expand_every条短文带展开按钮，pinned时第一条为置顶
+    """
+    items = ['<div class="profiles__timeline__hd">全部 原发布 长文</div>']
+    for i in range(count):
+        time_text = f"修改于10-{start_day:02d} {23 - i % 24:02d}:{59 - i % 60:02d} · 来自雪球"
+        top = '<span class="timeline__item__top">置顶</span>' if pinned and i == 0 else ''
+        if longtext_every and i % longtext_every == longtext_every - 1:
+            body = (f'<div class="timeline__item__content timeline__item__content--longtext">'
+                    f'<a href="/1234567890/{300000000 + i}">长文标题{i}</a><p>长文摘要{i}</p></div>')
+        elif expand_every and i % expand_every == expand_every - 1:
+            body = (f'<div class="timeline__item__content"><div class="content content--description">'
+                    f'短文摘要{i}&nbsp; <a href="/S/SH600519">$贵州茅台(SH600519)$</a>...</div>'
+                    f'<a class="timeline__expand__control">展开</a></div>')
+        else:
+            body = (f'<div class="timeline__item__content"><div class="content content--description">'
+                    f'<p>第{i}条短文 第一行</p><p>第二行<br>第三行</p></div></div>')
+        items.append(
+            f'<article class="timeline__item">{top}<div class="timeline__item__info">'
+            f'<a class="date-and-source" href="/1234567890/{200000000 + i}">{time_text}</a></div>'
+            f'<div class="timeline__item__bd">{body}</div>'
+            f'<div class="timeline__item__ft"><a>转发</a><a>评论</a><a>赞</a></div></article>'
+        )
+    return (f'<html><head><title>雪球</title><script>var SNB = {{}};</script></head><body>'
+            f'<div class="profiles__timeline__bd">{"".join(items)}</div>'
+            f'<ul class="pagination"><li class="pagination__next">下一页</li></ul></body></html>')
+
+def build_article_fixture(paragraphs=30):
+    """生成结构与雪球长文页一致的HTML夹具"""
+    body = ''.join(f'<p>第{i}段正文，包含$贵州茅台(SH600519)$等内容。</p>' for i in range(paragraphs))
+    return (f'<html><body><article class="article__bd"><h1 class="article__bd__title">长文标题</h1>'
+            f'<div class="article__bd__from"><a class="time">发布于2025-08-24 23:23</a></div>'
+            f'<div class="article__bd__detail">{body}</div></article></body></html>')
+
+def benchmark_parse(parse, html, pages=BENCHMARK_PAGES):
+    """重复解析同一快照，返回每秒解析页数"""
+    start = time.perf_counter()
+    for _ in range(pages):
+        parse(html)
+    return pages / (time.perf_counter() - start)
+
+# 基准测试：python page_parser.py [每页条数]
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    timeline_html = build_timeline_fixture(count)
+    article_html = build_article_fixture()
+    items = parse_timeline_html(timeline_html)
+    print(f"解析器: {PARSER}，时间线每页{len(items)}条，"
+          f"长文{sum(item['is_longtext'] for item in items)}条，待展开{sum(item['expandable'] for item in items)}条")
+    print(f"时间线解析: {benchmark_parse(parse_timeline_html, timeline_html):.1f} 页/秒")
+    print(f"长文解析: {benchmark_parse(parse_article_html, article_html):.1f} 页/秒")
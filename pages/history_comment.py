@@ -1,10 +1,9 @@
 import os
-import json
 import re
 import streamlit as st
 from datetime import datetime
 from utils import custom_paginate_and_render, render_block, list_stock_files_by_type
-from storage import OUTPUT_STOCK_COMMENTS
+from storage import OUTPUT_STOCK_COMMENTS, load_stock_comments
 from score_stock_comments import StockCommentScorer
 from history_comment_llm import ai_smart_search
 
@@ -65,8 +64,7 @@ def render():
             st.write("暂无评论内容")
         else:
             try:
-                with open(filepath, 'r', encoding='utf-8') as f:
-                    comments = json.load(f)
+                comments = load_stock_comments(code)
 
                 # 全部存档浏览模式
                 if st.session_state.history_reading_mode == "full":
@@ -100,7 +98,7 @@ def render():
                         try:
                             with st.spinner("正在计算评论相关性..."):
                                 # 使用AI智能搜索
-                                results = ai_smart_search(comments, keyword, custom_api_keys=None)
+                                results = ai_smart_search(comments, keyword, custom_api_keys=None, stock_code=code)
 
                             # 格式化显示结果
                                 blocks = []
@@ -4,7 +4,7 @@ import json  # 添加JSON模块导入
 import streamlit as st  # 添加streamlit导入
 from comment_spider import get_xueqiu_comments_rich
 from utils import custom_paginate_and_render, render_block
-from storage import save_recent_stock_comment, load_recent_stock_comment, save_stock_comment_archive, load_stock_comment_archive
+from storage import save_recent_stock_comment, load_recent_stock_comment, save_stock_comment_archive, load_stock_comment_archive, load_stock_comments
 from datetime import datetime
 
 OUTPUT_STOCK_COMMENTS = 'history_comments'
@@ -81,8 +81,7 @@ def render():
                         # 统一从JSON文件读取
                         json_file = f"history_comments/{stock_code}.json"
                         if os.path.exists(json_file):
-                            with open(json_file, 'r', encoding='utf-8') as f:
-                                blocks = json.load(f)
+                            blocks = load_stock_comments(stock_code)
                             st.session_state.stock_comments = blocks
                             ## 保存到存档
                             save_stock_comment_archive(stock_code)
@@ -251,8 +250,7 @@ def render():
             json_file = os.path.join(OUTPUT_STOCK_COMMENTS, f"{recent_code}.json")
             if os.path.exists(json_file):
                 try:
-                    with open(json_file, 'r', encoding='utf-8') as f:
-                        blocks = json.load(f)
+                    blocks = load_stock_comments(recent_code)
                     if blocks:
                         st.session_state.stock_code = recent_code
                         st.session_state.stock_comments = blocks
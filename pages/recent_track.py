@@ -1,7 +1,7 @@
 import streamlit as st
-from track_spider import crawl_user_articles, load_id_name_map
+from track_spider import iter_user_articles, load_id_name_map
 from utils import render_block, custom_paginate_and_render
-from storage import save_recent_track, load_recent_track
+from storage import load_recent_track
 from recent_track_llm import analyze_from_json_file
 from datetime import datetime
 import json
@@ -51,9 +51,15 @@ def render():
             if not selected_user_ids or not start_date:
                 st.warning("请先选择用户和日期！")
             else:
+                results = {"recent": {}}
+                progress = st.empty()
                 with st.spinner("正在爬取中，请耐心等待（爬虫速度取决于用户数量和网络环境）..."):
-                    results = crawl_user_articles(selected_user_ids, str(start_date))
-                if results and "recent" in results:
+                    # 每完成一个用户即已写入存档，这里逐个显示进度
+                    for uid, recent in iter_user_articles(selected_user_ids, str(start_date)):
+                        results["recent"][uid] = recent
+                        progress.info(f"已完成 {len(results['recent'])}/{len(selected_user_ids)} 个用户：{id_name_map.get(uid, uid)}（{len(recent)}条）")
+                progress.empty()
+                if results["recent"]:
                     # 删除旧的AI分析结果文件
                     ai_analysis_file = "history_track/recent_ai_analysis.json"
                     if os.path.exists(ai_analysis_file):
@@ -71,7 +77,6 @@ def render():
                     st.session_state.recent_results = results["recent"]
                     st.session_state.recent_user_ids = selected_user_ids.copy()
                     st.session_state.recent_date = str(start_date)
-                    save_recent_track(results["recent"])
                 else:
                     st.warning("未获取到任何内容，请检查爬虫配置或网络环境。")
                     st.session_state.recent_results = None
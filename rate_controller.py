@@ -0,0 +1,153 @@
+import time
+import random
+import logging
+import threading
+
+# ==== 配置 ====
+INITIAL_RATE = 0.5  # 初始请求速率（次/秒），约等于原先1-3秒的随机间隔
+MIN_RATE = 1 / 60  # 回退下限：每分钟一次
+MAX_RATE = 2.0  # 加速上限
+BURST = 2  # 令牌桶容量，允许的短时突发请求数
+ADDITIVE_STEP = 0.05  # 每次请求正常时速率的加性增量
+BACKOFF_FACTOR = 0.8  # 延迟明显上升时速率的乘性衰减
+WIND_CONTROL_FACTOR = 0.5  # 触发风控时速率的乘性衰减
+WIND_CONTROL_COOLDOWN = (30, 120)  # 触发风控后的冷却时间（秒）
+LATENCY_ALPHA = 0.3  # 近期延迟EWMA的平滑系数
+BASELINE_ALPHA = 0.05  # 基线延迟EWMA的平滑系数
+LATENCY_BACKOFF_RATIO = 2.0  # 近期延迟超过基线的倍数时视为服务端变慢
+JITTER = 0.3  # 等待时间的随机抖动比例，避免请求间隔过于规律
+WIND_CONTROL_MARKERS = ("访问异常", "请滑动验证")
+
+logger = logging.getLogger(__name__)
+
+def is_wind_control_page(page_source):
+    """判断页面或接口响应是否为风控页"""
+    page_source = page_source or ''
+    return any(marker in page_source for marker in WIND_CONTROL_MARKERS)
+
+class RateController:
+    """
+    自适应请求节奏控制：令牌桶限速 + 延迟EWMA + 风控命中回退
+    请求正常时按加性增量提速，延迟明显上升时按比例减速，触发风控时大幅减速并冷却
+    线程安全，同一主机的多个爬取可共享一个实例
+    """
+    def __init__(self, name, rate=INITIAL_RATE, min_rate=MIN_RATE, max_rate=MAX_RATE, burst=BURST):
+        self.name = name
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = burst
+        self._lock = threading.Lock()
+        self._tokens = float(burst)
+        self._last_refill = time.monotonic()
+        self._cooldown_until = 0.0
+        self._started_at = None
+        self.latency_ewma = None
+        self.latency_baseline = None
+        self.requests = 0
+        self.wind_control_hits = 0
+        self.request_seconds = 0.0
+        self.wait_seconds = 0.0
+        self.wait_by_reason = {}
+
+    def _mark_started(self, now):
+        if self._started_at is None:
+            self._started_at = now
+
+    def _account_wait(self, seconds, reason):
+        with self._lock:
+            self.wait_seconds += seconds
+            self.wait_by_reason[reason] = self.wait_by_reason.get(reason, 0.0) + seconds
+
+    def acquire(self):
+        """取一个令牌，令牌不足或处于风控冷却期时等待，返回等待秒数"""
+        with self._lock:
+            now = time.monotonic()
+            self._mark_started(now)
+            self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.rate)
+            self._last_refill = now
+            # 令牌可以透支，透支量即为排队等待时间，多线程下各自预约不同的时间片
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            cooldown = self._cooldown_until - now
+            reason = 'rate'
+            if cooldown > wait:
+                wait, reason = cooldown, 'cooldown'
+            self.requests += 1
+        if wait > 0:
+            wait *= random.uniform(1 - JITTER, 1 + JITTER)
+            time.sleep(wait)
+            self._account_wait(wait, reason)
+            return wait
+        return 0.0
+
+    def record_latency(self, seconds):
+        """记录一次成功请求的耗时，并据此调整速率"""
+        with self._lock:
+            self.request_seconds += seconds
+            if self.latency_ewma is None:
+                self.latency_ewma = self.latency_baseline = seconds
+                return
+            self.latency_ewma = LATENCY_ALPHA * seconds + (1 - LATENCY_ALPHA) * self.latency_ewma
+            self.latency_baseline = BASELINE_ALPHA * seconds + (1 - BASELINE_ALPHA) * self.latency_baseline
+            if self.latency_ewma > self.latency_baseline * LATENCY_BACKOFF_RATIO:
+                self.rate = max(self.min_rate, self.rate * BACKOFF_FACTOR)
+            else:
+                self.rate = min(self.max_rate, self.rate + ADDITIVE_STEP)
+
+    def record_wind_control(self):
+        """记录一次风控命中：速率减半并进入冷却期，后续acquire会等待冷却结束"""
+        cooldown = random.randint(*WIND_CONTROL_COOLDOWN)
+        with self._lock:
+            self.wind_control_hits += 1
+            self.rate = max(self.min_rate, self.rate * WIND_CONTROL_FACTOR)
+            self._cooldown_until = max(self._cooldown_until, time.monotonic() + cooldown)
+            self._tokens = min(self._tokens, 0.0)
+            rate = self.rate
+        logger.warning(f"{self.name} 触发风控（累计{self.wind_control_hits}次），速率降至{rate:.3f}次/秒，冷却{cooldown}秒")
+
+    def sleep(self, seconds, reason='settle'):
+        """计入统计的固定等待，用于页面渲染、展开等必须的等待"""
+        if seconds <= 0:
+            return
+        with self._lock:
+            self._mark_started(time.monotonic())
+        time.sleep(seconds)
+        self._account_wait(seconds, reason)
+
+    def request_count(self):
+        with self._lock:
+            return self.requests
+
+    def stats(self):
+        """返回节奏统计：请求数、当前速率、延迟、风控次数，以及等待与工作耗时"""
+        with self._lock:
+            elapsed = time.monotonic() - self._started_at if self._started_at is not None else 0.0
+            return {
+                'name': self.name,
+                'requests': self.requests,
+                'rate': self.rate,
+                'latency_ewma': self.latency_ewma,
+                'wind_control_hits': self.wind_control_hits,
+                'elapsed_seconds': elapsed,
+                'wait_seconds': self.wait_seconds,
+                'request_seconds': self.request_seconds,
+                'wait_by_reason': dict(self.wait_by_reason),
+            }
+
+    def log_stats(self):
+        s = self.stats()
+        logger.info(
+            f"{s['name']} 节奏统计：请求{s['requests']}次，当前速率{s['rate']:.3f}次/秒，风控{s['wind_control_hits']}次，"
+            f"等待{s['wait_seconds']:.1f}秒，请求耗时{s['request_seconds']:.1f}秒，总耗时{s['elapsed_seconds']:.1f}秒"
+        )
+
+_controllers = {}
+_controllers_guard = threading.Lock()
+
+def get_controller(name, **kwargs):
+    """按主机名取得进程内共享的节奏控制器，首次调用时创建"""
+    with _controllers_guard:
+        if name not in _controllers:
+            _controllers[name] = RateController(name, **kwargs)
+        return _controllers[name]
@@ -0,0 +1,239 @@
+import os
+import sys
+import json
+import logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import comment_spider
+import comment_store
+import page_parser
+import snapshot_store
+import track_store
+import track_spider
+import track_backfill
+
+# ==== 配置 ====
+# 离线重建：只读取快照库，不发起任何网络请求；每只股票/每个用户为一个任务，分配到多个进程并行
+REPARSE_WORKERS = os.cpu_count() or 1
+COMMENT_KINDS = (snapshot_store.COMMENT_API, snapshot_store.COMMENT_PAGE)
+TRACK_KINDS = (snapshot_store.TRACK_TIMELINE, snapshot_store.TRACK_API)
+
+logger = logging.getLogger(__name__)
+
+class SnapshotArticleSource:
+    """以快照代替长文抓取器（与ArticleFetcher的submit/result接口一致），没有快照的长文抛出异常"""
+    def __init__(self, snapshots):
+        self.snapshots = snapshots
+        self.missing = 0
+
+    def submit(self, url):
+        return url
+
+    def result(self, future, url, driver=None):
+        snapshot = self.snapshots.latest(snapshot_store.TRACK_ARTICLE, url)
+        if snapshot is None:
+            self.missing += 1
+            raise LookupError(f"没有长文快照: {url}")
+        return page_parser.parse_article_html(self.snapshots.read(snapshot))
+
+def stock_code_from_key(key):
+    """快照key为雪球格式的代码（SH600519），存档文件名为原始代码（600519）"""
+    if len(key) == 8 and key[:2] in ('SH', 'SZ') and key[2:].isdigit():
+        return key[2:]
+    return key
+
+def comment_snapshot_records(snapshots, snapshot):
+    """按当前的提取逻辑重新提取一个讨论区快照，返回 [(用户名, 时间, 正文), ...]"""
+    data = snapshots.read(snapshot)
+    if snapshot['kind'] == snapshot_store.COMMENT_API:
+        records, _ = comment_spider.comments_page_records(json.loads(data), now=snapshot['fetched_at'])
+        return records
+    return comment_spider.blocks_to_records(page_parser.parse_comment_page_html(data), now=snapshot['fetched_at'])
+
+def reparse_stock(key, snapshot_dir=snapshot_store.SNAPSHOT_DIR):
+    """
+    由快照重建单只股票的 history_comments/{code}.json 与TXT存档
+    快照中记录了抓取时提取出的评论哈希：存档中这些评论替换为重新提取的结果（位置不变），
+    快照已被删除或早于快照的评论原样保留
+    """
+    stock_code = stock_code_from_key(key)
+    snapshots = snapshot_store.open_snapshot_store(snapshot_dir)
+    try:
+        snaps = snapshots.list(COMMENT_KINDS, key)
+        pages = []
+        covered = {}
+        for index, snapshot in enumerate(snaps):
+            try:
+                records = comment_snapshot_records(snapshots, snapshot)
+            except Exception as e:
+                logger.warning(f"股票{stock_code}快照{snapshot['id']}重新提取失败: {e}")
+                records = []
+            pages.append([
+                {'username': nickname, 'timestamp': date, 'content': content.strip()}
+                for nickname, date, content in records if content.strip()
+            ])
+            for h in snapshot['hashes']:
+                covered.setdefault(h, index)
+    finally:
+        snapshots.close()
+
+    rebuilt = []
+    seen = set()
+    emitted = set()
+
+    def add(comment):
+        h = comment_spider.comment_hash(comment['username'], comment['timestamp'], comment['content'])
+        if h not in seen:
+            seen.add(h)
+            rebuilt.append(comment)
+
+    archived = comment_store.load_comments(stock_code, base_dir=comment_spider.OUTPUT_DIR)
+    replaced = 0
+    for comment in archived:
+        index = covered.get(comment_spider.comment_hash(comment['username'], comment['timestamp'], comment['content']))
+        if index is None:
+            add(comment)
+            continue
+        replaced += 1
+        if index not in emitted:
+            emitted.add(index)
+            for page_comment in pages[index]:
+                add(page_comment)
+    # 抓取时没有产生新评论的页排在最后，已存在的评论由哈希去重
+    for index, page_comments in enumerate(pages):
+        if index not in emitted:
+            for page_comment in page_comments:
+                add(page_comment)
+
+    comment_store.replace_comments(stock_code, rebuilt, base_dir=comment_spider.OUTPUT_DIR)
+    txt_path = os.path.join(comment_spider.TXT_OUTPUT_DIR, f"{stock_code}.txt")
+    os.makedirs(comment_spider.TXT_OUTPUT_DIR, exist_ok=True)
+    with open(f"{txt_path}.tmp", 'w', encoding='utf-8') as f:
+        for comment in rebuilt:
+            f.writelines(comment_spider.comment_block_lines(comment['username'], comment['timestamp'],
+                                                            comment['content']))
+    os.replace(f"{txt_path}.tmp", txt_path)
+    hash_index = comment_store.open_hash_index(stock_code, base_dir=comment_spider.OUTPUT_DIR)
+    try:
+        hash_index.add_many(seen)
+        hash_index.mark_bootstrapped()
+    finally:
+        hash_index.close()
+    comment_spider.save_watermark(stock_code, rebuilt, comment_spider.load_watermark(stock_code))
+    return {'target': f"股票{stock_code}", 'snapshots': len(snaps), 'before': len(archived),
+            'after': len(rebuilt), 'replaced': replaced}
+
+def timeline_snapshot_lines(data, article_source, now):
+    """按当前的提取逻辑把一个时间线快照转换为存档行，与爬取时的转换一致（展开的全文取自快照）"""
+    items = page_parser.parse_timeline_html(data['html'])
+    expanded = data.get('expanded') or {}
+    lines = []
+    for item in items:
+        if item['is_longtext']:
+            if not item['longtext_url']:
+                continue
+            try:
+                article = article_source.result(None, item['longtext_url'])
+            except Exception as e:
+                logger.debug(f"长文跳过（{e}）")
+                continue
+            article_lines, _, _ = track_spider.article_to_lines(dict(article, status_id=item['status_id']), now)
+            lines.extend(article_lines)
+            continue
+        if item['time_text'] is None:
+            continue
+        norm_time = track_spider.normalize_datetime(track_spider.remove_modified_text(item['time_text']), now)
+        lines.extend(track_spider.short_item_lines(item, norm_time, expanded.get(str(item['index']))))
+    return track_spider.preprocess_lines(lines)
+
+def reparse_user(user_id, user_name, snapshot_dir=snapshot_store.SNAPSHOT_DIR):
+    """
+    由快照重建单个用户的文章库并重新导出 history_track/{user_name}_all.json 与TXT存档
+    重新提取的文章按帖子ID写入：内容有变化的记为新修订，快照中没有的文章原样保留
+    """
+    snapshots = snapshot_store.open_snapshot_store(snapshot_dir)
+    article_source = SnapshotArticleSource(snapshots)
+    store, _ = track_spider.open_user_article_store(user_id, user_name)
+    inserted = revised = 0
+    try:
+        snaps = snapshots.list(TRACK_KINDS, user_id)
+        for snapshot in snaps:
+            try:
+                data = snapshots.read(snapshot)
+                if snapshot['kind'] == snapshot_store.TRACK_API:
+                    statuses = json.loads(data).get('statuses') or []
+                    lines, _ = track_backfill.page_to_lines(statuses, article_source, fallback=False)
+                    counts = store.upsert([track_spider.block_record(b) for b in track_spider.split_blocks(lines)],
+                                          batch=-(snapshot['page'] or 1))
+                else:
+                    lines = timeline_snapshot_lines(json.loads(data), article_source, snapshot['fetched_at'])
+                    blocks = track_spider.split_blocks(lines)
+                    # 与爬取时一致：只有首页的第一个块可能是置顶帖
+                    pinned, body_blocks = track_spider._split_pinned(blocks) if snapshot['page'] == 1 else (None, blocks)
+                    counts = store.upsert([track_spider.block_record(b) for b in body_blocks],
+                                          pinned=track_spider.block_record(pinned) if pinned else None)
+            except Exception as e:
+                logger.warning(f"用户{user_name}快照{snapshot['id']}重新提取失败: {e}")
+                continue
+            inserted += counts[0]
+            revised += counts[1]
+        total = len(store)
+    finally:
+        store.close()
+        snapshots.close()
+    track_store.export_user_history(user_name, force=True)
+    return {'target': f"用户{user_name}", 'snapshots': len(snaps), 'after': total, 'inserted': inserted,
+            'revised': revised, 'missing_articles': article_source.missing}
+
+def _init_worker():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+def reparse_all(stock_keys=None, user_ids=None, workers=REPARSE_WORKERS, snapshot_dir=snapshot_store.SNAPSHOT_DIR):
+    """
+    并行重建存档，stock_keys/user_ids为None时重建快照库中出现的全部股票/用户，传入空列表则跳过该类
+    重建期间不要同时运行爬虫；返回各任务的结果摘要列表
+    """
+    snapshots = snapshot_store.open_snapshot_store(snapshot_dir)
+    try:
+        if stock_keys is None:
+            stock_keys = snapshots.keys(COMMENT_KINDS)
+        if user_ids is None:
+            user_ids = snapshots.keys(TRACK_KINDS)
+    finally:
+        snapshots.close()
+    id_name_map = track_spider.load_id_name_map(track_spider.ID_NAME_FILE) if user_ids else {}
+    results = []
+    with ProcessPoolExecutor(max_workers=max(1, workers), initializer=_init_worker) as executor:
+        futures = {executor.submit(reparse_stock, key, snapshot_dir): key for key in stock_keys}
+        for user_id in user_ids:
+            if user_id not in id_name_map:
+                logger.warning(f"用户{user_id}不在{track_spider.ID_NAME_FILE}中，跳过")
+                continue
+            futures[executor.submit(reparse_user, user_id, id_name_map[user_id], snapshot_dir)] = user_id
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.error(f"{futures[future]}重建失败: {e}")
+                continue
+            logger.info(f"{result['target']}重建完成: {result}")
+            results.append(result)
+    return results
+
+# 离线重建：python reparse.py [comments [股票代码 ...] | track [用户ID ...] | stats]，不带参数时重建全部
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    command = sys.argv[1] if len(sys.argv) > 1 else 'all'
+    targets = sys.argv[2:] or None
+    if command == 'stats':
+        store = snapshot_store.open_snapshot_store()
+        for row in store.stats():
+            print(f"{row['kind']:<16}{row['count']:>8}个  压缩后{row['size'] / 1048576:>9.1f}MB  "
+                  f"原始{row['raw_size'] / 1048576:>9.1f}MB")
+        store.close()
+    elif command == 'comments':
+        codes = [comment_spider.format_stock_code_for_xueqiu(code) for code in targets] if targets else None
+        reparse_all(stock_keys=codes, user_ids=[])
+    elif command == 'track':
+        reparse_all(stock_keys=[], user_ids=targets)
+    else:
+        reparse_all()
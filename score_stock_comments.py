@@ -1,7 +1,6 @@
 import re
 import os
 import json
-import numpy as np
 from datetime import datetime
 import openai
 from sklearn.metrics.pairwise import cosine_similarity
@@ -11,6 +10,7 @@ from queue import Queue, Empty
 import time
 import random
 from collections import defaultdict
+import embedding_service
 
 # 配置日志
 logging.basicConfig(
@@ -37,30 +37,10 @@ class StockCommentScorer:
             logger.error("未找到环境变量QWEN_API_KEY，请在.env文件中配置API密钥。")
             logger.error("请参考.env.example文件创建.env文件并添加您的API密钥。")
 
-        self.embeddings_cache = {}
-        self.cache_file = "embeddings_cache.json"
+        # 所有AI模块共用的嵌入服务，按 (模型, 维度, 文本哈希) 缓存
+        self.embeddings = embedding_service.get_embedding_service()
         self.max_retries = 3
         self.retry_delay = 2
-        
-        # 加载缓存
-        self._load_cache()
-
-    def _load_cache(self):
-        """加载嵌入缓存"""
-        if os.path.exists(self.cache_file):
-            try:
-                with open(self.cache_file, 'r', encoding='utf-8') as f:
-                    self.embeddings_cache = json.load(f)
-            except Exception as e:
-                logger.warning(f"加载缓存失败: {e}")
-
-    def _save_cache(self):
-        """保存嵌入缓存"""
-        try:
-            with open(self.cache_file, 'w', encoding='utf-8') as f:
-                json.dump(self.embeddings_cache, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            logger.warning(f"保存缓存失败: {e}")
 
     def _preprocess_text(self, text):
         """预处理文本：去除冗余符号，标准化格式"""
@@ -73,28 +53,8 @@ class StockCommentScorer:
         return text
 
     def _get_embedding(self, text, api_key):
-        """获取文本嵌入向量"""
-        # 检查缓存
-        if text in self.embeddings_cache:
-            return np.array(self.embeddings_cache[text])
-
-        try:
-            client = openai.OpenAI(
-                api_key=api_key,
-                base_url=os.environ.get("QWEN_BASE_URL", "https://dashscope.aliyuncs.com/compatible-mode/v1")
-            )
-            response = client.embeddings.create(
-                model="text-embedding-v4",
-                input=text
-            )
-            embedding = response.data[0].embedding
-            # 存入缓存
-            self.embeddings_cache[text] = embedding
-            self._save_cache()
-            return np.array(embedding)
-        except Exception as e:
-            logger.debug(f"获取嵌入失败: {e}")
-            return np.zeros(1536)  # 返回零向量作为默认值
+        """获取文本嵌入向量，已缓存的文本不会重复请求，失败时返回零向量"""
+        return self.embeddings.embed_or_zeros(text, api_key)
 
     def load_archived_comments(self):
         """从存档文件加载评论"""
@@ -0,0 +1,223 @@
+import time
+import atexit
+import logging
+import threading
+from contextlib import contextmanager
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException, InvalidSessionIdException, WebDriverException
+import rate_controller
+
+# ==== 配置 ====
+HOME_URL = 'https://xueqiu.com'
+BROWSER_HOST = 'xueqiu.com'
+LOGIN_CHECK_SELECTOR = '.nav__user-info'
+LOGIN_CHECK_TIMEOUT = 10
+# create_driver使用固定的远程调试端口，同一进程内只能同时运行一个浏览器
+POOL_SIZE = 1
+ACQUIRE_TIMEOUT = 600
+
+logger = logging.getLogger(__name__)
+
+def cookie_key(cookie_list):
+    """Cookie内容的指纹，Cookie文件变化时需要重新登录"""
+    return tuple(sorted((c.get('name'), c.get('value')) for c in (cookie_list or [])))
+
+class BrowserSession:
+    """池中的一个浏览器会话，记录登录状态与使用情况"""
+    def __init__(self, driver):
+        self.driver = driver
+        self.logged_in = False
+        self.login_checked = False
+        self.cookie_key = None
+        self.created_at = time.monotonic()
+        self.uses = 0
+
+class BrowserSessionPool:
+    """
+    常驻的已登录浏览器会话池
+    会话创建后只做一次首页访问、写入Cookie、刷新与登录验证，之后在各次爬取间复用
+    每次借出前做轻量健康检查，会话失效、残留风控页或Cookie丢失时才重建
+    """
+    def __init__(self, driver_factory, cookie_list=None, size=POOL_SIZE, controller=None):
+        self.driver_factory = driver_factory
+        self.cookie_list = list(cookie_list or [])
+        self.size = size
+        self.controller = controller or rate_controller.get_controller(BROWSER_HOST)
+        self._cond = threading.Condition()
+        self._idle = []
+        self._total = 0
+        self._closed = False
+        self.created = 0
+        self.recycled = 0
+
+    def set_cookies(self, cookie_list):
+        """更新Cookie，空闲会话在下次借出时按新Cookie重新登录"""
+        with self._cond:
+            self.cookie_list = list(cookie_list or [])
+
+    def _login(self, session):
+        """访问首页、写入Cookie并刷新，验证一次登录状态"""
+        driver = session.driver
+        self.controller.acquire()
+        driver.get(HOME_URL)
+        session.logged_in = False
+        if self.cookie_list:
+            logger.info(f"尝试添加 {len(self.cookie_list)} 个Cookie...")
+            driver.delete_all_cookies()  # 添加前先清空，避免干扰
+            for cookie in self.cookie_list:
+                try:
+                    driver.add_cookie(cookie)
+                except Exception as e:
+                    logger.warning(f"添加Cookie {cookie.get('name')} 失败: {e}")
+            self.controller.acquire()
+            driver.refresh()
+            try:
+                WebDriverWait(driver, LOGIN_CHECK_TIMEOUT).until(
+                    EC.presence_of_element_located((By.CSS_SELECTOR, LOGIN_CHECK_SELECTOR))
+                )
+                logger.info("✅ Cookie登录已生效！")
+                session.logged_in = True
+            except TimeoutException:
+                logger.warning("⚠️ 登录验证失败，将以未登录状态继续操作。")
+        else:
+            logger.info("⚠️ 未提供Cookie，将以未登录状态进行抓取")
+        session.login_checked = True
+        session.cookie_key = cookie_key(self.cookie_list)
+
+    def _is_healthy(self, session):
+        """轻量健康检查：不加载新页面，只检查会话、窗口、风控页与Cookie"""
+        driver = session.driver
+        try:
+            handles = driver.window_handles
+            if not handles:
+                return False
+            # 关闭上次使用残留的多余窗口（如长文详情页）
+            for handle in handles[1:]:
+                driver.switch_to.window(handle)
+                driver.close()
+            driver.switch_to.window(handles[0])
+            driver.execute_script("return document.readyState")
+            if rate_controller.is_wind_control_page(driver.page_source):
+                logger.warning("浏览器会话停留在风控页，将重建会话")
+                return False
+            if session.logged_in:
+                names = {c.get('name') for c in driver.get_cookies()}
+                if not all(c['name'] in names for c in self.cookie_list):
+                    logger.warning("浏览器会话的登录Cookie已丢失，将重建会话")
+                    return False
+            return True
+        except (InvalidSessionIdException, WebDriverException) as e:
+            logger.warning(f"浏览器会话健康检查失败: {e}")
+            return False
+
+    def _quit(self, session):
+        try:
+            session.driver.quit()
+            logger.info("浏览器已关闭。")
+        except Exception as e:
+            logger.warning(f"关闭浏览器时出错: {e}")
+
+    def _prepare(self, session):
+        """借出前确保会话健康且已按当前Cookie登录，必要时重建"""
+        if session is not None and not self._is_healthy(session):
+            self._quit(session)
+            self.recycled += 1
+            session = None
+        if session is None:
+            session = BrowserSession(self.driver_factory())
+            self.created += 1
+        if not session.login_checked or session.cookie_key != cookie_key(self.cookie_list):
+            try:
+                self._login(session)
+            except Exception:
+                self._quit(session)
+                raise
+        return session
+
+    def acquire(self, timeout=ACQUIRE_TIMEOUT):
+        """借出一个已登录的会话，池满时等待其他爬取归还"""
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("浏览器会话池已关闭")
+            deadline = time.monotonic() + timeout
+            while not self._idle and self._total >= self.size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutException("等待浏览器会话超时")
+                self._cond.wait(remaining)
+            session = self._idle.pop() if self._idle else None
+            self._total += 0 if session is not None else 1
+        try:
+            session = self._prepare(session)
+        except Exception:
+            with self._cond:
+                self._total -= 1
+                self._cond.notify()
+            raise
+        session.uses += 1
+        return session
+
+    def release(self, session, broken=False):
+        """归还会话，broken为True时直接关闭，下次借出时新建"""
+        with self._cond:
+            if broken or self._closed:
+                self._total -= 1
+            else:
+                self._idle.append(session)
+            self._cond.notify()
+        if broken or self._closed:
+            self._quit(session)
+            if broken:
+                self.recycled += 1
+
+    @contextmanager
+    def session(self):
+        """with pool.session() as session: 使用session.driver，会话失效时自动丢弃"""
+        session = self.acquire()
+        broken = False
+        try:
+            yield session
+        except InvalidSessionIdException:
+            broken = True
+            raise
+        finally:
+            self.release(session, broken=broken)
+
+    def close(self):
+        """关闭全部空闲会话，借出中的会话在归还时关闭"""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._total -= len(idle)
+            self._cond.notify_all()
+        for session in idle:
+            self._quit(session)
+
+_shared_pool = None
+_shared_guard = threading.Lock()
+_ignored_factories = set()
+
+def _factory_name(factory):
+    return f"{getattr(factory, '__module__', '?')}.{getattr(factory, '__qualname__', repr(factory))}"
+
+def get_shared_pool(driver_factory, cookie_list=None):
+    """
+    取得进程内共享的会话池，评论爬虫与跟踪爬虫共用
+    首次调用时创建并在进程退出时关闭，之后的调用会更新Cookie
+    create_driver使用固定的调试端口，同一进程只能有一个池：之后传入的driver_factory不生效，不同时记录警告
+    """
+    global _shared_pool
+    with _shared_guard:
+        if _shared_pool is None:
+            _shared_pool = BrowserSessionPool(driver_factory, cookie_list)
+            atexit.register(_shared_pool.close)
+            return _shared_pool
+        if driver_factory is not _shared_pool.driver_factory and driver_factory not in _ignored_factories:
+            _ignored_factories.add(driver_factory)
+            logger.warning(f"共享会话池已由{_factory_name(_shared_pool.driver_factory)}创建，"
+                           f"{_factory_name(driver_factory)}的浏览器配置不会生效")
+        if cookie_list is not None:
+            _shared_pool.set_cookies(cookie_list)
+        return _shared_pool
@@ -0,0 +1,205 @@
+import os
+import gzip
+import json
+import logging
+import sqlite3
+import threading
+from datetime import datetime
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# ==== 配置 ====
+# 原始页面快照库：抓取到的页面源码/接口响应压缩保存，提取逻辑修改后可用 reparse.py 离线重建存档
+SNAPSHOTS_ENABLED = os.getenv('XUEQIU_SNAPSHOTS', '0') == '1'
+SNAPSHOT_DIR = os.getenv('XUEQIU_SNAPSHOT_DIR', 'snapshots')
+SNAPSHOT_BUDGET_MB = float(os.getenv('XUEQIU_SNAPSHOT_BUDGET_MB', '1024'))  # 超出后从最早的快照开始删除
+INDEX_FILE = 'index.db'  # 快照索引：snapshots/index.db，快照文件：snapshots/{kind}/{id}.gz|.zst
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 10
+# 快照类型
+COMMENT_API = 'comment_api'  # 股票讨论区接口响应，key为雪球格式的股票代码
+COMMENT_PAGE = 'comment_page'  # 股票讨论区展开后的页面源码，key同上
+TRACK_TIMELINE = 'track_timeline'  # 用户时间线区域HTML与展开的全文，key为用户ID
+TRACK_API = 'track_api'  # 用户时间线接口响应（全量回填），key为用户ID
+TRACK_ARTICLE = 'track_article'  # 长文页面，key为长文URL
+
+logger = logging.getLogger(__name__)
+
+def _compress(data):
+    if zstandard is not None:
+        return 'zst', zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return 'gz', gzip.compress(data, compresslevel=GZIP_LEVEL)
+
+def _decompress(codec, data):
+    if codec == 'zst':
+        if zstandard is None:
+            raise RuntimeError("读取zstd快照需要安装zstandard")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+class SnapshotStore:
+    """
+    原始快照库：每个快照一个压缩文件，索引记录类型、key、URL、抓取时间、页码与抓取时提取出的记录哈希
+    总大小超过预算时按写入顺序删除最早的快照，删除后对应内容只是不能再离线重建，存档本身不受影响
+    """
+    def __init__(self, base_dir=SNAPSHOT_DIR, budget_mb=SNAPSHOT_BUDGET_MB):
+        self.base_dir = base_dir
+        self.budget_bytes = int(budget_mb * 1024 * 1024)
+        os.makedirs(base_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(base_dir, INDEX_FILE), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS snapshots ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT NOT NULL, key TEXT NOT NULL, url TEXT, "
+            "page INTEGER, fetched_at TEXT NOT NULL, codec TEXT NOT NULL, size INTEGER NOT NULL, "
+            "raw_size INTEGER NOT NULL, hashes TEXT)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS snapshots_key ON snapshots (kind, key, id)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS snapshots_url ON snapshots (url, id)")
+        self._conn.commit()
+
+    def _file_path(self, kind, snapshot_id, codec):
+        return os.path.join(self.base_dir, kind, f"{snapshot_id:010d}.{codec}")
+
+    def save(self, kind, key, payload, url=None, page=None, hashes=None):
+        """
+        保存一个快照，payload为bytes或str；hashes为抓取时从该页提取出的记录哈希，重建时用于替换对应的存档记录
+        返回快照ID
+        """
+        if isinstance(payload, str):
+            payload = payload.encode('utf-8')
+        codec, data = _compress(payload)
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT INTO snapshots (kind, key, url, page, fetched_at, codec, size, raw_size, hashes) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (kind, str(key), url, page, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), codec, len(data),
+                 len(payload), json.dumps(list(hashes)) if hashes is not None else None)
+            )
+            snapshot_id = cur.lastrowid
+            path = self._file_path(kind, snapshot_id, codec)
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f"{path}.tmp"
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            except Exception:
+                self._conn.rollback()
+                raise
+            self._conn.commit()
+            self._enforce_budget()
+        return snapshot_id
+
+    def total_size(self):
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM snapshots").fetchone()[0]
+
+    def _enforce_budget(self):
+        """删除最早的快照直到总大小回到预算以内，调用方持有锁"""
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM snapshots").fetchone()[0]
+        if total <= self.budget_bytes:
+            return 0
+        removed = 0
+        for snapshot_id, kind, codec, size in self._conn.execute(
+                "SELECT id, kind, codec, size FROM snapshots ORDER BY id").fetchall():
+            if total <= self.budget_bytes:
+                break
+            try:
+                os.remove(self._file_path(kind, snapshot_id, codec))
+            except FileNotFoundError:
+                pass
+            self._conn.execute("DELETE FROM snapshots WHERE id = ?", (snapshot_id,))
+            total -= size
+            removed += 1
+        self._conn.commit()
+        logger.info(f"快照库超出预算，已删除最早的{removed}个快照")
+        return removed
+
+    def _row_to_dict(self, row):
+        snapshot_id, kind, key, url, page, fetched_at, codec, size, hashes = row
+        return {
+            'id': snapshot_id, 'kind': kind, 'key': key, 'url': url, 'page': page,
+            'fetched_at': datetime.strptime(fetched_at, '%Y-%m-%d %H:%M:%S'), 'codec': codec, 'size': size,
+            'hashes': json.loads(hashes) if hashes else [],
+        }
+
+    def list(self, kinds, key=None):
+        """按写入顺序列出快照（不含内容），kinds为类型或类型列表，key为None时列出该类型全部快照"""
+        kinds = [kinds] if isinstance(kinds, str) else list(kinds)
+        sql = ("SELECT id, kind, key, url, page, fetched_at, codec, size, hashes FROM snapshots "
+               f"WHERE kind IN ({','.join('?' * len(kinds))})")
+        params = list(kinds)
+        if key is not None:
+            sql += " AND key = ?"
+            params.append(str(key))
+        with self._lock:
+            rows = self._conn.execute(sql + " ORDER BY id", params).fetchall()
+        return [self._row_to_dict(row) for row in rows]
+
+    def keys(self, kinds):
+        kinds = [kinds] if isinstance(kinds, str) else list(kinds)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT DISTINCT key FROM snapshots WHERE kind IN ({','.join('?' * len(kinds))}) ORDER BY key",
+                kinds
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def latest(self, kind, url):
+        """某URL最近一次的快照，没有时返回None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, kind, key, url, page, fetched_at, codec, size, hashes FROM snapshots "
+                "WHERE url = ? AND kind = ? ORDER BY id DESC LIMIT 1", (url, kind)
+            ).fetchone()
+        return self._row_to_dict(row) if row else None
+
+    def read(self, snapshot):
+        """读取快照内容（bytes）"""
+        with open(self._file_path(snapshot['kind'], snapshot['id'], snapshot['codec']), 'rb') as f:
+            return _decompress(snapshot['codec'], f.read())
+
+    def stats(self):
+        """按类型统计快照数量、压缩后与原始大小"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT kind, COUNT(*), SUM(size), SUM(raw_size) FROM snapshots GROUP BY kind ORDER BY kind"
+            ).fetchall()
+        return [{'kind': kind, 'count': count, 'size': size, 'raw_size': raw_size}
+                for kind, count, size, raw_size in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+_shared = None
+_shared_guard = threading.Lock()
+
+def open_snapshot_store(base_dir=SNAPSHOT_DIR):
+    return SnapshotStore(base_dir)
+
+def get_snapshot_store():
+    """爬虫共用的快照库，未开启快照（XUEQIU_SNAPSHOTS=1）时返回None"""
+    global _shared
+    if not SNAPSHOTS_ENABLED:
+        return None
+    with _shared_guard:
+        if _shared is None:
+            _shared = SnapshotStore()
+        return _shared
+
+def record(kind, key, payload, url=None, page=None, hashes=None):
+    """爬虫调用的快照入口：未开启时直接返回，保存失败只记录警告，不影响爬取"""
+    store = get_snapshot_store()
+    if store is None:
+        return None
+    try:
+        return store.save(kind, key, payload, url=url, page=page, hashes=hashes)
+    except Exception as e:
+        logger.warning(f"保存页面快照失败: {e}")
+        return None
@@ -3,13 +3,23 @@ import os
 import json
 from datetime import datetime
 import streamlit as st
+import comment_store
 
 # 存档相关
 RECENT_TRACK_FILE = 'history_track/recent_user_track.json'
 
 def save_recent_track(recent_results):
-    with open(RECENT_TRACK_FILE, 'w', encoding='utf-8') as f:
+    # 先写临时文件再替换，爬取中逐个用户更新时页面不会读到半个文件
+    tmp_file = f"{RECENT_TRACK_FILE}.tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
         json.dump(recent_results, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_file, RECENT_TRACK_FILE)
+
+def update_recent_track(user_id, recent_articles):
+    """爬取中每完成一个用户，即把该用户的近期文章写入近期跟踪文件"""
+    recent_results = load_recent_track()
+    recent_results[user_id] = recent_articles
+    save_recent_track(recent_results)
 
 def load_recent_track():
     if not os.path.exists(RECENT_TRACK_FILE):
@@ -30,6 +40,10 @@ STOCK_COMMENT_ARCHIVE_FILE = os.path.join(OUTPUT_STOCK_COMMENTS, 'recent_stock_c
 HISTORY_ARCHIVE_DIR = os.path.join(OUTPUT_STOCK_COMMENTS, 'history_archive')
 HISTORY_INDEX_FILE = os.path.join(HISTORY_ARCHIVE_DIR, 'history_index.json')
 
+def load_stock_comments(stock_code):
+    """加载股票评论的合并视图（基础快照 + 未压缩的追加段）"""
+    return comment_store.load_comments(stock_code, base_dir=OUTPUT_STOCK_COMMENTS)
+
 # 修改从txt文件加载股票评论的函数
 def load_stock_comments_from_txt(stock_code):
     txt_file = os.path.join(TXT_OUTPUT_DIR, f'{stock_code}.txt')
@@ -84,15 +98,14 @@ def load_recent_stock_comment():
         return None
 
 def save_stock_comment_archive(stock_code):
-    # 读取股票代码.json文件
+    # 读取股票代码.json文件（含追加段）
     json_file = os.path.join(OUTPUT_STOCK_COMMENTS, f'{stock_code}.json')
     if not os.path.exists(json_file):
         print(f"警告：JSON文件 {json_file} 不存在，无法更新存档")
         return
     
     try:
-        with open(json_file, 'r', encoding='utf-8') as f:
-            comments = json.load(f)
+        comments = load_stock_comments(stock_code)
         
         # 筛选有效的评论（确保包含必要字段）
         valid_comments = []
@@ -0,0 +1,61 @@
+import threading
+from concurrent.futures import Future
+
+import pytest
+
+import article_fetcher
+
+class NoWaitController:
+    def acquire(self):
+        return 0.0
+
+def done(value=None, error=None):
+    future = Future()
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(value)
+    return future
+
+@pytest.fixture
+def fetcher():
+    fetcher = article_fetcher.ArticleFetcher(controller=NoWaitController(), max_workers=1)
+    yield fetcher
+    fetcher.close()
+
+def test_counts_fallback_outcomes(fetcher, monkeypatch):
+    outcomes = iter([{'title': '浏览器'}, article_fetcher.ArticleFetchError('超时')])
+
+    def fetch_with_driver(driver, url, controller):
+        outcome = next(outcomes)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    monkeypatch.setattr(article_fetcher, 'fetch_article_with_driver', fetch_with_driver)
+    error = article_fetcher.ArticleFetchError('403')
+    assert fetcher.result(done({'title': 'HTTP'}), 'u1') == {'title': 'HTTP'}
+    assert fetcher.result(done(error=error), 'u2', driver=object()) == {'title': '浏览器'}
+    with pytest.raises(article_fetcher.ArticleFetchError):
+        fetcher.result(done(error=error), 'u3', driver=object())
+    with pytest.raises(article_fetcher.ArticleFetchError):
+        fetcher.result(done(error=error), 'u4')
+    assert (fetcher.fetched, fetcher.failed) == (2, 2)
+
+def test_counts_from_many_threads(fetcher):
+    ok, bad = done({'title': 'a'}), done(error=article_fetcher.ArticleFetchError('x'))
+
+    def worker():
+        for _ in range(2000):
+            fetcher.result(ok, 'u')
+            try:
+                fetcher.result(bad, 'u')
+            except article_fetcher.ArticleFetchError:
+                pass
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert (fetcher.fetched, fetcher.failed) == (16000, 16000)
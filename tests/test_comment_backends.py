@@ -0,0 +1,63 @@
+from datetime import datetime
+
+import pytest
+
+import comment_spider
+import page_parser
+
+NOW = datetime(2025, 5, 14, 15, 40)
+
+BODY_HTML = ('<p>茅台一季报超预期&nbsp;&nbsp;继续持有</p>'
+             '<p>目标价 <b>2000</b><br>仅供参考</p>'
+             '<p><a href="https://xueqiu.com/S/SH600519">$贵州茅台(SH600519)$</a> </p>')
+
+def page_html(info_html, body_html):
+    """讨论区页面上一条展开后的评论"""
+    return (
+        '<div class="timeline__item__main">'
+        f'<div class="timeline__item__info">{info_html}</div>'
+        f'<div class="timeline__item__content"><div class="content content--detail">{body_html}</div></div>'
+        '</div>'
+    )
+
+def millis(dt):
+    return int(dt.timestamp() * 1000)
+
+@pytest.mark.parametrize('created, shown', [
+    (datetime(2025, 5, 14, 15, 39, 40), '刚刚'),
+    (datetime(2025, 5, 14, 15, 10), '30分钟前'),
+    (datetime(2025, 5, 14, 9, 5), '6小时前'),
+    (datetime(2025, 5, 13, 22, 15), '昨天 22:15'),
+    (datetime(2025, 3, 2, 8, 1), '03-02 08:01'),
+    (datetime(2024, 12, 31, 23, 59), '2024-12-31 23:59'),
+])
+def test_http_and_selenium_records_hash_identically(created, shown):
+    info_html = f'<a class="user-name">价值投资者</a><a class="date-and-source">{shown} · 来自雪球</a>'
+    blocks = page_parser.parse_comment_page_html(page_html(info_html, BODY_HTML))
+    selenium_record = comment_spider.blocks_to_records(blocks, now=NOW)[0]
+
+    status = {
+        'user': {'screen_name': '价值投资者'},
+        'created_at': millis(created),
+        'title': '一季报点评',
+        'text': BODY_HTML,
+    }
+    http_record = comment_spider.status_to_record(status, now=NOW)
+
+    assert comment_spider.display_time(millis(created), NOW) == shown
+    assert http_record == selenium_record
+    assert comment_spider.comment_hash(*http_record) == comment_spider.comment_hash(*selenium_record)
+
+def test_http_content_matches_visible_text():
+    nickname, date, content = comment_spider.status_to_record(
+        {'user': {'screen_name': 'abc'}, 'created_at': millis(datetime(2025, 5, 1, 10, 30)), 'text': BODY_HTML},
+        now=NOW)
+    assert (nickname, date) == ('abc', '2025-05-01 10:30')
+    assert content == '茅台一季报超预期 继续持有\n目标价 2000\n仅供参考\n$贵州茅台(SH600519)$'
+
+def test_comments_page_records_uses_reference_time():
+    data = {'list': [{'user': {'screen_name': 'abc'}, 'created_at': millis(datetime(2025, 5, 14, 15, 0)),
+                      'text': '<p>x</p>'}], 'maxPage': 3}
+    records, max_page = comment_spider.comments_page_records(data, now=NOW)
+    assert max_page == 3
+    assert records == [('abc', '2025-05-14 15:40', 'x')]
@@ -0,0 +1,184 @@
+import json
+import os
+
+import pytest
+
+import comment_spider
+import comment_store
+
+STOCK = '600519'
+
+def comments(start, count):
+    return [{'username': f'用户{i}', 'timestamp': f'2025-05-{1 + i % 28:02d} 10:{i % 60:02d}', 'content': f'评论{i}'}
+            for i in range(start, start + count)]
+
+@pytest.fixture
+def base_dir(tmp_path):
+    return str(tmp_path / 'history_comments')
+
+def test_append_and_compact(base_dir):
+    comment_store.append_comments(STOCK, comments(0, 3), base_dir=base_dir)
+    comment_store.append_comments(STOCK, iter(comments(3, 2)), base_dir=base_dir)
+    assert comment_store.load_comments(STOCK, base_dir=base_dir) == comments(0, 5)
+    assert comment_store.compact(STOCK, base_dir=base_dir) == 2
+    assert comment_store.load_manifest(STOCK, base_dir=base_dir)['segments'] == []
+    assert comment_store.load_comments(STOCK, base_dir=base_dir) == comments(0, 5)
+    assert os.listdir(comment_store.segment_dir(STOCK, base_dir)) == [comment_store.MANIFEST_FILE]
+
+def crash_on_save_manifest(monkeypatch, call):
+    """compact中第call次保存清单时抛出异常，模拟进程在该步之前中断"""
+    real = comment_store._save_manifest
+    calls = []
+
+    def save(stock_code, manifest, base_dir=comment_store.OUTPUT_DIR):
+        calls.append(1)
+        if len(calls) == call:
+            raise KeyboardInterrupt
+        real(stock_code, manifest, base_dir)
+
+    monkeypatch.setattr(comment_store, '_save_manifest', save)
+
+def test_compact_crash_after_base_replaced(base_dir, monkeypatch):
+    comment_store.append_comments(STOCK, comments(0, 3), base_dir=base_dir)
+    comment_store.append_comments(STOCK, comments(3, 2), base_dir=base_dir)
+    with monkeypatch.context() as patch:
+        crash_on_save_manifest(patch, 2)
+        with pytest.raises(KeyboardInterrupt):
+            comment_store.compact(STOCK, base_dir=base_dir)
+
+    # 基础快照已包含全部追加段，清单仍列出这些段并带有pending
+    manifest = comment_store.load_manifest(STOCK, base_dir=base_dir)
+    assert manifest['pending'] == {'through': 2, 'base_count': 5}
+    assert len(manifest['segments']) == 2
+    assert comment_store.load_comments(STOCK, base_dir=base_dir) == comments(0, 5)
+
+    # 中断后的追加段排在已并入的段之后
+    comment_store.append_comments(STOCK, comments(5, 1), base_dir=base_dir)
+    assert comment_store.load_comments(STOCK, base_dir=base_dir) == comments(0, 6)
+    assert comment_store.compact(STOCK, base_dir=base_dir) == 1
+    assert comment_store.load_manifest(STOCK, base_dir=base_dir)['pending'] is None
+    assert comment_store.load_comments(STOCK, base_dir=base_dir) == comments(0, 6)
+
+def test_compact_crash_before_base_replaced(base_dir, monkeypatch):
+    comment_store.append_comments(STOCK, comments(0, 3), base_dir=base_dir)
+    comment_store.compact(STOCK, base_dir=base_dir)
+    comment_store.append_comments(STOCK, comments(3, 2), base_dir=base_dir)
+    real = comment_store._atomic_write_json
+
+    def write(path, data, indent=None):
+        if path == comment_store.base_path(STOCK, base_dir):
+            raise KeyboardInterrupt
+        real(path, data, indent)
+
+    with monkeypatch.context() as patch:
+        patch.setattr(comment_store, '_atomic_write_json', write)
+        with pytest.raises(KeyboardInterrupt):
+            comment_store.compact(STOCK, base_dir=base_dir)
+
+    # pending已记录但基础快照仍是旧的（条数不符），追加段继续有效
+    assert comment_store.load_manifest(STOCK, base_dir=base_dir)['pending'] == {'through': 2, 'base_count': 5}
+    assert comment_store.load_comments(STOCK, base_dir=base_dir) == comments(0, 5)
+    comment_store.compact(STOCK, base_dir=base_dir)
+    assert comment_store.load_comments(STOCK, base_dir=base_dir) == comments(0, 5)
+
+def test_journal_repairs_torn_line(base_dir):
+    journal = comment_store.CrawlJournal(STOCK, base_dir=base_dir)
+    journal.append_page(1, {'timestamp': '2025-05-01 10:00', 'hash': 'a'}, comments(0, 2))
+    journal.append_page(2, {'timestamp': '2025-05-02 10:00', 'hash': 'b'}, comments(2, 2))
+    with open(journal.path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps({'page': 3, 'cursor': None, 'records': comments(4, 2)}, ensure_ascii=False)[:40])
+
+    journal = comment_store.CrawlJournal(STOCK, base_dir=base_dir)
+    assert [entry['page'] for entry in journal.iter_entries()] == [1, 2]
+    assert list(journal.iter_records()) == comments(0, 4)
+    journal.append_page(3, None, comments(4, 2))
+    assert journal.last_entry()['page'] == 3
+    assert list(journal.iter_records()) == comments(0, 6)
+
+def test_journal_archived_marker(base_dir):
+    journal = comment_store.CrawlJournal(STOCK, base_dir=base_dir)
+    journal.append_page(1, None, comments(0, 2))
+    assert journal.archived() is None
+    journal.mark_archived(2, 128)
+    assert journal.archived() == {'count': 2, 'txt_offset': 128}
+    assert journal.last_entry()['page'] == 1
+    assert list(journal.iter_records()) == comments(0, 2)
+
+@pytest.fixture
+def spider_dirs(tmp_path, monkeypatch):
+    output_dir = str(tmp_path / 'history_comments')
+    txt_dir = str(tmp_path / 'history_comments_txt')
+    os.makedirs(output_dir)
+    os.makedirs(txt_dir)
+    monkeypatch.setattr(comment_spider, 'OUTPUT_DIR', output_dir)
+    monkeypatch.setattr(comment_spider, 'TXT_OUTPUT_DIR', txt_dir)
+    return output_dir, os.path.join(txt_dir, f'{STOCK}.txt')
+
+def txt_blocks(path):
+    _, blocks, _ = comment_spider.parse_history_comments(path)
+    return [''.join(block).strip() for block in blocks]
+
+def expected_blocks(records):
+    return [''.join(comment_spider.comment_block_lines(c['username'], c['timestamp'], c['content'])).strip()
+            for c in records]
+
+def commit(output_dir, journal):
+    index = comment_store.open_hash_index(STOCK, base_dir=output_dir)
+    try:
+        return comment_spider._commit_journal(STOCK, journal, index, None)
+    finally:
+        index.close()
+
+def test_commit_journal_crash_during_txt_write(spider_dirs, monkeypatch):
+    output_dir, txt_path = spider_dirs
+    with open(txt_path, 'w', encoding='utf-8') as f:
+        f.writelines(comment_spider.comment_block_lines('老用户', '2025-04-01 09:00', '旧评论'))
+    journal = comment_store.CrawlJournal(STOCK, base_dir=output_dir)
+    journal.append_page(1, None, comments(0, 3))
+    journal.append_page(2, None, comments(3, 3))
+
+    real_lines = comment_spider.comment_block_lines
+    real_mark = comment_store.CrawlJournal.mark_archived
+    calls = []
+
+    def mark(self, count, txt_offset):
+        real_mark(self, count, txt_offset)
+        calls.append('archived')
+
+    def torn(nickname, date, content):
+        # 追加段写入之后，TXT写到第三条评论时中断
+        if calls:
+            calls.append(1)
+            if len(calls) == 6:
+                raise KeyboardInterrupt
+        return real_lines(nickname, date, content)
+
+    with monkeypatch.context() as patch:
+        patch.setattr(comment_store.CrawlJournal, 'mark_archived', mark)
+        patch.setattr(comment_spider, 'comment_block_lines', torn)
+        with pytest.raises(KeyboardInterrupt):
+            commit(output_dir, journal)
+    # JSON追加段已写入，TXT只写了一部分
+    assert comment_store.load_comments(STOCK, base_dir=output_dir) == comments(0, 6)
+    assert journal.archived()['count'] == 6
+
+    assert commit(output_dir, comment_store.CrawlJournal(STOCK, base_dir=output_dir)) == 6
+    assert comment_store.load_comments(STOCK, base_dir=output_dir) == comments(0, 6)
+    assert txt_blocks(txt_path) == expected_blocks([{'username': '老用户', 'timestamp': '2025-04-01 09:00',
+                                                     'content': '旧评论'}] + comments(0, 6))
+    assert not journal.exists()
+
+def test_commit_journal_crash_before_journal_removed(spider_dirs, monkeypatch):
+    output_dir, txt_path = spider_dirs
+    journal = comment_store.CrawlJournal(STOCK, base_dir=output_dir)
+    journal.append_page(1, None, comments(0, 4))
+    with monkeypatch.context() as patch:
+        patch.setattr(comment_store.CrawlJournal, 'remove', lambda self: None)
+        commit(output_dir, journal)
+    assert journal.exists()
+
+    # 存档与索引都已写完，重新提交不再改动存档
+    commit(output_dir, journal)
+    assert comment_store.load_comments(STOCK, base_dir=output_dir) == comments(0, 4)
+    assert txt_blocks(txt_path) == expected_blocks(comments(0, 4))
+    assert not journal.exists()
@@ -0,0 +1,89 @@
+import json
+import os
+
+import pytest
+
+import comment_spider
+
+MARK = {'timestamp': '2025-05-14 10:00', 'hash': 'x'}
+
+@pytest.fixture
+def output_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(comment_spider, 'OUTPUT_DIR', str(tmp_path))
+    return tmp_path
+
+def comment(username, timestamp, content):
+    return {'username': username, 'timestamp': timestamp, 'content': content}
+
+def test_empty_watermark(output_dir):
+    """没有标记文件、标记为空或损坏时都视为没有高水位"""
+    assert comment_spider.load_watermark('600519') is None
+    path = comment_spider.watermark_path('600519')
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({}, f)
+    assert comment_spider.load_watermark('600519') is None
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('{')
+    assert comment_spider.load_watermark('600519') is None
+    # 没有可用时间的评论不会生成标记
+    assert comment_spider.save_watermark('000001', []) is None
+    assert comment_spider.save_watermark('000001', [comment('a', '昨天', '正文')]) is None
+    assert not os.path.exists(comment_spider.watermark_path('000001'))
+
+def test_save_watermark_only_moves_forward(output_dir):
+    comments = [
+        comment('a', '2025-05-14 09:00', '早盘'),
+        comment('b', '2025-05-14 11:30', '午盘'),
+        comment('c', '2025-05-13 15:00', '昨日收盘'),
+    ]
+    mark = comment_spider.save_watermark('600519', comments)
+    assert mark['timestamp'] == '2025-05-14 11:30'
+    assert mark['hash'] == comment_spider.comment_hash('b', '2025-05-14 11:30', '午盘')
+    assert comment_spider.load_watermark('600519') == mark
+    # 更早的评论不会让标记后退
+    assert comment_spider.save_watermark('600519', [comment('d', '2025-05-14 08:00', '旧')], mark) is mark
+    assert comment_spider.load_watermark('600519') == mark
+
+def test_pinned_post_does_not_move_watermark_back(output_dir):
+    """置顶帖时间很早但排在第一页最前面，标记仍取最新的评论"""
+    comments = [
+        comment('置顶', '2024-01-02 09:00', '年度策略'),
+        comment('a', '2025-05-14 11:30', '午盘'),
+    ]
+    assert comment_spider.save_watermark('600519', comments)['timestamp'] == '2025-05-14 11:30'
+
+def test_page_known_by_hash_or_watermark():
+    archived = {comment_spider.comment_hash('a', '2025-05-14 11:00', '已存档')}
+    records = [
+        ('a', '2025-05-14 11:00', '已存档'),
+        ('b', '2025-05-14 09:00', '早于标记'),
+        ('c', '2025-05-14 09:30', '   '),
+    ]
+    assert comment_spider.is_page_known(records, archived, MARK)
+    # 没有高水位时只能依靠哈希判断
+    assert not comment_spider.is_page_known(records, archived, None)
+    assert not comment_spider.is_page_known(records, archived, {})
+
+def test_page_mixing_known_and_new_is_not_known():
+    archived = {comment_spider.comment_hash('a', '2025-05-14 11:00', '已存档')}
+    records = [
+        ('a', '2025-05-14 11:00', '已存档'),
+        ('b', '2025-05-14 12:00', '新评论'),
+        ('c', '2025-05-14 09:00', '早于标记'),
+    ]
+    assert not comment_spider.is_page_known(records, archived, MARK)
+
+def test_pinned_post_alone_does_not_stop_paging():
+    """置顶帖早于高水位，但同页还有新评论时不能停止翻页"""
+    records = [
+        ('置顶', '2024-01-02 09:00', '年度策略'),
+        ('b', '2025-05-14 12:00', '新评论'),
+    ]
+    assert not comment_spider.is_page_known(records, set(), MARK)
+    # 新评论存档之后，这一页才算已知
+    archived = {comment_spider.comment_hash('b', '2025-05-14 12:00', '新评论')}
+    assert comment_spider.is_page_known(records, archived, MARK)
+
+def test_empty_page_is_not_known():
+    assert not comment_spider.is_page_known([], set(), MARK)
+    assert not comment_spider.is_page_known([('a', '2025-05-14 09:00', ' ')], set(), MARK)
@@ -0,0 +1,50 @@
+import threading
+import time
+
+import comment_spider
+
+def fake_crawler(failing=()):
+    """代替 get_xueqiu_comments_rich，记录同时在爬取的股票数"""
+    lock = threading.Lock()
+    state = {'active': 0, 'peak': 0, 'calls': []}
+
+    def crawl(code, max_pages=10, backend=None, controller=None, stats=None):
+        with lock:
+            state['active'] += 1
+            state['peak'] = max(state['peak'], state['active'])
+            state['calls'].append(code)
+        try:
+            time.sleep(0.05)
+            if code in failing:
+                raise RuntimeError('浏览器崩溃')
+            stats.update({'pages': max_pages, 'comments': 10 * max_pages, 'new_comments': 3})
+            return f'{code}.txt'
+        finally:
+            with lock:
+                state['active'] -= 1
+
+    return crawl, state
+
+def test_concurrency_is_capped(monkeypatch):
+    crawl, state = fake_crawler()
+    monkeypatch.setattr(comment_spider, 'get_xueqiu_comments_rich', crawl)
+    codes = ['600519', '000001', '00700', 'AAPL', '300750', 'TSLA']
+    summary = comment_spider.crawl_stock_comments_many(codes, 2, max_concurrency=2)
+    assert state['peak'] == 2
+    assert sorted(state['calls']) == sorted(codes)
+    assert summary['stocks'] == 6
+    assert summary['pages'] == 12
+    assert summary['comments'] == 120
+    assert all('爬取完成' in summary['results'][code] for code in codes)
+
+def test_failing_code_does_not_abort_others(monkeypatch):
+    crawl, state = fake_crawler(failing={'000001'})
+    monkeypatch.setattr(comment_spider, 'get_xueqiu_comments_rich', crawl)
+    codes = ['600519', '000001', 'AAPL', '00700']
+    summary = comment_spider.crawl_stock_comments_many(codes + ['bad-code', '600519'], 1, max_concurrency=3)
+    assert sorted(state['calls']) == sorted(codes)
+    assert '爬取失败' in summary['results']['000001']
+    assert all('爬取完成' in summary['results'][code] for code in ['600519', 'AAPL', '00700'])
+    assert '格式不正确' in summary['results']['BAD-CODE']
+    assert summary['stocks'] == 4
+    assert summary['pages'] == 3
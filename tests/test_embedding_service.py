@@ -0,0 +1,127 @@
+import threading
+from types import SimpleNamespace
+
+import httpx
+import numpy as np
+import openai
+import pytest
+
+import embedding_service
+import embedding_store
+
+DIM = 4
+
+def vector_for(text):
+    return [float(len(text)), float(sum(map(ord, text)) % 97), 0.5, -1.0]
+
+def bad_request():
+    response = httpx.Response(400, request=httpx.Request('POST', embedding_service.DEFAULT_BASE_URL))
+    return openai.BadRequestError('input contains sensitive words', response=response, body=None)
+
+class StubClient:
+    """代替 openai.OpenAI：返回乱序的向量，含“敏感”的批次返回400，failures中的密钥先失败一次"""
+    def __init__(self, key, calls, lock, failures=(), dim=DIM, drop=False):
+        self.key = key
+        self.calls = calls
+        self.lock = lock
+        self.failures = set(failures)
+        self.dim = dim
+        self.drop = drop
+        self.embeddings = SimpleNamespace(create=self.create)
+
+    def create(self, model, input, dimensions):
+        with self.lock:
+            self.calls.append((self.key, list(input)))
+        if self.key in self.failures:
+            self.failures.discard(self.key)
+            raise openai.APIConnectionError(request=httpx.Request('POST', embedding_service.DEFAULT_BASE_URL))
+        if any('敏感' in text for text in input):
+            raise bad_request()
+        data = [SimpleNamespace(index=i, embedding=vector_for(text)[:self.dim]) for i, text in enumerate(input)]
+        if self.drop:
+            data = data[:-1]
+        return SimpleNamespace(data=data[::-1])
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    stores = []
+
+    def get_store(name, legacy_json=None, dim=None):
+        stores.append(embedding_store.EmbeddingStore(name, str(tmp_path), legacy_json, dim))
+        return stores[-1]
+
+    monkeypatch.setattr(embedding_store, 'get_embedding_store', get_store)
+    monkeypatch.setattr(embedding_service.time, 'sleep', lambda seconds: None)
+    service = embedding_service.EmbeddingService(model='stub-model', dim=DIM, api_keys=['key-0001', 'key-0002'])
+    service.calls = []
+    lock = threading.Lock()
+    for key in service.api_keys:
+        service._clients[key] = StubClient(key, service.calls, lock)
+    yield service
+    for store in stores:
+        store.close()
+
+def test_estimate_tokens():
+    assert embedding_service.estimate_tokens('') == 1
+    assert embedding_service.estimate_tokens('贵州茅台') == 5
+    assert embedding_service.estimate_tokens('abcdefgh') == 3
+
+def test_batches_respect_item_limit():
+    texts = [f't{i}' for i in range(25)]
+    batches = embedding_service.make_batches(texts, max_items=10, max_tokens=10000)
+    assert [len(batch) for batch in batches] == [10, 10, 5]
+    assert sum(batches, []) == texts
+
+def test_batches_respect_token_limit():
+    texts = ['中' * 99] * 5  # 每条估算100个token
+    batches = embedding_service.make_batches(texts, max_items=10, max_tokens=250)
+    assert [len(batch) for batch in batches] == [2, 2, 1]
+    assert embedding_service.make_batches(texts, max_items=10, max_tokens=200) == [texts[:2], texts[2:4], texts[4:]]
+
+def test_oversized_text_gets_its_own_batch():
+    big = '长' * 1000
+    assert embedding_service.make_batches(['a', big, 'b'], max_items=10, max_tokens=100) == [['a'], [big], ['b']]
+    assert embedding_service.make_batches([big, 'a', 'b'], max_items=10, max_tokens=100) == [[big], ['a', 'b']]
+    assert embedding_service.make_batches([], max_items=10, max_tokens=100) == []
+
+def test_request_batch_orders_by_index(service):
+    texts = ['第一条', 'second', '第三条评论']
+    vectors = service._request_batch(texts, 'key-0001')
+    assert [v.tolist() for v in vectors] == [vector_for(text) for text in texts]
+    assert all(v.dtype == np.float32 for v in vectors)
+
+def test_request_batch_rejects_wrong_shape(service):
+    service._clients['key-0001'].drop = True
+    with pytest.raises(ValueError):
+        service._request_batch(['a', 'b'], 'key-0001')
+    service._clients['key-0002'].dim = DIM - 1
+    with pytest.raises(ValueError):
+        service._request_batch(['a', 'b'], 'key-0002')
+
+def test_bad_request_splits_batch_in_half(service):
+    texts = ['a', 'b', '敏感词', 'c']
+    result = service._embed_batch(texts, service.api_keys, 0)
+    assert sorted(result) == ['a', 'b', 'c']
+    assert [inputs for _, inputs in service.calls] == [texts, ['a', 'b'], ['敏感词', 'c'], ['敏感词'], ['c']]
+    for text in ('a', 'b', 'c'):
+        assert service.cached(text).tolist() == vector_for(text)
+    assert service.cached('敏感词') is None
+
+def test_transient_error_retries_with_next_key(service):
+    service._clients['key-0002'].failures.add('key-0002')
+    result = service._embed_batch(['x', 'y'], service.api_keys, 1)
+    assert sorted(result) == ['x', 'y']
+    assert [key for key, _ in service.calls] == ['key-0002', 'key-0001']
+
+def test_embed_many_batches_missing_texts(service):
+    texts = [f'评论{i}' for i in range(12)]
+    service.store.put(texts[0], np.asarray(vector_for(texts[0]), dtype=np.float32))
+    vectors = service.embed_many(texts + ['', texts[5], '敏感内容'])
+    assert [v.tolist() for v in vectors[:12]] == [vector_for(text) for text in texts]
+    assert vectors[12] is None
+    assert vectors[13].tolist() == vector_for(texts[5])
+    assert vectors[14] is None
+    # 缓存的、空的与重复的文本不再请求，其余12条按每批10条分为两批，第二批被拒绝后对半拆分
+    assert sorted(map(len, (inputs for _, inputs in service.calls))) == [1, 1, 2, 10]
+    requested = [inputs for _, inputs in service.calls if not any('敏感' in text for text in inputs)]
+    assert sorted(sum(requested, [])) == sorted(texts[1:])
@@ -0,0 +1,85 @@
+import os
+
+import numpy as np
+import pytest
+
+import embedding_store
+
+DIM = 8
+
+def vector(i):
+    return np.arange(DIM, dtype=np.float32) + i
+
+@pytest.fixture
+def open_store(tmp_path):
+    stores = []
+
+    def open_():
+        store = embedding_store.EmbeddingStore('test', base_dir=str(tmp_path))
+        stores.append(store)
+        return store
+
+    yield open_
+    for store in stores:
+        store.close()
+
+def fill(store, start, count):
+    for i in range(start, start + count):
+        store.put(f'文本{i}', vector(i))
+    store.flush()
+
+def assert_vectors(store, count):
+    assert len(store) == count
+    for i in range(count):
+        np.testing.assert_array_equal(store.get(f'文本{i}'), vector(i))
+
+def test_reopen_after_flush(open_store):
+    store = open_store()
+    fill(store, 0, 5)
+    assert store.get('不存在') is None
+    store.close()
+    assert_vectors(open_store(), 5)
+
+def test_reopen_after_torn_index_record(open_store):
+    store = open_store()
+    fill(store, 0, 3)
+    store.close()
+    # 数据已落盘，索引只写了半条记录
+    with open(store.data_path, 'ab') as f:
+        f.write(vector(3).tobytes())
+    with open(store.index_path, 'ab') as f:
+        f.write(embedding_store.INDEX_RECORD.pack(embedding_store.text_key('文本3'), 3 * DIM, DIM)[:10])
+
+    store = open_store()
+    assert_vectors(store, 3)
+    assert '文本3' not in store
+    assert os.path.getsize(store.index_path) == 3 * embedding_store.INDEX_RECORD.size
+    fill(store, 3, 2)
+    store.close()
+    assert_vectors(open_store(), 5)
+
+def test_reopen_after_torn_data_write(open_store):
+    store = open_store()
+    fill(store, 0, 3)
+    store.close()
+    # 写数据时中断：只写了半个向量，索引没有写入
+    with open(store.data_path, 'ab') as f:
+        f.write(vector(3).tobytes()[:13])
+
+    store = open_store()
+    assert_vectors(store, 3)
+    fill(store, 3, 2)
+    store.close()
+    assert os.path.getsize(store.data_path) == 5 * DIM * 4
+    assert_vectors(open_store(), 5)
+
+def test_index_record_beyond_data_is_dropped(open_store):
+    store = open_store()
+    fill(store, 0, 2)
+    store.close()
+    with open(store.index_path, 'ab') as f:
+        f.write(embedding_store.INDEX_RECORD.pack(embedding_store.text_key('文本2'), 2 * DIM, DIM))
+
+    store = open_store()
+    assert_vectors(store, 2)
+    assert '文本2' not in store
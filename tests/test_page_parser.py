@@ -0,0 +1,94 @@
+from urllib.parse import quote
+
+import pytest
+from bs4 import BeautifulSoup
+
+import page_parser
+
+# 与Selenium element.text 对照的片段：(HTML, 浏览器中的可见文本)
+VISIBLE_TEXT_CASES = [
+    ('<div><p>第一行</p><p>第二行<br>第三行</p></div>', '第一行\n第二行\n第三行'),
+    ('<div>短文摘要&nbsp; <a href="/S/SH600519">$贵州茅台(SH600519)$</a>...</div>', '短文摘要 $贵州茅台(SH600519)$...'),
+    ('<div>  前后空白\n\t换行  合并  </div>', '前后空白 换行 合并'),
+    ('<div><ul><li>一</li><li>二</li></ul><blockquote>引用</blockquote>结尾</div>', '一\n二\n引用\n结尾'),
+    ('<div><p></p><br><br><p>空行被去掉</p><!-- 注释 --><script>var x = 1;</script></div>', '空行被去掉'),
+    ('<div><span>行内</span><b>加粗</b><i> 斜体</i></div>', '行内加粗 斜体'),
+]
+
+def first_tag(html):
+    return BeautifulSoup(html, page_parser.PARSER).find(True)
+
+@pytest.fixture(scope='module')
+def timeline_items():
+    return page_parser.parse_timeline_html(page_parser.build_timeline_fixture())
+
+def test_timeline_fixture_blocks(timeline_items):
+    assert [item['index'] for item in timeline_items] == list(range(1, 21))
+    assert [item['is_top'] for item in timeline_items] == [True] + [False] * 19
+    assert [i for i, item in enumerate(timeline_items) if item['is_longtext']] == [4, 9, 14, 19]
+    assert [i for i, item in enumerate(timeline_items) if item['expandable']] == [3, 7, 11, 15]
+
+def test_timeline_fixture_times_and_ids(timeline_items):
+    assert timeline_items[0]['time_text'] == '修改于10-16 23:59 · 来自雪球'
+    assert timeline_items[5]['time_text'] == '修改于10-16 18:54 · 来自雪球'
+    assert [item['status_id'] for item in timeline_items] == [str(200000000 + i) for i in range(20)]
+    longtext = timeline_items[4]
+    assert longtext['longtext_url'] == 'https://xueqiu.com/1234567890/300000004'
+    assert longtext['description'] is None
+
+def test_timeline_fixture_text(timeline_items):
+    assert timeline_items[0]['description'] == '第0条短文 第一行\n第二行\n第三行'
+    assert timeline_items[3]['description'] == '短文摘要3 $贵州茅台(SH600519)$...'
+    assert all(item['longtext_url'] is None for item in timeline_items if not item['is_longtext'])
+
+def test_timeline_without_area_raises():
+    with pytest.raises(page_parser.PageParseError, match='没有时间线区域'):
+        page_parser.parse_timeline_html('<html><body><p>空页面</p></body></html>')
+    with pytest.raises(page_parser.PageParseError, match='风控'):
+        page_parser.parse_timeline_html('<html><body>访问异常，请滑动验证</body></html>')
+
+def test_article_fixture():
+    article = page_parser.parse_article_html(page_parser.build_article_fixture(paragraphs=3))
+    assert article['title'] == '长文标题'
+    assert article['time_text'] == '发布于2025-08-24 23:23'
+    assert article['paragraphs'] == [f'第{i}段正文，包含$贵州茅台(SH600519)$等内容。' for i in range(3)]
+
+def test_article_without_detail():
+    html = ('<html><body><article class="article__bd"><h1>标题</h1>'
+            '<a class="time">2025-08-24 23:23</a></article></body></html>')
+    assert page_parser.parse_article_html(html)['paragraphs'] is None
+    with pytest.raises(page_parser.PageParseError):
+        page_parser.parse_article_html('<html><body><div class="time">x</div></body></html>')
+
+def test_comment_page_prefers_expanded_detail():
+    html = ('<div class="timeline__item__main"><div class="timeline__item__info">作者<br>05-12 10:30 · 来自雪球</div>'
+            '<div class="timeline__item__content"><div class="content content--description">摘要...</div>'
+            '<div class="content content--detail"><p>全文</p><p>第二段</p></div></div></div>')
+    assert page_parser.parse_comment_page_html(html) == [('作者\n05-12 10:30 · 来自雪球', '全文\n第二段')]
+
+@pytest.mark.parametrize('html, visible', VISIBLE_TEXT_CASES)
+def test_element_text_matches_visible_text(html, visible):
+    assert page_parser.element_text(first_tag(html)) == visible
+    assert page_parser.fragment_text(html) == visible
+
+@pytest.fixture(scope='module')
+def browser():
+    """无头Chrome，本机没有浏览器或驱动时跳过"""
+    webdriver = pytest.importorskip('selenium.webdriver')
+    options = webdriver.ChromeOptions()
+    options.add_argument('--headless=new')
+    options.add_argument('--no-sandbox')
+    try:
+        driver = webdriver.Chrome(options=options)
+    except Exception as e:
+        pytest.skip(f'无法启动Chrome: {e}')
+    yield driver
+    driver.quit()
+
+@pytest.mark.parametrize('html', [case[0] for case in VISIBLE_TEXT_CASES]
+                         + [page_parser.build_timeline_fixture(count=6)])
+def test_element_text_matches_selenium(browser, html):
+    from selenium.webdriver.common.by import By
+    browser.get('data:text/html;charset=utf-8,' + quote(f'<html><body>{html}</body></html>'))
+    element = browser.find_element(By.CSS_SELECTOR, 'body > *')
+    assert page_parser.element_text(first_tag(html)) == element.text
@@ -0,0 +1,109 @@
+from types import SimpleNamespace
+
+import pytest
+
+import rate_controller
+
+class FakeClock:
+    """可控的时钟：sleep只推进时间并记录等待"""
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_controller, 'time', SimpleNamespace(monotonic=clock.monotonic, sleep=clock.sleep))
+    # 去掉随机抖动，冷却时间取固定值
+    monkeypatch.setattr(rate_controller, 'random', SimpleNamespace(uniform=lambda a, b: 1.0,
+                                                                   randint=lambda a, b: 60))
+    return clock
+
+def test_burst_then_overdraft_waits(clock):
+    controller = rate_controller.RateController('test', rate=0.5, burst=2)
+    assert controller.acquire() == 0.0
+    assert controller.acquire() == 0.0
+    # 令牌用完后透支一个，按速率需要等待 1 / 0.5 秒
+    assert controller.acquire() == pytest.approx(2.0)
+    # 等待期间补充的令牌已被预约，下一次继续排队
+    assert controller.acquire() == pytest.approx(2.0)
+    assert clock.sleeps == [pytest.approx(2.0), pytest.approx(2.0)]
+    stats = controller.stats()
+    assert stats['requests'] == 4
+    assert stats['wait_seconds'] == pytest.approx(4.0)
+    assert stats['wait_by_reason'] == {'rate': pytest.approx(4.0)}
+    assert stats['elapsed_seconds'] == pytest.approx(4.0)
+
+def test_tokens_refill_over_time(clock):
+    controller = rate_controller.RateController('test', rate=1.0, burst=2)
+    controller.acquire()
+    controller.acquire()
+    clock.now += 10  # 空闲期间令牌补满但不超过桶容量
+    assert controller.acquire() == 0.0
+    assert controller.acquire() == 0.0
+    assert controller.acquire() == pytest.approx(1.0)
+
+def test_additive_increase_until_max(clock):
+    controller = rate_controller.RateController('test', rate=0.5, max_rate=0.6)
+    controller.record_latency(1.0)  # 第一次只建立基线
+    assert controller.rate == 0.5
+    controller.record_latency(1.0)
+    assert controller.rate == pytest.approx(0.5 + rate_controller.ADDITIVE_STEP)
+    controller.record_latency(1.0)
+    controller.record_latency(1.0)
+    assert controller.rate == pytest.approx(0.6)
+    assert controller.stats()['request_seconds'] == pytest.approx(4.0)
+
+def test_backoff_when_latency_rises_above_baseline(clock):
+    controller = rate_controller.RateController('test', rate=1.0, min_rate=0.1)
+    controller.record_latency(1.0)
+    controller.record_latency(1.0)
+    rate = controller.rate
+    # EWMA = 0.3 * 10 + 0.7 * 1 = 3.7，基线 = 0.05 * 10 + 0.95 * 1 = 1.45，超过2倍基线
+    controller.record_latency(10.0)
+    assert controller.latency_ewma == pytest.approx(3.7)
+    assert controller.latency_baseline == pytest.approx(1.45)
+    assert controller.rate == pytest.approx(rate * rate_controller.BACKOFF_FACTOR)
+    for i in range(30):
+        controller.record_latency(60.0 * (i + 2))
+    assert controller.rate >= controller.min_rate
+
+def test_wind_control_halves_rate_and_cools_down(clock):
+    controller = rate_controller.RateController('test', rate=1.0, burst=2, min_rate=0.3)
+    controller.record_wind_control()
+    assert controller.rate == pytest.approx(0.5)
+    # 冷却60秒，期间即使桶中有令牌也要等待
+    assert controller.acquire() == pytest.approx(60.0)
+    assert controller.stats()['wait_by_reason'] == {'cooldown': pytest.approx(60.0)}
+    controller.record_wind_control()
+    assert controller.rate == pytest.approx(0.3)  # 不低于下限
+    stats = controller.stats()
+    assert stats['wind_control_hits'] == 2
+    assert stats['requests'] == 1
+
+def test_sleep_is_accounted_by_reason(clock):
+    controller = rate_controller.RateController('test')
+    controller.sleep(2.0, 'render')
+    controller.sleep(1.0, 'expand')
+    controller.sleep(0, 'expand')
+    assert clock.sleeps == [2.0, 1.0]
+    stats = controller.stats()
+    assert stats['wait_by_reason'] == {'render': 2.0, 'expand': 1.0}
+    assert stats['wait_seconds'] == 3.0
+    assert stats['elapsed_seconds'] == 3.0
+
+def test_get_controller_is_shared():
+    first = rate_controller.get_controller('test-shared-host', rate=0.2)
+    assert rate_controller.get_controller('test-shared-host', rate=1.0) is first
+    assert first.rate == 0.2
+
+def test_is_wind_control_page():
+    assert rate_controller.is_wind_control_page('<html>访问异常</html>')
+    assert not rate_controller.is_wind_control_page(None)
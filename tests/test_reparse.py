@@ -0,0 +1,105 @@
+import json
+import os
+from datetime import datetime
+
+import pytest
+
+import comment_spider
+import comment_store
+import page_parser
+import reparse
+import snapshot_store
+
+KEY = 'SH600519'
+CODE = '600519'
+
+@pytest.fixture
+def dirs(tmp_path, monkeypatch):
+    monkeypatch.setattr(comment_spider, 'OUTPUT_DIR', str(tmp_path / 'history_comments'))
+    monkeypatch.setattr(comment_spider, 'TXT_OUTPUT_DIR', str(tmp_path / 'history_comments_txt'))
+    os.makedirs(comment_spider.OUTPUT_DIR)
+    return str(tmp_path / 'snapshots')
+
+def comment_page(comments):
+    """展开后的讨论区页面：摘要与全文同时存在，旧的提取逻辑只取到了摘要"""
+    return ''.join(
+        '<div class="timeline__item__main"><div class="timeline__item__info">'
+        f'<a class="user-name">{name}</a><a class="date-and-source">{date} · 来自雪球</a></div>'
+        f'<div class="timeline__item__content"><div class="content content--description">{text[:2]}...</div>'
+        f'<div class="content content--detail"><p>{text}</p></div></div></div>'
+        for name, date, text in comments
+    )
+
+def comment_api(comments):
+    return json.dumps({'maxPage': 1, 'list': [
+        {'user': {'screen_name': name}, 'created_at': int(datetime.strptime(date, '%Y-%m-%d %H:%M').timestamp() * 1000),
+         'text': f'<p>{text}</p>'} for name, date, text in comments]})
+
+def stale(name, date, text):
+    """抓取时按旧逻辑存档的评论（只有摘要）"""
+    return {'username': name, 'timestamp': date, 'content': f'{text[:2]}...'}
+
+def stale_hashes(comments):
+    return [comment_spider.comment_hash(c['username'], c['timestamp'], c['content'])
+            for c in (stale(*comment) for comment in comments)]
+
+PAGE_A = [('甲', '2024-03-01 09:00', '最早一页的评论全文')]
+PAGE_B = [('乙', '2024-03-03 10:00', '第二页第一条全文'), ('丙', '2024-03-03 09:30', '第二页第二条全文')]
+PAGE_C = [('丁', '2024-03-04 14:00', '接口响应中的全文')]
+BEFORE_SNAPSHOTS = ('戊', '2024-02-01 08:00', '开启快照前的评论')
+
+def test_record_budget_and_reparse_round_trip(dirs):
+    store = snapshot_store.SnapshotStore(dirs)
+    try:
+        store.save(snapshot_store.COMMENT_PAGE, KEY, comment_page(PAGE_A), page=3, hashes=stale_hashes(PAGE_A))
+        store.save(snapshot_store.COMMENT_PAGE, KEY, comment_page(PAGE_B), page=2, hashes=stale_hashes(PAGE_B))
+        store.save(snapshot_store.COMMENT_API, KEY, comment_api(PAGE_C), page=1, hashes=stale_hashes(PAGE_C))
+        store.save(snapshot_store.COMMENT_PAGE, 'SZ000001', comment_page(PAGE_A), page=1)
+        oldest = store.list(snapshot_store.COMMENT_PAGE, KEY)[0]
+        # 预算恰好放不下最早的快照
+        store.budget_bytes = store.total_size() - oldest['size']
+        with store._lock:
+            assert store._enforce_budget() == 1
+        assert not os.path.exists(store._file_path(oldest['kind'], oldest['id'], oldest['codec']))
+        assert [s['page'] for s in store.list(reparse.COMMENT_KINDS, KEY)] == [2, 1]
+        assert store.keys(reparse.COMMENT_KINDS) == ['SH600519', 'SZ000001']
+    finally:
+        store.close()
+
+    archived = [stale(*c) for c in PAGE_C + PAGE_B + PAGE_A] + [
+        {'username': BEFORE_SNAPSHOTS[0], 'timestamp': BEFORE_SNAPSHOTS[1], 'content': BEFORE_SNAPSHOTS[2]}]
+    comment_store.replace_comments(CODE, archived, base_dir=comment_spider.OUTPUT_DIR)
+
+    result = reparse.reparse_stock(KEY, snapshot_dir=dirs)
+    assert result == {'target': '股票600519', 'snapshots': 2, 'before': 5, 'after': 5, 'replaced': 3}
+
+    expected = ([{'username': n, 'timestamp': d, 'content': t} for n, d, t in PAGE_C + PAGE_B]
+                + [stale(*PAGE_A[0]), archived[-1]])
+    assert comment_store.load_comments(CODE, base_dir=comment_spider.OUTPUT_DIR) == expected
+    hashes, _, _ = comment_spider.parse_history_comments(os.path.join(comment_spider.TXT_OUTPUT_DIR, f'{CODE}.txt'))
+    expected_hashes = [comment_spider.comment_hash(c['username'], c['timestamp'], c['content']) for c in expected]
+    assert set(hashes) == set(expected_hashes)
+    index = comment_store.open_hash_index(CODE, base_dir=comment_spider.OUTPUT_DIR)
+    try:
+        assert all(h in index for h in expected_hashes)
+    finally:
+        index.close()
+    assert comment_spider.load_watermark(CODE)['timestamp'] == '2024-03-04 14:00'
+
+    # 重建是幂等的：再次运行时快照中的哈希已不在存档里，结果不变
+    reparse.reparse_stock(KEY, snapshot_dir=dirs)
+    assert comment_store.load_comments(CODE, base_dir=comment_spider.OUTPUT_DIR) == expected
+
+def test_comment_snapshot_records_reads_both_kinds(dirs):
+    store = snapshot_store.SnapshotStore(dirs)
+    try:
+        store.save(snapshot_store.COMMENT_PAGE, KEY, comment_page(PAGE_B))
+        store.save(snapshot_store.COMMENT_API, KEY, comment_api(PAGE_C))
+        page_snapshot, api_snapshot = store.list(reparse.COMMENT_KINDS, KEY)
+        assert reparse.comment_snapshot_records(store, page_snapshot) == PAGE_B
+        assert reparse.comment_snapshot_records(store, api_snapshot) == PAGE_C
+        # 与页面解析器直接解析页面源码的结果一致
+        assert (comment_spider.blocks_to_records(page_parser.parse_comment_page_html(comment_page(PAGE_B)))
+                == PAGE_B)
+    finally:
+        store.close()
@@ -0,0 +1,116 @@
+import logging
+import threading
+from types import SimpleNamespace
+
+import pytest
+from selenium.common.exceptions import InvalidSessionIdException, TimeoutException
+
+import session_pool
+
+class FakeDriver:
+    """只实现会话池用到的WebDriver接口"""
+    def __init__(self):
+        self.window_handles = ['main']
+        self.switch_to = SimpleNamespace(window=lambda handle: None)
+        self.page_source = '<html></html>'
+        self.visited = []
+        self.quit_called = False
+
+    def get(self, url):
+        self.visited.append(url)
+
+    def execute_script(self, script):
+        return 'complete'
+
+    def get_cookies(self):
+        return []
+
+    def close(self):
+        pass
+
+    def quit(self):
+        self.quit_called = True
+
+class NoWaitController:
+    def acquire(self):
+        return 0.0
+
+@pytest.fixture
+def pool():
+    drivers = []
+
+    def factory():
+        drivers.append(FakeDriver())
+        return drivers[-1]
+
+    pool = session_pool.BrowserSessionPool(factory, controller=NoWaitController())
+    pool.drivers = drivers
+    yield pool
+    pool.close()
+
+def test_sessions_are_reused(pool):
+    with pool.session() as first:
+        pass
+    with pool.session() as second:
+        pass
+    assert second is first
+    assert first.uses == 2
+    assert pool.created == 1
+    # 只在创建时访问一次首页
+    assert first.driver.visited == [session_pool.HOME_URL]
+
+def test_invalid_session_marks_session_broken(pool):
+    with pytest.raises(InvalidSessionIdException):
+        with pool.session() as session:
+            raise InvalidSessionIdException('gone')
+    assert session.driver.quit_called
+    assert pool.recycled == 1
+    with pool.session() as replacement:
+        assert replacement is not session
+    assert pool.created == 2
+
+def test_other_errors_keep_session(pool):
+    with pytest.raises(ValueError):
+        with pool.session() as session:
+            raise ValueError('页面解析失败')
+    assert not session.driver.quit_called
+    with pool.session() as again:
+        assert again is session
+    assert pool.recycled == 0
+
+def test_unhealthy_idle_session_is_rebuilt(pool):
+    with pool.session() as session:
+        session.driver.page_source = '访问异常'
+    with pool.session() as replacement:
+        assert replacement is not session
+    assert session.driver.quit_called
+    assert (pool.created, pool.recycled) == (2, 1)
+
+def test_acquire_waits_for_release(pool):
+    session = pool.acquire()
+    with pytest.raises(TimeoutException):
+        pool.acquire(timeout=0.05)
+    threading.Timer(0.05, pool.release, args=(session,)).start()
+    assert pool.acquire(timeout=5) is session
+
+def test_shared_pool_warns_about_ignored_factory(monkeypatch, caplog):
+    monkeypatch.setattr(session_pool, '_shared_pool', None)
+    monkeypatch.setattr(session_pool, '_ignored_factories', set())
+    monkeypatch.setattr(session_pool.atexit, 'register', lambda func: None)
+
+    def first_factory():
+        return FakeDriver()
+
+    def second_factory():
+        return FakeDriver()
+
+    pool = session_pool.get_shared_pool(first_factory, [])
+    with caplog.at_level(logging.WARNING, logger='session_pool'):
+        assert session_pool.get_shared_pool(first_factory) is pool
+        assert not caplog.records
+        assert session_pool.get_shared_pool(second_factory, [{'name': 'a', 'value': '1'}]) is pool
+        assert session_pool.get_shared_pool(second_factory) is pool
+    assert len(caplog.records) == 1
+    assert 'second_factory' in caplog.records[0].getMessage()
+    assert pool.driver_factory is first_factory
+    assert pool.cookie_list == [{'name': 'a', 'value': '1'}]
@@ -0,0 +1,72 @@
+from datetime import datetime
+
+import pytest
+
+import track_backfill
+
+def status(status_id, when):
+    return {'id': status_id, 'created_at': int(datetime.strptime(when, '%Y-%m-%d %H:%M').timestamp() * 1000)}
+
+def timeline(count, page_size=3):
+    """倒序的时间线，帖子ID越大越新"""
+    statuses = [status(i, f"2020-01-{1 + i // 24:02d} {i % 24:02d}:00") for i in range(count, 0, -1)]
+    return [statuses[i:i + page_size] for i in range(0, len(statuses), page_size)]
+
+@pytest.fixture
+def serve(monkeypatch):
+    pages = {}
+    requested = []
+
+    def fetch(session, user_id, page, controller, page_size=track_backfill.BACKFILL_PAGE_SIZE):
+        requested.append(page)
+        return pages.get(page, []), len(pages)
+
+    def install(timeline_pages):
+        pages.clear()
+        pages.update(enumerate(timeline_pages, start=1))
+        return requested
+
+    monkeypatch.setattr(track_backfill, 'fetch_timeline_page', fetch)
+    return install
+
+def checkpoint(pages, last_page):
+    last = pages[last_page - 1][-1]
+    return {'last_page': last_page, 'cursor': {'time': track_backfill.status_time(last), 'status_id': last['id']}}
+
+def locate(record):
+    return track_backfill.locate_resume_page(None, 'u', 'user', record, None)
+
+def test_resume_unchanged_timeline_restarts_at_cursor_page(serve):
+    pages = timeline(30)
+    serve(pages)
+    assert locate(checkpoint(pages, 4)) == 4
+
+def test_resume_after_new_posts_moves_forward(serve):
+    pages = timeline(30)
+    record = checkpoint(pages, 4)
+    # 停止后新发了7条，游标帖子后移到第7页
+    serve(timeline(37))
+    assert locate(record) == 7
+
+def test_resume_after_deleted_posts_steps_back(serve):
+    pages = timeline(30)
+    record = checkpoint(pages, 4)
+    shifted = [s for page in pages for s in page if s['id'] not in range(22, 29)]
+    serve([shifted[i:i + 3] for i in range(0, len(shifted), 3)])
+    assert locate(record) == 2
+
+def test_resume_when_cursor_post_was_deleted(serve):
+    pages = timeline(30)
+    record = checkpoint(pages, 4)
+    cursor_id = record['cursor']['status_id']
+    remaining = [s for page in pages for s in page if s['id'] != cursor_id]
+    serve([remaining[i:i + 3] for i in range(0, len(remaining), 3)])
+    page = locate(record)
+    statuses = remaining[(page - 1) * 3:page * 3]
+    assert track_backfill.status_time(statuses[0]) >= record['cursor']['time']
+    assert page <= 4
+
+def test_resume_without_cursor_uses_next_page(serve):
+    requested = serve(timeline(30))
+    assert locate({'last_page': 4, 'cursor': None}) == 5
+    assert requested == []
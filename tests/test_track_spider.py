@@ -0,0 +1,165 @@
+import queue
+import threading
+from concurrent.futures import Future
+from datetime import datetime
+
+import pytest
+
+import track_spider
+import track_store
+
+START = datetime(2025, 5, 1)
+
+class FakeFetcher:
+    """按URL返回预置长文的抓取器，记录被取消的请求"""
+    def __init__(self, articles):
+        self.articles = articles
+        self.cancelled = []
+
+    def submit(self, url):
+        future = Future()
+        future.set_result(self.articles[url])
+        future.cancel = lambda: self.cancelled.append(url)
+        return future
+
+    def result(self, future, url, driver=None):
+        return future.result()
+
+def long_item(index, url, status_id):
+    return {'index': index, 'is_top': False, 'status_id': status_id, 'time_text': None, 'is_longtext': True,
+            'longtext_url': url, 'expandable': False, 'description': None}
+
+def short_item(index, time_text, status_id, text='短文'):
+    return {'index': index, 'is_top': False, 'status_id': status_id, 'time_text': time_text, 'is_longtext': False,
+            'longtext_url': None, 'expandable': False, 'description': text}
+
+def article(title, time_text):
+    return {'title': title, 'time_text': time_text, 'paragraphs': [f'{title}正文']}
+
+def test_long_articles_before_short_cutoff_are_kept():
+    fetcher = FakeFetcher({
+        'https://xueqiu.com/1/101': article('长文一', '2025-05-10 09:00'),
+        'https://xueqiu.com/1/102': article('长文二', '2025-05-08 09:00'),
+    })
+    items = [long_item(1, 'https://xueqiu.com/1/101', '101'), long_item(2, 'https://xueqiu.com/1/102', '102'),
+             short_item(3, '2025-04-20 09:00 · 来自雪球', '103')]
+    lines, cursor, stopped, _ = track_spider.timeline_page_lines(items, fetcher, None, START, None, 1)
+    assert stopped
+    assert fetcher.cancelled == []
+    text = ''.join(lines)
+    assert '长文一' in text and '长文二' in text and '短文' not in text
+    assert cursor == '2025-05-08 09:00'
+
+def test_long_article_cutoff_cancels_later_items():
+    fetcher = FakeFetcher({
+        'https://xueqiu.com/1/101': article('长文一', '2025-05-10 09:00'),
+        'https://xueqiu.com/1/102': article('旧长文', '2025-04-28 09:00'),
+        'https://xueqiu.com/1/104': article('更旧长文', '2025-04-25 09:00'),
+    })
+    items = [long_item(1, 'https://xueqiu.com/1/101', '101'), long_item(2, 'https://xueqiu.com/1/102', '102'),
+             short_item(3, '2025-05-02 09:00 · 来自雪球', '103', '新短文'),
+             long_item(4, 'https://xueqiu.com/1/104', '104')]
+    lines, cursor, stopped, _ = track_spider.timeline_page_lines(items, fetcher, None, START, None, 1)
+    assert stopped
+    assert fetcher.cancelled == ['https://xueqiu.com/1/104']
+    text = ''.join(lines)
+    assert '长文一' in text
+    assert '旧长文' not in text and '新短文' not in text
+
+def test_watermark_cutoff_keeps_newer_long_articles():
+    fetcher = FakeFetcher({'https://xueqiu.com/1/101': article('长文一', '2025-05-10 09:00')})
+    items = [short_item(1, '2025-05-12 09:00 · 来自雪球', '100', '最新短文'),
+             long_item(2, 'https://xueqiu.com/1/101', '101'),
+             short_item(3, '2025-05-06 09:00 · 来自雪球', '102', '已知短文')]
+    lines, _, stopped, _ = track_spider.timeline_page_lines(items, fetcher, None, START, '2025-05-06 09:00', 1)
+    text = ''.join(lines)
+    assert stopped
+    assert '最新短文' in text and '长文一' in text and '已知短文' not in text
+
+def test_page_without_cutoff_expands_short_posts():
+    item = dict(short_item(1, '2025-05-12 09:00 · 来自雪球', '100', '摘要'), expandable=True)
+    lines, cursor, stopped, expanded = track_spider.timeline_page_lines(
+        [item], FakeFetcher({}), None, START, None, 1, expand_item=lambda index: f'全文{index}')
+    assert not stopped
+    assert expanded == {'1': '全文1'}
+    assert '全文1' in ''.join(lines)
+    assert cursor == '2025-05-12 09:00'
+
+def test_watermark_records_oldest_covered_start_date():
+    watermarks = {}
+    block = ['# 2025-05-10 09:00\n', '内容\n']
+    assert track_spider.update_user_watermark(watermarks, 'u', [block], covered_since='2025-05-01')
+    assert watermarks['u']['timestamp'] == '2025-05-10 09:00'
+    assert watermarks['u']['covered_since'] == '2025-05-01'
+    # 较晚的起始日期不缩小覆盖范围，较早的扩大覆盖范围
+    assert not track_spider.update_user_watermark(watermarks, 'u', [], covered_since='2025-05-05')
+    assert track_spider.update_user_watermark(watermarks, 'u', [], covered_since='2025-01-01')
+    assert watermarks['u'] == dict(watermarks['u'], timestamp='2025-05-10 09:00', covered_since='2025-01-01')
+
+def test_watermark_covers():
+    watermark = {'timestamp': '2025-05-10 09:00', 'covered_since': '2025-05-01'}
+    assert track_spider.watermark_covers(watermark, '2025-05-01')
+    assert track_spider.watermark_covers(watermark, '2025-05-03')
+    assert not track_spider.watermark_covers(watermark, '2025-04-30')
+    assert not track_spider.watermark_covers({'timestamp': '2025-05-10 09:00'}, '2025-05-03')
+    assert not track_spider.watermark_covers(None, '2025-05-03')
+
+@pytest.fixture
+def worker(tmp_path, monkeypatch):
+    """在临时目录中运行单个_user_worker，记录探测与爬取时使用的高水位"""
+    calls = {'probe': 0, 'crawl': []}
+    monkeypatch.setattr(track_spider, 'HISTORY_DIR', str(tmp_path))
+    monkeypatch.setattr(track_spider, 'update_recent_track', lambda user_id, recent: None)
+    monkeypatch.setattr(track_spider, 'save_user_watermarks', lambda watermarks: None)
+    monkeypatch.setattr(track_spider, 'merge_user_articles', lambda *args: ([], 0))
+    monkeypatch.setattr(track_spider.vector_index, 'update_user_index_in_background', lambda name: None)
+
+    def probe(session, user_id, controller):
+        calls['probe'] += 1
+        return '2025-05-10 09:00'
+
+    def crawl(worker_id, pool, controller, fetcher, user_id, url, user_name, start_date, start_dt, known_before,
+              state):
+        calls['crawl'].append(known_before)
+        return ['# 2025-05-10 09:00\n', '内容\n'], False
+
+    monkeypatch.setattr(track_spider, 'probe_latest_timestamp', probe)
+    monkeypatch.setattr(track_spider, '_crawl_user_with_checkpoint', crawl)
+
+    def run(watermark, start_date):
+        checkpoints = track_store.CrawlCheckpoints(str(tmp_path / 'checkpoints.db'))
+        tasks = queue.Queue()
+        tasks.put('u1')
+        state = {
+            'checkpoints': checkpoints, 'cookie_list': [], 'use_watermark': True, 'persist_lock': threading.Lock(),
+            'lock': threading.Lock(), 'watermarks': {'u1': watermark} if watermark else {}, 'skipped': [],
+            'previous_recent': {}, 'journal_dir': str(tmp_path / 'journals'), 'recent': {}, 'history': {},
+            'worker_done': {}, 'finished': 0, 'total': 1, 'on_user_done': None,
+        }
+        try:
+            track_spider._user_worker(0, tasks, None, None, None, {'u1': 'https://xueqiu.com/u/1'}, {'u1': '用户'},
+                                      start_date, datetime.strptime(start_date, '%Y-%m-%d'), state)
+        finally:
+            checkpoints.close()
+        return state
+
+    return run, calls
+
+def test_worker_uses_watermark_inside_covered_range(worker):
+    run, calls = worker
+    state = run({'timestamp': '2025-05-10 09:00', 'covered_since': '2025-05-01'}, '2025-05-03')
+    assert calls['probe'] == 1
+    assert state['skipped'] == ['u1']
+    assert calls['crawl'] == []
+
+def test_worker_ignores_watermark_for_earlier_start_date(worker):
+    run, calls = worker
+    state = run({'timestamp': '2025-05-10 09:00', 'covered_since': '2025-05-01'}, '2025-03-01')
+    assert calls['probe'] == 0
+    assert state['skipped'] == []
+    assert calls['crawl'] == [None]
+
+def test_worker_ignores_legacy_watermark(worker):
+    run, calls = worker
+    run({'timestamp': '2025-05-10 09:00'}, '2025-05-03')
+    assert calls == {'probe': 0, 'crawl': [None]}
@@ -0,0 +1,195 @@
+import hashlib
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+import track_spider
+import track_store
+from comment_store import CrawlJournal
+
+def mutate(text, rng):
+    """随机插入、删除、替换若干片段，模拟帖子编辑"""
+    chars = list(text)
+    for _ in range(rng.randint(1, 6)):
+        op = rng.choice(('insert', 'delete', 'replace'))
+        pos = rng.randrange(len(chars) + 1)
+        piece = list(rng.choice(['新增内容', '\n补充一行\n', '$贵州茅台(SH600519)$', '！', '']))
+        if op == 'insert':
+            chars[pos:pos] = piece
+        elif op == 'delete':
+            del chars[pos:pos + rng.randint(1, 20)]
+        else:
+            chars[pos:pos + rng.randint(1, 10)] = piece
+    return ''.join(chars)
+
+def revisions(seed, count, length):
+    rng = random.Random(seed)
+    lines = [f"第{i}行：{'茅台业绩' * rng.randint(1, 5)}" for i in range(length)]
+    versions = ['\n'.join(lines)]
+    while len(versions) < count:
+        text = mutate(versions[-1], rng)
+        if text != versions[-1]:
+            versions.append(text)
+    return versions
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('char_limit', [track_store.DELTA_CHAR_LIMIT, 50])
+def test_delta_chain_rebuilds_every_revision(seed, char_limit, monkeypatch):
+    monkeypatch.setattr(track_store, 'DELTA_CHAR_LIMIT', char_limit)
+    versions = revisions(seed, 8, 40)
+    deltas = [track_store.make_delta(new, old) for old, new in zip(versions, versions[1:])]
+    assert {delta['mode'] for delta in deltas} == {'char' if char_limit > 10000 else 'line'}
+    # 从最新版本出发，依次应用反向差量还原每个旧版本
+    text = versions[-1]
+    for delta, old in zip(reversed(deltas), reversed(versions[:-1])):
+        text = track_store.apply_delta(text, delta)
+        assert text == old
+
+@pytest.mark.parametrize('old, new', [('', 'abc'), ('abc', ''), ('same', 'same'), ('a\nb\n', 'a\nb'),
+                                      ('a\nb', 'x\na\nb\ny')])
+def test_delta_edge_cases(old, new):
+    assert track_store.apply_delta(new, track_store.make_delta(new, old)) == old
+
+def article(key, text):
+    lines = text.split('\n')
+    return {'key': key, 'hash': hashlib.md5(text.encode('utf-8')).hexdigest(), 'title': lines[0],
+            'content': text, 'is_pinned': False, 'lines': lines, 'published': '2025-05-01 10:00'}
+
+def test_store_revisions_round_trip(tmp_path):
+    store = track_store.UserArticleStore(str(tmp_path / 'user_all.db'))
+    versions = revisions(7, 6, 30)
+    try:
+        for i, text in enumerate(versions):
+            assert store.upsert([article('post-1', text)]) == ((1, 0) if i == 0 else (0, 1))
+        assert store.upsert([article('post-1', versions[-1])]) == (0, 0)
+        assert store.revision_count() == len(versions) - 1
+        rebuilt = store.load_revisions('post-1')
+    finally:
+        store.close()
+    assert [version['revision'] for version in rebuilt] == list(range(len(versions) - 1, -1, -1))
+    assert ['\n'.join(version['lines']) for version in rebuilt] == versions[::-1]
+    assert [version['hash'] for version in rebuilt] == [article('k', text)['hash'] for text in versions[::-1]]
+
+class FrozenDatetime(datetime):
+    """可拨动的当前时间，检查点写入与跳过判断都读取它"""
+    current = datetime(2025, 5, 14, 9, 0)
+
+    @classmethod
+    def now(cls, tz=None):
+        return cls.current
+
+@pytest.fixture
+def checkpoints(tmp_path, monkeypatch):
+    monkeypatch.setattr(track_store, 'datetime', FrozenDatetime)
+    FrozenDatetime.current = datetime(2025, 5, 14, 9, 0)
+    checkpoints = track_store.CrawlCheckpoints(str(tmp_path / 'checkpoints.db'))
+    yield checkpoints
+    checkpoints.close()
+
+def advance(hours):
+    FrozenDatetime.current += timedelta(hours=hours)
+
+@pytest.mark.parametrize('state', ['done', 'skipped'])
+def test_should_skip_within_window(checkpoints, state):
+    checkpoints.start('u1', '2025-05-01')
+    checkpoints.finish('u1', state)
+    advance(23.5)
+    assert checkpoints.should_skip('u1', '2025-05-01', 24)
+    # 本次起始日期更晚，之前的爬取已经覆盖
+    assert checkpoints.should_skip('u1', '2025-05-10', 24)
+    # 本次起始日期更早，需要重爬
+    assert not checkpoints.should_skip('u1', '2025-04-20', 24)
+    # 窗口为0时不跳过
+    assert not checkpoints.should_skip('u1', '2025-05-01', 0)
+    advance(1)
+    assert not checkpoints.should_skip('u1', '2025-05-01', 24)
+    assert not checkpoints.should_skip('unknown', '2025-05-01', 24)
+
+def test_unfinished_states_are_not_skipped(checkpoints):
+    checkpoints.start('running', '2025-05-01')
+    checkpoints.start('failed', '2025-05-01')
+    checkpoints.fail('failed', '超时')
+    checkpoints.start('paused', '2025-05-01')
+    checkpoints.pause('paused', '达到页数上限')
+    # 先完成再重新开始时，旧的完成时间被清除
+    checkpoints.start('restarted', '2025-05-01')
+    checkpoints.finish('restarted')
+    checkpoints.start('restarted', '2025-05-01')
+    advance(1)
+    for user_id in ('running', 'failed', 'paused', 'restarted'):
+        assert not checkpoints.should_skip(user_id, '2025-05-01', 24), user_id
+
+def test_resume_keeps_progress_after_failure(checkpoints):
+    checkpoints.start('u1', '2025-05-01')
+    checkpoints.page_done('u1', 1, {'max_id': 10})
+    checkpoints.page_done('u1', 2, {'max_id': 20}, articles=3)
+    checkpoints.fail('u1', '浏览器崩溃', seconds=5.0)
+    record = checkpoints.get('u1')
+    assert (record['state'], record['errors'], record['last_error']) == ('failed', 1, '浏览器崩溃')
+    assert (record['last_page'], record['cursor'], record['pages']) == (2, {'max_id': 20}, 2)
+
+    checkpoints.start('u1', '2025-05-01', resume=True)
+    checkpoints.page_done('u1', 3, {'max_id': 30})
+    record = checkpoints.get('u1')
+    assert (record['state'], record['runs'], record['start_date']) == ('running', 2, '2025-05-01')
+    assert (record['last_page'], record['cursor'], record['pages']) == (3, {'max_id': 30}, 3)
+
+    checkpoints.finish('u1', articles=2, seconds=1.0)
+    record = checkpoints.get('u1')
+    assert (record['state'], record['errors'], record['last_error']) == ('done', 0, None)
+    assert (record['articles'], record['total_articles'], record['total_seconds']) == (5, 5, 6.0)
+
+def test_fresh_start_resets_progress(checkpoints):
+    checkpoints.start('u1', '2025-05-01')
+    checkpoints.page_done('u1', 4, {'max_id': 40}, articles=2)
+    checkpoints.fail('u1', '超时')
+    checkpoints.start('u1', '2025-04-01')
+    record = checkpoints.get('u1')
+    assert (record['state'], record['start_date'], record['runs']) == ('running', '2025-04-01', 2)
+    assert (record['last_page'], record['cursor'], record['pages'], record['articles']) == (0, None, 0, 0)
+    # 累计值与连续错误次数跨运行保留
+    assert (record['total_pages'], record['total_articles'], record['errors']) == (1, 2, 1)
+
+@pytest.mark.parametrize('state, start_date, resumed', [
+    ('running', '2025-05-01', 2),
+    ('failed', '2025-05-01', 2),
+    ('paused', '2025-05-01', 0),
+    ('done', '2025-05-01', 0),
+    ('failed', '2025-04-01', 0),
+])
+def test_crawl_resumes_only_interrupted_runs(checkpoints, tmp_path, monkeypatch, state, start_date, resumed):
+    journal_dir = str(tmp_path / 'journals')
+    journal = CrawlJournal('u1', base_dir=journal_dir)
+    checkpoints.start('u1', start_date)
+    for page in (1, 2):
+        journal.append_page(page, {'max_id': page}, [f'第{page}页'])
+        checkpoints.page_done('u1', page, {'max_id': page})
+    if state == 'failed':
+        checkpoints.fail('u1', '超时')
+    elif state == 'paused':
+        checkpoints.pause('u1', '达到页数上限')
+    elif state == 'done':
+        checkpoints.finish('u1')
+
+    calls = []
+
+    def crawl(pool, controller, fetcher, user_id, url, user_name, start_dt, known_before=None, resume_page=0,
+              on_page=None):
+        calls.append(resume_page)
+        on_page(resume_page + 1, {'max_id': 99}, ['新页'])
+        return ['新页']
+
+    monkeypatch.setattr(track_spider, '_crawl_single_user', crawl)
+    lines, failed = track_spider._crawl_user_with_checkpoint(
+        0, None, None, None, 'u1', 'url', '用户', '2025-05-01', None, None,
+        {'checkpoints': checkpoints, 'journal_dir': journal_dir})
+    assert not failed
+    assert calls == [resumed]
+    if resumed:
+        assert lines == ['第1页', '第2页', '新页']
+        assert checkpoints.get('u1')['pages'] == 3
+    else:
+        assert lines == ['新页']
+        assert checkpoints.get('u1')['pages'] == 1
+    assert checkpoints.get('u1')['last_page'] == resumed + 1
@@ -0,0 +1,98 @@
+import os
+
+import numpy as np
+import pytest
+
+import vector_index
+
+DIM = 16
+
+@pytest.fixture
+def prefix(tmp_path):
+    return str(tmp_path / '600519.test-model-16')
+
+def random_vectors(rng, count):
+    return rng.standard_normal((count, DIM)).astype(np.float32) * rng.uniform(0.1, 10, (count, 1)).astype(np.float32)
+
+def reopen(prefix):
+    return np.load(prefix + vector_index.VECTOR_SUFFIX, mmap_mode='r'), np.load(prefix + vector_index.ID_SUFFIX,
+                                                                                mmap_mode='r')
+
+def test_append_twice_and_reopen(prefix):
+    rng = np.random.default_rng(0)
+    ids = rng.integers(2, 2 ** 64 - 1, size=50, dtype=np.uint64).astype(vector_index.ID_DTYPE)
+    vectors = random_vectors(rng, 50)
+    index = vector_index.VectorIndex(prefix, DIM)
+    assert index.add(ids[:30], vectors[:30]) == 30
+    # 重复的ID（已在索引中或同批重复）只保留一行
+    assert index.add(np.concatenate([ids[25:50], ids[40:42]]), np.vstack([vectors[25:50], vectors[40:42]])) == 20
+
+    matrix, stored_ids = reopen(prefix)
+    assert isinstance(matrix, np.memmap)
+    assert matrix.shape == (50, DIM) and matrix.dtype == np.float32
+    assert stored_ids.shape == (50,) and stored_ids.dtype == vector_index.ID_DTYPE
+    np.testing.assert_array_equal(stored_ids, ids)
+    np.testing.assert_allclose(np.linalg.norm(matrix, axis=1), 1, rtol=1e-6)
+    np.testing.assert_allclose(matrix, vectors / np.linalg.norm(vectors, axis=1, keepdims=True), rtol=1e-5)
+
+    # 新实例按文件重新加载，二分查找得到的行号与存储顺序一致
+    reloaded = vector_index.VectorIndex(prefix, DIM)
+    assert len(reloaded) == 50
+    query = rng.permutation(50)
+    np.testing.assert_array_equal(reloaded.rows_of(ids[query]), query)
+    missing = np.array([1, 2 ** 64 - 1], dtype=vector_index.ID_DTYPE)
+    np.testing.assert_array_equal(reloaded.rows_of(missing), [-1, -1])
+
+def test_zero_vector_stays_zero(prefix):
+    index = vector_index.VectorIndex(prefix, DIM)
+    vectors = np.zeros((2, DIM), dtype=np.float32)
+    vectors[1, 3] = 5
+    index.add(np.array([7, 8], dtype=vector_index.ID_DTYPE), vectors)
+    matrix, _ = reopen(prefix)
+    np.testing.assert_array_equal(matrix[0], 0)
+    assert matrix[1, 3] == 1
+
+def test_torn_append_is_truncated(prefix):
+    rng = np.random.default_rng(1)
+    index = vector_index.VectorIndex(prefix, DIM)
+    index.add(np.arange(1, 11, dtype=vector_index.ID_DTYPE), random_vectors(rng, 10))
+    # 上次追加写了向量数据但没来得及改写文件头，ID文件没有写入
+    with open(prefix + vector_index.VECTOR_SUFFIX, 'ab') as f:
+        f.write(random_vectors(rng, 3).tobytes()[:100])
+
+    index = vector_index.VectorIndex(prefix, DIM)
+    assert len(index) == 10
+    vectors = random_vectors(rng, 5)
+    index.add(np.arange(11, 16, dtype=vector_index.ID_DTYPE), vectors)
+    matrix, stored_ids = reopen(prefix)
+    assert matrix.shape == (15, DIM)
+    assert os.path.getsize(prefix + vector_index.VECTOR_SUFFIX) == vector_index.NPY_HEADER_LEN + 15 * DIM * 4
+    np.testing.assert_array_equal(stored_ids, np.arange(1, 16))
+    np.testing.assert_allclose(matrix[10:], vector_index.normalize_rows(vectors), rtol=1e-6)
+
+class FakeService:
+    """按文本生成固定向量的嵌入服务，记录请求过的文本"""
+    def __init__(self):
+        self.requested = []
+
+    def embed_many(self, texts, api_keys=None):
+        self.requested.extend(texts)
+        return [np.random.default_rng(sum(text.encode('utf-8'))).standard_normal(DIM) for text in texts]
+
+def test_similarities_match_cosine(prefix):
+    service = FakeService()
+    texts = [f'评论{i}' for i in range(20)] + ['']
+    index = vector_index.VectorIndex(prefix, DIM)
+    query = np.random.default_rng(5).standard_normal(DIM)
+    scores = index.similarities(query, texts, service)
+    assert service.requested == texts[:-1]
+
+    vectors = np.vstack(service.embed_many(texts[:-1]))
+    expected = vectors @ query / np.linalg.norm(vectors, axis=1) / np.linalg.norm(query)
+    np.testing.assert_allclose(scores[:-1], expected, atol=1e-5)
+    assert scores[-1] == 0
+
+    # 索引建好后再次搜索不再请求嵌入
+    service.requested.clear()
+    np.testing.assert_allclose(vector_index.VectorIndex(prefix, DIM).similarities(query, texts, service), scores)
+    assert service.requested == []
@@ -0,0 +1,268 @@
+import os
+import sys
+import time
+import logging
+import threading
+from datetime import datetime
+from urllib.parse import urljoin, urlparse
+import requests
+import rate_controller
+import article_fetcher
+import page_parser
+import track_store
+import snapshot_store
+import vector_index
+from track_spider import (
+    COOKIE_FILE, ID_NAME_FILE, HISTORY_DIR, XUEQIU_BASE_URL, USER_TIMELINE_API_PATH,
+    get_cookie_str_from_file, parse_cookie_str, load_id_name_map, create_probe_session,
+    article_to_lines, preprocess_lines, split_blocks, block_record, open_user_article_store, post_key_line,
+)
+
+# ==== 配置 ====
+BACKFILL_PAGE_SIZE = 20
+BACKFILL_TIMEOUT = 15
+# 回填使用独立的节奏控制器，速度低于日常爬取，不占用交互爬取的请求预算
+BACKFILL_CONTROLLER_NAME = f"{urlparse(XUEQIU_BASE_URL).netloc}#backfill"
+BACKFILL_RATE = 0.2
+BACKFILL_MAX_RATE = 0.5
+# 每次运行最多回填的页数，0表示不限；十年的时间线可分多次运行完成
+BACKFILL_PAGES_PER_SESSION = int(os.getenv('TRACK_BACKFILL_PAGES_PER_SESSION', '0'))
+BACKFILL_MAX_ERRORS = 3  # 同一页连续失败次数达到该值时本次放弃该用户，下次从该页继续
+BACKFILL_ARTICLE_WORKERS = 2
+# 续爬时按检查点游标对齐页码最多尝试的页数（期间有新帖或删帖时帖子会跨页移动）
+BACKFILL_RESUME_MAX_STEPS = 5
+
+logger = logging.getLogger(__name__)
+
+class BackfillError(Exception):
+    """时间线接口请求失败或返回内容无法解析"""
+
+def get_backfill_controller():
+    return rate_controller.get_controller(BACKFILL_CONTROLLER_NAME, rate=BACKFILL_RATE, max_rate=BACKFILL_MAX_RATE)
+
+def fetch_timeline_page(session, user_id, page, controller, page_size=BACKFILL_PAGE_SIZE):
+    """通过时间线接口取一页帖子，返回 (帖子列表, 最大页数)"""
+    controller.acquire()
+    start = time.monotonic()
+    try:
+        resp = session.get(
+            XUEQIU_BASE_URL + USER_TIMELINE_API_PATH,
+            params={'user_id': user_id, 'page': page, 'count': page_size, 'type': 0},
+            timeout=BACKFILL_TIMEOUT
+        )
+    except requests.RequestException as e:
+        raise BackfillError(f"请求第{page}页失败: {e}")
+    if resp.status_code in (403, 429) or rate_controller.is_wind_control_page(resp.text):
+        controller.record_wind_control()
+        raise BackfillError(f"第{page}页触发风控（状态码 {resp.status_code}）")
+    if resp.status_code != 200:
+        raise BackfillError(f"第{page}页返回状态码 {resp.status_code}")
+    controller.record_latency(time.monotonic() - start)
+    try:
+        data = resp.json()
+    except ValueError:
+        raise BackfillError(f"第{page}页返回内容不是JSON")
+    snapshot_store.record(snapshot_store.TRACK_API, user_id, resp.content, url=resp.url, page=page)
+    return data.get('statuses') or [], data.get('maxPage')
+
+def status_time(status):
+    try:
+        return datetime.fromtimestamp(int(status.get('created_at')) / 1000).strftime("%Y-%m-%d %H:%M")
+    except (TypeError, ValueError):
+        return None
+
+def is_top_status(status):
+    return status.get('mark') == 1 or bool(status.get('is_top')) or bool(status.get('top_status'))
+
+def status_article_url(status):
+    target = status.get('target')
+    return urljoin(XUEQIU_BASE_URL + '/', target) if target else None
+
+def status_key_lines(status):
+    return [post_key_line(status['id'])] if status.get('id') else []
+
+def short_status_lines(status, norm_time):
+    """短文转换为与浏览器爬取一致的存档行（相当于展开后的全文）"""
+    text = page_parser.fragment_text(status.get('text') or status.get('description') or '')
+    return [f"# {norm_time}\n"] + status_key_lines(status) + [text + "\n\n"]
+
+def long_status_fallback_lines(status, norm_time):
+    """长文正文抓取失败时以接口中的摘要代替"""
+    summary = page_parser.fragment_text(status.get('description') or '')
+    return ([f"# {(status.get('title') or '').strip()} ", f"{norm_time}\n"] + status_key_lines(status)
+            + [(summary or "[正文未找到]") + "\n"])
+
+def page_to_lines(statuses, fetcher, fallback=True):
+    """
+    将一页帖子转换为存档行：置顶帖跳过（由日常爬取维护），长文并发抓取正文后按时间线顺序拼回
+    fallback为False时正文取不到的长文直接跳过，不以摘要代替（离线重建时避免覆盖已有的全文）
+    返回 (内容行, 本页最后一条帖子的 {'time', 'status_id'})
+    """
+    items = []
+    cursor = None
+    for status in statuses:
+        norm_time = status_time(status)
+        if is_top_status(status) or norm_time is None:
+            continue
+        cursor = {'time': norm_time, 'status_id': status.get('id')}
+        url = status_article_url(status) if (status.get('title') or '').strip() else None
+        items.append((status, norm_time, url, fetcher.submit(url) if url else None))
+    lines = []
+    for status, norm_time, url, future in items:
+        if future is None:
+            lines.extend(short_status_lines(status, norm_time))
+            continue
+        try:
+            article_lines, _, _ = article_to_lines(dict(fetcher.result(future, url), status_id=status.get('id')))
+            lines.extend(article_lines)
+        except Exception as e:
+            if not fallback:
+                logger.debug(f"长文正文不可用（{e}），跳过: {url}")
+                continue
+            logger.warning(f"长文正文抓取失败（{e}），以摘要代替: {url}")
+            lines.extend(long_status_fallback_lines(status, norm_time))
+    return preprocess_lines(lines), cursor
+
+def locate_resume_page(session, user_id, user_name, record, controller, max_steps=BACKFILL_RESUME_MAX_STEPS):
+    """
+    按检查点游标 {'time', 'status_id'} 确定续爬的页码
+    上次停止后用户发了新帖，游标帖子会后移到更靠后的页；删了帖则前移，直接从 last_page + 1 开始会漏掉中间的帖子
+    从 last_page 开始取页比对：整页都比游标新则向后找，整页都比游标旧则向前退，
+    找到包含游标帖子（或游标时间落在页内）的页后从该页重新开始，已写入的文章由文章库去重
+    """
+    page = record['last_page']
+    cursor = record.get('cursor')
+    if not cursor or not cursor.get('time'):
+        logger.warning(f"用户{user_name}的检查点没有游标，从第{page + 1}页继续回填")
+        return page + 1
+    for _ in range(max_steps):
+        try:
+            statuses, _ = fetch_timeline_page(session, user_id, page, controller)
+        except BackfillError as e:
+            logger.warning(f"用户{user_name}续爬对齐失败（{e}），从第{record['last_page'] + 1}页继续回填")
+            return record['last_page'] + 1
+        if cursor.get('status_id') is not None and any(s.get('id') == cursor['status_id'] for s in statuses):
+            return page
+        times = [t for t in (status_time(s) for s in statuses if not is_top_status(s)) if t]
+        if not times:
+            if statuses or page == 1:
+                return page
+            # 空页：停止后删帖使总页数减少，向前退一页
+            page -= 1
+            continue
+        if times[-1] > cursor['time']:
+            # 整页都比游标新：停止后有新帖，游标帖子已后移
+            page += 1
+        elif times[0] < cursor['time'] and page > 1:
+            # 整页都比游标旧：停止后有帖子被删除，向前退一页
+            page -= 1
+        else:
+            # 游标时间落在本页内（游标帖子本身已被删除）或已退到第一页
+            return page
+    logger.warning(f"用户{user_name}的检查点游标（{cursor['time']}）未能对齐到页码，从第{page}页继续回填")
+    return max(page, 1)
+
+def backfill_user(user_id, user_name, session, fetcher, controller, checkpoints, max_pages=0, stop_event=None):
+    """
+    回填单个用户的全部历史：从检查点的下一页开始一直翻到时间线开头
+    每页写入文章库后立即推进检查点，中断后不会重复请求已完成的页
+    返回本次回填的页数
+    """
+    record = checkpoints.get(user_id)
+    if record and record['state'] == 'done':
+        logger.info(f"用户{user_name}已回填到时间线开头，跳过")
+        return 0
+    resume = bool(record and record['last_page'])
+    page = locate_resume_page(session, user_id, user_name, record, controller) if resume else 1
+    checkpoints.start(user_id, None, resume=resume)
+    if resume:
+        logger.info(f"用户{user_name}从第{page}页继续回填")
+    store, _ = open_user_article_store(user_id, user_name)
+    fetched_pages = 0
+    errors = 0
+    started = time.monotonic()
+    try:
+        while True:
+            if stop_event is not None and stop_event.is_set():
+                checkpoints.pause(user_id, "回填被中止", time.monotonic() - started)
+                return fetched_pages
+            if max_pages and fetched_pages >= max_pages:
+                checkpoints.pause(user_id, "已达到本次回填页数上限", time.monotonic() - started)
+                return fetched_pages
+            try:
+                statuses, max_page = fetch_timeline_page(session, user_id, page, controller)
+            except BackfillError as e:
+                errors += 1
+                logger.warning(f"用户{user_name}第{page}页回填失败（第{errors}次）: {e}")
+                if errors >= BACKFILL_MAX_ERRORS:
+                    checkpoints.fail(user_id, e, time.monotonic() - started)
+                    return fetched_pages
+                continue
+            errors = 0
+            if not statuses:
+                break
+            lines, cursor = page_to_lines(statuses, fetcher)
+            # 负数批次：越早的页排得越靠后，且都排在日常爬取写入的文章之后
+            inserted, revised = store.upsert([block_record(b) for b in split_blocks(lines)], batch=-page)
+            checkpoints.page_done(user_id, page, cursor, articles=inserted)
+            fetched_pages += 1
+            logger.info(f"用户{user_name}回填第{page}页，新增{inserted}篇、修订{revised}篇"
+                        f"（游标 {cursor and cursor['time']}）")
+            if max_page and page >= int(max_page):
+                break
+            page += 1
+        checkpoints.finish(user_id, 'done', seconds=time.monotonic() - started)
+        logger.info(f"用户{user_name}已回填到时间线开头，共{page}页")
+        return fetched_pages
+    finally:
+        store.close()
+
+def backfill_users(user_ids, max_pages=BACKFILL_PAGES_PER_SESSION, stop_event=None):
+    """
+    依次回填多个用户，max_pages为本次运行的总页数上限（0不限）
+    与日常爬取使用不同的节奏控制器与检查点库，可在后台与之同时运行
+    """
+    cookie_list = parse_cookie_str(get_cookie_str_from_file(COOKIE_FILE))
+    id_name_map = load_id_name_map(ID_NAME_FILE)
+    controller = get_backfill_controller()
+    session = create_probe_session(cookie_list)
+    fetcher = article_fetcher.ArticleFetcher(cookie_list, max_workers=BACKFILL_ARTICLE_WORKERS, controller=controller)
+    checkpoints = track_store.open_checkpoints(HISTORY_DIR, track_store.BACKFILL_CHECKPOINT_FILE)
+    total_pages = 0
+    try:
+        for user_id in dict.fromkeys(user_ids):
+            if stop_event is not None and stop_event.is_set():
+                break
+            remaining = max_pages - total_pages if max_pages else 0
+            if max_pages and remaining <= 0:
+                logger.info("已达到本次回填页数上限，下次运行时继续")
+                break
+            user_name = id_name_map.get(user_id, 'unknown')
+            try:
+                pages = backfill_user(user_id, user_name, session, fetcher, controller, checkpoints, remaining,
+                                      stop_event)
+                total_pages += pages
+                if pages:
+                    vector_index.update_user_index_in_background(user_name)
+            except Exception as e:
+                logger.error(f"用户{user_id}回填异常: {e}")
+    finally:
+        fetcher.close()
+        controller.log_stats()
+        report = checkpoints.report(list(user_ids))
+        checkpoints.close()
+    logger.info(f"本次回填共{total_pages}页：\n" + '\n'.join(track_store.format_cost_report(report)))
+    return total_pages
+
+def start_backfill(user_ids, max_pages=BACKFILL_PAGES_PER_SESSION):
+    """在后台线程中回填，返回 (线程, 停止事件)；设置停止事件后在当前页完成时退出"""
+    stop_event = threading.Event()
+    thread = threading.Thread(target=backfill_users, args=(list(user_ids), max_pages, stop_event),
+                              name="track-backfill", daemon=True)
+    thread.start()
+    return thread, stop_event
+
+# 回填：python track_backfill.py [user_id ...]，不指定时回填id_name_match.txt中的全部用户
+if __name__ == '__main__':
+    ids = sys.argv[1:] or list(load_id_name_map(ID_NAME_FILE).keys())
+    backfill_users(ids)
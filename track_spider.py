@@ -1,21 +1,30 @@
 import os
 import re
 import time
-import random
+import queue
+import threading
 import hashlib
 import logging
+import json
+import requests
 from datetime import datetime, timedelta
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import (
-    NoSuchElementException,
     ElementClickInterceptedException,
     TimeoutException,
     InvalidSessionIdException
 )
-from selenium.webdriver.chrome.options import Options
+import rate_controller
+import session_pool
+import browser_profile
+import article_fetcher
+import track_store
+import page_parser
+import snapshot_store
+import vector_index
 
 # ==== 配置 ====
 UA = 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/138.0.0.0 Safari/537.36'
@@ -24,12 +33,30 @@ USER_URLS_FILE = 'user_urls.txt'
 ID_NAME_FILE = 'id_name_match.txt'
 OUTPUT_DIR = 'history_track_txt'
 HISTORY_DIR = 'history_track'
-PAUSE_INTERVAL = 5
-PAUSE_SECONDS = (30, 60)
-DRIVER_RESET_INTERVAL = 10
-
-# 从storage模块导入RECENT_TRACK_FILE常量
-from storage import RECENT_TRACK_FILE
+# 与comment_spider的浏览器后端共享同一个节奏控制器
+BROWSER_HOST = 'xueqiu.com'
+# 并行爬取的浏览器数量上限，所有worker仍共用同一个节奏控制器
+MAX_WORKERS = 4
+# 默认worker数量，可通过环境变量 TRACK_CRAWL_WORKERS 调整
+CRAWL_WORKERS = int(os.getenv('TRACK_CRAWL_WORKERS', '1'))
+# 每个用户已知最新文章的时间与哈希，用于跳过无更新的用户并在已知文章处停止翻页
+USER_WATERMARK_FILE = os.path.join(HISTORY_DIR, 'user_watermarks.json')
+# 探测用户是否有新内容的时间线接口，可指向本地替身服务器
+XUEQIU_BASE_URL = os.getenv('XUEQIU_BASE_URL', 'https://xueqiu.com').rstrip('/')
+USER_TIMELINE_API_PATH = '/v4/statuses/user_timeline.json'
+PROBE_COUNT = 5  # 探测时取时间线前几条，跳过置顶帖
+PROBE_TIMEOUT = 10
+# 在该时间（小时）内已完成爬取的用户再次运行时跳过，可通过环境变量 TRACK_SKIP_WINDOW_HOURS 调整，0表示不跳过
+SKIP_WINDOW_HOURS = float(os.getenv('TRACK_SKIP_WINDOW_HOURS', '6'))
+COST_REPORT_TOP = 10  # 爬取结束时日志中列出的用户数
+# 以这些前缀开头的单条结果视为失败，不写入存档并保留检查点
+FAILURE_MARKERS = ("[未找到该用户主页URL]", "[触发风控", "[FATAL]", "[ERROR]")
+# 帖子ID标记行：爬取时写在文章块的时间行之后，写入文章库时取出作为文章的稳定key，不进入存档
+POST_KEY_PREFIX = "[帖子ID:"
+
+# 从storage模块导入近期跟踪文件的读写函数
+from storage import save_recent_track, update_recent_track, load_recent_track
+from comment_store import CrawlJournal
 
 logging.basicConfig(
     level=logging.INFO,
@@ -67,9 +94,9 @@ def parse_cookie_str(cookie_str):
 def remove_modified_text(text):
     return text.replace('修改于', '').replace('发布于', '').strip()
 
-def normalize_datetime(text):
+def normalize_datetime(text, now=None):
     text = remove_modified_text(text)
-    now = datetime.now()
+    now = now or datetime.now()
     text = text.strip()
     try:
         if '刚刚' in text or '秒前' in text or '分钟前' in text or '小时前' in text:
@@ -196,6 +223,20 @@ def block_to_dict(block):
         "is_pinned": is_pinned_block(block)
     }
 
+def post_key_line(status_id):
+    return f"{POST_KEY_PREFIX}{status_id}]\n"
+
+def pop_post_key(block):
+    """取出文章块中的帖子ID标记，返回 (帖子ID或None, 去掉标记的文章块)"""
+    key = None
+    rest = []
+    for line in block:
+        if line.startswith(POST_KEY_PREFIX) and line.rstrip().endswith(']'):
+            key = line.rstrip()[len(POST_KEY_PREFIX):-1]
+        else:
+            rest.append(line)
+    return key, rest
+
 def preprocess_lines(lines):
     processed = []
     for line in lines:
@@ -207,390 +248,729 @@ def preprocess_lines(lines):
     return processed
 
 def create_driver():
-    options = Options()
-    options.add_argument(f'user-agent={UA}')
-    options.add_experimental_option('excludeSwitches', ['enable-automation'])
-    options.add_experimental_option('useAutomationExtension', False)
-    
     # 使用本地ChromeDriver，避免在线下载
     import os
     chromedriver_path = os.path.join(os.path.dirname(__file__), 'chromedriver-win64', 'chromedriver.exe')
     
     try:
-        driver = webdriver.Chrome(service=webdriver.chrome.service.Service(chromedriver_path), options=options)
-        driver.execute_cdp_cmd('Page.addScriptToEvaluateOnNewDocument', {
-            'source': '''
-                Object.defineProperty(navigator, 'webdriver', {get: () => undefined});
-            '''
-        })
+        driver = browser_profile.create_crawl_driver(
+            service=webdriver.chrome.service.Service(chromedriver_path), ua=UA
+        )
         logger.info("成功创建新的WebDriver实例")
         return driver
     except Exception as e:
         logger.error(f"创建WebDriver实例失败: {e}")
         raise
 
-def crawl_user_articles(user_ids, start_date):
-    start_dt = datetime.strptime(start_date, "%Y-%m-%d")
-    cookie_str = get_cookie_str_from_file(COOKIE_FILE)
-    cookie_list = parse_cookie_str(cookie_str)
-    id_name_map = load_id_name_map(ID_NAME_FILE)
-    user_url_map = load_user_urls(USER_URLS_FILE)
-    ensure_dir(OUTPUT_DIR)
-    ensure_dir(HISTORY_DIR)
-
-    results = {}
-    driver = None
-    user_count = 0
-    max_processed_idx = -1
+def load_user_watermarks():
+    """
+    读取全部用户的高水位标记 {user_id: {'timestamp', 'hash', 'covered_since', 'updated_at'}}
+    covered_since为已完整爬取过的最早起始日期，存档包含该日期到timestamp之间的全部文章
+    """
+    if not os.path.exists(USER_WATERMARK_FILE):
+        return {}
+    try:
+        with open(USER_WATERMARK_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        logger.warning(f"读取用户高水位标记失败: {e}")
+        return {}
+
+def save_user_watermarks(watermarks):
+    tmp_path = f"{USER_WATERMARK_FILE}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(watermarks, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, USER_WATERMARK_FILE)
+
+def block_timestamp(block):
+    """取文章块的发布时间：短文在标题行，长文在第二行"""
+    candidates = [block[0].replace('#', '')] + ([block[1]] if len(block) > 1 else [])
+    for text in candidates:
+        m = re.search(r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}', text)
+        if m:
+            return m.group(0)
+    return None
 
+def update_user_watermark(watermarks, user_id, body_blocks, covered_since=None):
+    """
+    按非置顶文章块推进用户高水位标记（只前进不后退），返回是否有变化
+    covered_since: 本次爬取完整覆盖的起始日期，与已记录的取较早者
+    """
+    newest, newest_ts = None, None
+    for block in body_blocks:
+        ts = block_timestamp(block)
+        if ts and (newest_ts is None or ts > newest_ts):
+            newest, newest_ts = block, ts
+    current = dict(watermarks.get(user_id) or {})
+    changed = False
+    if newest is not None and current.get('timestamp', '') < newest_ts:
+        current.update(timestamp=newest_ts, hash=block_to_dict(newest)['hash'])
+        changed = True
+    if covered_since and (not current.get('covered_since') or covered_since < current['covered_since']):
+        current['covered_since'] = covered_since
+        changed = True
+    if not changed or not current.get('timestamp'):
+        return False
+    current['updated_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    watermarks[user_id] = current
+    return True
+
+def watermark_covers(watermark, start_date):
+    """
+    高水位标记能否用于本次爬取：只有已完整爬取过不晚于start_date的起始日期时，
+    不晚于高水位的文章才都在存档中；起始日期更早（或标记来自旧版本、没有记录覆盖范围）时不能使用
+    """
+    return bool(watermark and watermark.get('timestamp') and watermark.get('covered_since')
+                and watermark['covered_since'] <= start_date)
+
+def is_known_time(norm_time, known_before):
+    """文章时间不晚于用户高水位时间，即已在存档中"""
+    if not known_before or not re.match(r'^\d{4}-\d{2}-\d{2} \d{2}:\d{2}$', norm_time or ''):
+        return False
+    return norm_time <= known_before
+
+def create_probe_session(cookie_list):
+    session = requests.Session()
+    session.headers.update({
+        'User-Agent': UA,
+        'Accept': 'application/json, text/plain, */*',
+        'Referer': XUEQIU_BASE_URL + '/',
+    })
+    for c in cookie_list:
+        session.cookies.set(c['name'], c['value'], domain=c['domain'], path=c['path'])
+    return session
+
+def probe_latest_timestamp(session, user_id, controller):
+    """
+    通过时间线接口只取前几条，返回最新非置顶帖的时间 "YYYY-MM-DD HH:MM"
+    请求失败或无法判断时返回None，调用方按有更新处理
+    """
+    controller.acquire()
+    start = time.monotonic()
+    try:
+        resp = session.get(
+            XUEQIU_BASE_URL + USER_TIMELINE_API_PATH,
+            params={'user_id': user_id, 'page': 1, 'count': PROBE_COUNT, 'type': 0},
+            timeout=PROBE_TIMEOUT
+        )
+    except requests.RequestException as e:
+        logger.warning(f"用户{user_id}更新探测失败: {e}")
+        return None
+    if resp.status_code in (403, 429) or rate_controller.is_wind_control_page(resp.text):
+        controller.record_wind_control()
+        return None
+    if resp.status_code != 200:
+        logger.warning(f"用户{user_id}更新探测返回状态码 {resp.status_code}")
+        return None
+    controller.record_latency(time.monotonic() - start)
     try:
-        progress_file = 'crawl_progress.txt'
-        start_index = 0
-        if os.path.exists(progress_file):
-            with open(progress_file, 'r') as f:
-                start_index = int(f.read().strip())
-                logger.info(f"从索引 {start_index} 开始爬取")
-
-        driver = create_driver()
-
-        for idx, user_id in enumerate(user_ids[start_index:]):
-            actual_idx = start_index + idx
-            with open(progress_file, 'w') as f:
-                f.write(str(actual_idx))
-            # 更新最大处理索引
-            if actual_idx > max_processed_idx:
-                max_processed_idx = actual_idx
-
-            # driver重启逻辑
-            if user_count % DRIVER_RESET_INTERVAL == 0 and user_count > 0:
-                logger.info(f"已处理{user_count}个用户，重置WebDriver实例...")
+        statuses = resp.json().get('statuses') or []
+    except ValueError:
+        return None
+    newest = None
+    for status in statuses:
+        if status.get('mark') == 1 or status.get('is_top') or status.get('top_status'):
+            continue
+        try:
+            ts = datetime.fromtimestamp(int(status.get('created_at')) / 1000).strftime("%Y-%m-%d %H:%M")
+        except (TypeError, ValueError):
+            continue
+        if newest is None or ts > newest:
+            newest = ts
+    return newest
+
+def article_to_lines(article, now=None):
+    """将长文抓取结果转换为TXT存档行，返回 (行列表, 发布日期, 规范化时间)"""
+    cleaned_time_text = remove_modified_text(article['time_text'])
+    norm_time = normalize_datetime(cleaned_time_text, now)
+    art_date = parse_date_from_text(cleaned_time_text)
+    lines = [f"# {article['title']} ", f"{norm_time}\n"]
+    if article.get('status_id'):
+        lines.append(post_key_line(article['status_id']))
+    if article['paragraphs'] is None:
+        lines.append("[正文未找到]\n")
+    else:
+        lines.extend(text + '\n\n' for text in article['paragraphs'])
+    return lines, art_date, norm_time
+
+def short_item_lines(item, norm_time, expanded_text=None):
+    """时间线短文转换为TXT存档行：有展开后的全文时用全文，否则用页面中的摘要"""
+    lines = [f"# {norm_time}\n"]
+    if item['status_id']:
+        lines.append(post_key_line(item['status_id']))
+    if expanded_text is not None:
+        lines.append(expanded_text + "\n\n")
+    elif item['description'] is not None:
+        lines.append(item['description'] + "\n")
+    else:
+        lines.append("[内容未找到]\n")
+    return lines
+
+def expand_timeline_item(content_area, index, controller):
+    """在浏览器中展开时间线第index个条目并返回全文，仅用于快照中只有摘要的短文"""
+    article = content_area.find_elements(By.XPATH, "./*")[index]
+    article.find_element(By.CLASS_NAME, "timeline__expand__control").click()
+    controller.sleep(1.0, 'expand')
+    return article.find_element(By.CLASS_NAME, "content.content--detail").text
+
+def timeline_page_lines(items, fetcher, driver, start_dt, known_before, page_num, expand_item=None, user_name=''):
+    """
+    将一页时间线条目转换为存档行：短文直接生成，长文提交fetcher并发抓取后按时间线顺序拼回
+    遇到早于起始日期或已知的文章时截止：截止位置之前的长文照常取回，之后的取消
+    expand_item(条目位置) 返回浏览器展开后的全文，只对需要展开的短文调用
+    返回 (内容行, 本页游标时间, 是否截止, {条目位置: 展开后的全文})
+    """
+    # 长文先以 (URL, Future, 是否置顶, 帖子ID) 占位
+    lines = []
+    page_cursor = None
+    expanded = {}
+    cutoff = None  # 截止条目在lines中的位置
+    for item in items:
+        try:
+            # 只检查首页第一条是否置顶，置顶帖不参与高水位停止判断
+            is_top = bool(known_before) and page_num == 1 and item['index'] == 1 and item['is_top']
+            if item['is_longtext']:
+                # 只记录长文URL并提交后台抓取，时间线继续向下处理
+                if item['longtext_url']:
+                    lines.append((item['longtext_url'], fetcher.submit(item['longtext_url']), is_top,
+                                  item['status_id']))
+                else:
+                    lines.append("[长文处理异常: 未找到长文链接]\n")
+                continue
+            if item['time_text'] is None:
+                lines.append("[短文信息未找到]\n")
+                continue
+            cleaned_time_text = remove_modified_text(item['time_text'])
+            norm_time = normalize_datetime(cleaned_time_text)
+            art_date = parse_date_from_text(cleaned_time_text)
+            if art_date is not None and art_date < start_dt:
+                cutoff = len(lines)
+                break
+            if not is_top and is_known_time(norm_time, known_before):
+                logger.info(f"用户{user_name}已到达已知文章（{norm_time}），停止翻页")
+                cutoff = len(lines)
+                break
+
+            page_cursor = norm_time
+            expanded_text = None
+            if item['expandable'] and expand_item is not None:
                 try:
-                    driver.quit()
+                    expanded_text = expand_item(item['index'])
+                    expanded[str(item['index'])] = expanded_text
                 except Exception as e:
-                    logger.warning(f"关闭旧驱动时出错: {e}")
-                driver = create_driver()
-
-            url = user_url_map.get(user_id)
-            if not url:
-                results[user_id] = ["[未找到该用户主页URL]"]
-                logger.warning(f"用户{user_id}未找到主页URL")
-                user_count += 1
-                continue
-
-            user_name = id_name_map.get(user_id, 'unknown')
-            user_articles = []
-            logger.info(f"开始爬取用户: {user_name} (ID: {user_id})")
+                    expanded_text = f"[展开内容异常: {e}]"
+            lines.extend(short_item_lines(item, norm_time, expanded_text))
+        except Exception as e:
+            lines.append(f"[文章处理异常: {e}]\n")
+
+    # 按时间线顺序取回本页长文，遇到早于起始日期或已知的长文时在该位置截止
+    resolved_lines = []
+    for pos, item in enumerate(lines):
+        if cutoff is not None and pos >= cutoff:
+            if not isinstance(item, str):
+                item[1].cancel()
+            continue
+        if isinstance(item, str):
+            resolved_lines.append(item)
+            continue
+        try:
+            article = dict(fetcher.result(item[1], item[0], driver), status_id=item[3])
+            article_lines, art_date, norm_time = article_to_lines(article)
+        except Exception as e:
+            resolved_lines.append(f"[长文处理异常: {e}]\n")
+            continue
+        if art_date is not None and art_date < start_dt:
+            cutoff = pos
+            continue
+        if not item[2] and is_known_time(norm_time, known_before):
+            logger.info(f"用户{user_name}已到达已知文章（{norm_time}），停止翻页")
+            cutoff = pos
+            continue
+        resolved_lines.extend(article_lines)
+        page_cursor = norm_time
+    return resolved_lines, page_cursor, cutoff is not None, expanded
+
+def _crawl_single_user(pool, controller, fetcher, user_id, url, user_name, start_dt, known_before=None,
+                       resume_page=0, on_page=None):
+    """
+    在会话池借出的浏览器中爬取单个用户自起始日期以来的文章
+    长文交给fetcher并发抓取，每页结束时按时间线顺序拼回
+    known_before: 用户高水位时间，遇到不晚于该时间的非置顶文章即停止翻页
+    resume_page: 检查点中已完成的页数，这些页只翻过不解析（内容由调用方从翻页日志补回）
+    on_page: 可选回调 on_page(页码, 游标, 本页内容行)，每页完成后调用
+    返回本次新爬取的内容行列表（失败时为单条错误说明）
+    """
+    browser = pool.acquire()
+    driver = browser.driver
+
+    def renew_browser():
+        """丢弃失效的会话并借出新会话"""
+        nonlocal browser
+        pool.release(browser, broken=True)
+        browser = None
+        browser = pool.acquire()
+        return browser.driver
+
+    def goto_next_page():
+        """点击下一页，没有下一页时返回False"""
+        try:
+            next_page_btn = WebDriverWait(driver, 10).until(
+                EC.element_to_be_clickable((By.CLASS_NAME, "pagination__next"))
+            )
+            if 'disabled' in next_page_btn.get_attribute('class'):
+                return False
+            controller.acquire()
+            next_page_btn.click()
+            controller.sleep(2.0, 'render')
+            return True
+        except Exception:
+            return False
+
+    user_articles = []
+    result = None
+    # 已完成的页数，会话失效重试时同样从这里续爬
+    done_pages = resume_page
+    logger.info(f"开始爬取用户: {user_name} (ID: {user_id})")
+    try:
+        retry_count = 0
+        while retry_count < 2:
+            try:
+                controller.acquire()
+                start = time.monotonic()
+                driver.get(url)
+                if rate_controller.is_wind_control_page(driver.page_source):
+                    controller.record_wind_control()
+                    result = ["[触发风控，跳过该用户。]"]
+                    logger.warning(f"用户{user_name}主页触发风控，跳过")
+                    break
 
-            retry_count = 0
-            while retry_count < 2:
                 try:
-                    driver.get("https://xueqiu.com")
-                    time.sleep(2)
-                    for c in cookie_list:
-                        try:
-                            driver.add_cookie(c)
-                        except Exception as e:
-                            logger.warning(f"添加cookie失败: {e}")
-                    driver.refresh()
-                    time.sleep(2)
-                    driver.get(url)
-                    time.sleep(3)
+                    button = WebDriverWait(driver, 10).until(
+                        EC.element_to_be_clickable((By.LINK_TEXT, "全部"))
+                    )
+                    controller.record_latency(time.monotonic() - start)
+                    button.click()
+                except ElementClickInterceptedException:
+                    button = WebDriverWait(driver, 10).until(
+                        EC.presence_of_element_located((By.LINK_TEXT, "全部"))
+                    )
+                    driver.execute_script("arguments[0].click();", button)
+                except TimeoutException:
+                    user_articles.append("[未找到'全部'按钮，跳过该用户。]")
+                    result = user_articles
+                    logger.warning(f"用户{user_name}未找到'全部'按钮，跳过")
+                    break
 
+                page_num = 0
+                stop_flag = False
+                while not stop_flag:
+                    page_num += 1
+                    logger.info(f"爬取用户{user_name}的第{page_num}页")
+                    # 会话失效（InvalidSessionIdException）交给外层重试：换新浏览器后重新打开主页、
+                    # 点击“全部”，已完成的页按done_pages直接翻过
                     try:
-                        button = WebDriverWait(driver, 10).until(
-                            EC.element_to_be_clickable((By.LINK_TEXT, "全部"))
-                        )
-                        button.click()
-                    except ElementClickInterceptedException:
-                        button = WebDriverWait(driver, 10).until(
-                            EC.presence_of_element_located((By.LINK_TEXT, "全部"))
+                        content_area = WebDriverWait(driver, 15).until(
+                            EC.presence_of_element_located((By.CLASS_NAME, 'profiles__timeline__bd'))
                         )
-                        driver.execute_script("arguments[0].click();", button)
                     except TimeoutException:
-                        user_articles.append("[未找到'全部'按钮，跳过该用户。]")
-                        results[user_id] = user_articles
-                        logger.warning(f"用户{user_name}未找到'全部'按钮，跳过")
+                        user_articles.append("[内容区域加载超时，退出。]")
+                        logger.warning(f"用户{user_name}内容区域加载超时")
                         break
 
-                    page_num = 0
-                    stop_flag = False
-                    while not stop_flag:
-                        page_num += 1
-                        logger.info(f"爬取用户{user_name}的第{page_num}页")
-                        try:
-                            content_area = WebDriverWait(driver, 15).until(
-                                EC.presence_of_element_located((By.CLASS_NAME, 'profiles__timeline__bd'))
-                            )
-                        except TimeoutException:
-                            user_articles.append("[内容区域加载超时，退出。]")
-                            logger.warning(f"用户{user_name}内容区域加载超时")
-                            break
-                        except InvalidSessionIdException as e:
-                            user_articles.append(f"[ERROR] 驱动会话失效：{e}")
-                            logger.error(f"驱动会话失效: {e}")
-                            try:
-                                driver.quit()
-                                logger.info("成功关闭WebDriver实例")
-                            except Exception as quit_e:
-                                logger.warning(f"关闭WebDriver时出错: {quit_e}")
-                            driver = create_driver()
-                            retry_count += 1
-                            if retry_count >= 2:
-                                results[user_id] = [f"[FATAL] driver session失效，重试2次失败：{e}"]
-                                logger.error(f"用户{user_name} driver失效，重试2次失败")
-                                break
-                            continue
-
-                        articles = content_area.find_elements(By.XPATH, "./*")
-                        lines = []
-                        for idx2 in range(1, len(articles)):
-                            try:
-                                article = content_area.find_elements(By.XPATH, "./*")[idx2]
-                            except Exception as e:
-                                lines.append(f"[WARN] 重新获取article失败：{e}\n")
-                                continue
-
-                            try:
-                                longtext_list = article.find_elements(
-                                    By.CLASS_NAME, "timeline__item__content.timeline__item__content--longtext"
-                                )
-                                if longtext_list:
-                                    longtext = longtext_list[0]
-                                    try:
-                                        aref = longtext.find_element(By.XPATH, './*[1]')
-                                        new_url = aref.get_attribute('href')
-                                        driver.execute_script(f"window.open('{new_url}', 'tmp_window');")
-                                        driver.switch_to.window(driver.window_handles[-1])
-                                        WebDriverWait(driver, 10).until(
-                                            EC.presence_of_element_located((By.CLASS_NAME, "article__bd"))
-                                        )
-                                        info = driver.find_element(By.CLASS_NAME, "time")
-                                        cleaned_time_text = remove_modified_text(info.text)
-                                        norm_time = normalize_datetime(cleaned_time_text)
-                                        art_date = parse_date_from_text(cleaned_time_text)
-                                        if art_date is not None and art_date < start_dt:
-                                            stop_flag = True
-                                            driver.close()
-                                            driver.switch_to.window(driver.window_handles[0])
-                                            break
-                                        article_area = driver.find_element(By.CLASS_NAME, 'article__bd')
-                                        title = article_area.find_element(By.XPATH, './*[1]')
-                                        lines.append(f"# {title.text} ")
-                                        lines.append(f"{norm_time}\n")
-                                        try:
-                                            main_text_elements = article_area.find_element(
-                                                By.CLASS_NAME, "article__bd__detail"
-                                            ).find_elements(By.XPATH, './*')
-                                            for text_elem in main_text_elements:
-                                                tmp_text = text_elem.text.replace('\n', '')
-                                                lines.append(tmp_text + '\n\n')
-                                        except NoSuchElementException:
-                                            lines.append("[正文未找到]\n")
-                                    except Exception as e:
-                                        lines.append(f"[长文处理异常: {e}]\n")
-                                    finally:
-                                        try:
-                                            driver.close()
-                                        except Exception:
-                                            pass
-                                        try:
-                                            driver.switch_to.window(driver.window_handles[0])
-                                        except Exception:
-                                            pass
-                                else:
-                                    try:
-                                        info = WebDriverWait(article, 10).until(
-                                            EC.presence_of_element_located((By.CLASS_NAME, "date-and-source"))
-                                        )
-                                        cleaned_time_text = remove_modified_text(info.text)
-                                        norm_time = normalize_datetime(cleaned_time_text)
-                                        art_date = parse_date_from_text(cleaned_time_text)
-                                        if art_date is not None and art_date < start_dt:
-                                            stop_flag = True
-                                            break
-                                    except TimeoutException:
-                                        lines.append("[短文信息获取超时]\n")
-                                        continue
-
-                                    lines.append(f"# {norm_time}\n")
-
-                                    try:
-                                        expand_button_list = article.find_elements(By.CLASS_NAME, "timeline__expand__control")
-                                        if expand_button_list:
-                                            expand_button = expand_button_list[0]
-                                            try:
-                                                expand_button.click()
-                                                time.sleep(1)
-                                                main_text = article.find_element(By.CLASS_NAME, "content.content--detail")
-                                                lines.append(main_text.text + "\n\n")
-                                            except Exception as e:
-                                                lines.append(f"[展开内容异常: {e}]\n")
-                                        else:
-                                            try:
-                                                main_text = article.find_element(By.CLASS_NAME, "content.content--description")
-                                                lines.append(main_text.text + "\n")
-                                            except NoSuchElementException:
-                                                lines.append("[内容未找到]\n")
-                                    except Exception as e:
-                                        lines.append(f"[短文处理异常: {e}]\n")
-                            except Exception as e:
-                                lines.append(f"[文章处理异常: {e}]\n")
-
-                        processed_lines = preprocess_lines(lines)
-                        user_articles.extend(processed_lines)
-
-                        if stop_flag:
-                            break
-
-                        try:
-                            next_page_btn = WebDriverWait(driver, 10).until(
-                                EC.element_to_be_clickable((By.CLASS_NAME, "pagination__next"))
-                            )
-                            if 'disabled' in next_page_btn.get_attribute('class'):
-                                break
-                            next_page_btn.click()
-                            time.sleep(2)
-                        except Exception:
+                    if page_num <= done_pages:
+                        logger.info(f"用户{user_name}第{page_num}页已在检查点中，直接翻页")
+                        if not goto_next_page():
                             break
+                        continue
 
-                    results[user_id] = user_articles if user_articles else ["[未抓取到内容]"]
-                    logger.info(f"完成爬取用户: {user_name}，获取{len(user_articles)}条内容")
-                    break  # 当前用户爬取成功，跳出重试循环
-
-                except InvalidSessionIdException as e:
-                    retry_count += 1
-                    logger.warning(f"用户{user_name} driver失效, 第{retry_count}次重试: {e}")
+                    # 取一次时间线区域快照在本地解析，只有需要展开的短文才回到浏览器
+                    timeline_html = content_area.get_attribute('outerHTML')
                     try:
-                        driver.quit()
-                    except Exception:
-                        pass
-                    driver = create_driver()
-                    if retry_count >= 2:
-                        results[user_id] = [f"[FATAL] driver session失效，重试2次失败：{e}"]
-                        logger.error(f"用户{user_name} driver失效，重试2次失败")
+                        items = page_parser.parse_timeline_html(timeline_html)
+                    except page_parser.PageParseError as e:
+                        user_articles.append(f"[时间线解析失败：{e}]")
+                        logger.warning(f"用户{user_name}第{page_num}页时间线解析失败: {e}")
+                        break
+                    # 展开后的全文随快照保存；游标为本页最后一篇文章的时间
+                    resolved_lines, page_cursor, stop_flag, expanded = timeline_page_lines(
+                        items, fetcher, driver, start_dt, known_before, page_num,
+                        expand_item=lambda index: expand_timeline_item(content_area, index, controller),
+                        user_name=user_name
+                    )
+
+                    snapshot_store.record(
+                        snapshot_store.TRACK_TIMELINE, user_id,
+                        json.dumps({'html': timeline_html, 'expanded': expanded}, ensure_ascii=False),
+                        url=url, page=page_num
+                    )
+                    processed_lines = preprocess_lines(resolved_lines)
+                    user_articles.extend(processed_lines)
+                    done_pages = page_num
+                    if on_page is not None:
+                        on_page(page_num, {'time': page_cursor}, processed_lines)
+
+                    if stop_flag or not goto_next_page():
                         break
-                    continue
-                except Exception as e:
-                    results[user_id] = [f"[ERROR] 爬取异常：{e}"]
-                    logger.error(f"用户{user_name}爬取异常: {e}")
-                    break
 
-            user_count += 1
+                # 增量爬取时没有新文章是正常结果，不写入占位说明
+                result = user_articles if user_articles or known_before else ["[未抓取到内容]"]
+                logger.info(f"完成爬取用户: {user_name}，获取{len(user_articles)}条内容")
+                break  # 当前用户爬取成功，跳出重试循环
+
+            except InvalidSessionIdException as e:
+                retry_count += 1
+                logger.warning(f"用户{user_name} driver失效, 第{retry_count}次重试: {e}")
+                driver = renew_browser()
+                if retry_count >= 2:
+                    result = [f"[FATAL] driver session失效，重试2次失败：{e}"]
+                    logger.error(f"用户{user_name} driver失效，重试2次失败")
+                    break
+                continue
+            except Exception as e:
+                result = [f"[ERROR] 爬取异常：{e}"]
+                logger.error(f"用户{user_name}爬取异常: {e}")
+                break
 
-            if (idx + 1) % PAUSE_INTERVAL == 0 and (idx + 1) < len(user_ids):
-                pause_time = random.randint(*PAUSE_SECONDS)
-                logger.info(f"已爬取{idx + 1}个用户，暂停{pause_time}秒...")
-                time.sleep(pause_time)
+    finally:
+        if browser is not None:
+            pool.release(browser)
+    if result is None:
+        result = [] if known_before else ["[未抓取到内容]"]
+    return result
+
+def block_record(block):
+    """文章块转换为文章库记录，帖子ID标记取出作为key（早期存档中没有，为None），保留原始行用于导出TXT"""
+    key, block = pop_post_key(block)
+    record = block_to_dict(block)
+    record['key'] = key
+    record['lines'] = block
+    record['published'] = block_timestamp(block)
+    return record
+
+def _split_pinned(blocks):
+    pinned = blocks[0] if blocks and is_pinned_block(blocks[0]) else None
+    return pinned, (blocks[1:] if pinned else blocks)
+
+def _bootstrap_user_store(store, user_id, user_name):
+    """文章库首次使用时导入原TXT存档，返回导入的非置顶文章块"""
+    legacy_file = os.path.join(OUTPUT_DIR, f"{user_name}_{user_id}_all.txt")
+    body_blocks = []
+    if os.path.exists(legacy_file):
+        with open(legacy_file, 'r', encoding='utf-8') as f:
+            pinned, body_blocks = _split_pinned(split_blocks(f.readlines()))
+        store.upsert([block_record(b) for b in body_blocks], pinned=block_record(pinned) if pinned else None)
+        logger.info(f"已将用户{user_name}的TXT存档导入文章库，共{len(store)}篇")
+    store.mark_bootstrapped(user_id)
+    return body_blocks
+
+def open_user_article_store(user_id, user_name):
+    """打开用户文章库，首次使用时导入原TXT存档，返回 (文章库, 导入的非置顶文章块)"""
+    store = track_store.open_user_store(user_name, HISTORY_DIR)
+    try:
+        imported_blocks = [] if store.is_bootstrapped() else _bootstrap_user_store(store, user_id, user_name)
+    except Exception:
+        store.close()
+        raise
+    return store, imported_blocks
 
+def load_recent_articles(user_name, start_date):
+    """文章库中发布时间不早于起始日期的文章，即该用户的近期文章；还没有文章库时返回None"""
+    path = track_store.store_path(user_name, HISTORY_DIR)
+    if not os.path.exists(path):
+        return None
+    store = track_store.UserArticleStore(path)
+    try:
+        return store.load_since(start_date)
     finally:
-        try:
-            if driver:
-                driver.quit()
-                logger.info("成功关闭WebDriver实例")
-        except Exception as e:
-            logger.warning(f"关闭WebDriver时出错: {e}")
-        
-        # 检查是否完成了所有用户的爬取，如果是则重置进度为0
-        progress_file = 'crawl_progress.txt'
-        if os.path.exists(progress_file):
-            try:
-                # 如果实际爬取的用户数量等于总用户数，则重置进度
-                if len(user_ids) > 0 and max_processed_idx >= len(user_ids) - 1:
-                    with open(progress_file, 'w') as f:
-                        f.write('0')
-                    logger.info("所有用户爬取完成，已重置爬取进度为0")
-            except Exception as e:
-                logger.warning(f"重置爬取进度时出错: {e}")
+        store.close()
+
+def merge_user_articles(user_id, user_name, user_articles, watermarks, start_date):
+    """
+    将单个用户本次爬取的内容行按帖子ID写入文章库并推进高水位，写入量只与新文章数成正比
+    已有帖子内容变化（被编辑）时记为新修订，不产生重复文章
+    TXT与JSON存档改为按需导出（track_store.export_user_history）
+    高水位只用于提前停止翻页，近期文章取文章库中自起始日期以来的全部文章，而不只是本次新爬取的
+    返回 (近期文章列表, 新增文章数)
+    """
+    store, imported_blocks = open_user_article_store(user_id, user_name)
+    try:
+        new_pinned, new_body_blocks = _split_pinned(split_blocks(user_articles))
+        inserted, revised = store.upsert(
+            [block_record(b) for b in new_body_blocks],
+            pinned=block_record(new_pinned) if new_pinned else None
+        )
+        recent = store.load_since(start_date)
+    finally:
+        store.close()
+    if revised:
+        logger.info(f"用户{user_name}有{revised}篇文章被编辑，已记录为新修订")
+    new_body_blocks = [pop_post_key(b)[1] for b in new_body_blocks]
+
+    # 高水位只前进，只需看本次爬取的文章（首次导入时连同旧存档）；本次爬取完整覆盖了起始日期以来的文章
+    update_user_watermark(watermarks, user_id, new_body_blocks + imported_blocks, covered_since=start_date)
+    return recent, inserted
+
+def is_failed_result(user_result):
+    """爬取结果是否为单条失败说明（无主页URL、风控、会话失效、异常）"""
+    return len(user_result) == 1 and user_result[0].startswith(FAILURE_MARKERS)
+
+def _crawl_user_with_checkpoint(worker_id, pool, controller, fetcher, user_id, url, user_name, start_date,
+                                start_dt, known_before, state):
+    """
+    带检查点爬取单个用户：上次中断在同一起始日期下时从翻页日志续爬，每页写入日志并推进检查点
+    返回 (内容行列表, 是否失败)，成功时内容行包含日志中已有的页
+    """
+    checkpoints = state['checkpoints']
+    journal = CrawlJournal(user_id, base_dir=state['journal_dir'])
+    record = checkpoints.get(user_id)
+    resume_page = 0
+    if (journal.exists() and record and record['state'] in ('running', 'failed')
+            and record['start_date'] == start_date and record['last_page']):
+        resume_page = record['last_page']
+        logger.info(f"[worker-{worker_id}] 用户{user_name}从检查点续爬，已完成{resume_page}页")
+    else:
+        journal.remove()
+    checkpoints.start(user_id, start_date, resume=resume_page > 0)
 
-    recent_results = {}
-    history_results = {}
+    def on_page(page, cursor, lines):
+        journal.append_page(page, cursor, lines)
+        checkpoints.page_done(user_id, page, cursor)
 
-    for user_id in user_ids:
+    try:
+        user_result = _crawl_single_user(pool, controller, fetcher, user_id, url, user_name, start_dt,
+                                         known_before=known_before, resume_page=resume_page, on_page=on_page)
+    except Exception as e:
+        user_result = [f"[ERROR] 爬取异常：{e}"]
+        logger.error(f"[worker-{worker_id}] 用户{user_name}爬取异常: {e}")
+    if is_failed_result(user_result):
+        return user_result, True
+    if resume_page:
+        # 续爬时前面的页只翻过未解析，内容从翻页日志补回
+        return [line for entry in journal.iter_entries() if entry['page'] <= resume_page
+                for line in entry['records']] + user_result, False
+    return user_result, False
+
+def _user_worker(worker_id, tasks, pool, controller, fetcher, user_url_map, id_name_map, start_date, start_dt,
+                 state):
+    """工作线程：从共享队列取用户逐个爬取，每完成一个用户立即合并写入存档并更新检查点"""
+    done = 0
+    checkpoints = state['checkpoints']
+    probe_session = create_probe_session(state['cookie_list']) if state['use_watermark'] else None
+    while True:
+        try:
+            user_id = tasks.get_nowait()
+        except queue.Empty:
+            break
+        started = time.monotonic()
         user_name = id_name_map.get(user_id, 'unknown')
-        user_history_file = os.path.join(OUTPUT_DIR, f"{user_name}_{user_id}_all.txt")
-        user_history_json = os.path.join(HISTORY_DIR, f"{user_name}_all.json")
-
-        if os.path.exists(user_history_file):
-            with open(user_history_file, 'r', encoding='utf-8') as f:
-                old_lines = f.readlines()
-            old_blocks = split_blocks(old_lines)
+        url = user_url_map.get(user_id)
+        with state['persist_lock']:
+            watermark = state['watermarks'].get(user_id) if state['use_watermark'] else None
+        known_before = watermark['timestamp'] if watermark_covers(watermark, start_date) else None
+        if watermark and known_before is None:
+            logger.info(f"用户{user_name}的高水位只覆盖{watermark.get('covered_since') or '未知日期'}以来的文章，"
+                        f"本次起始日期{start_date}更早，不使用高水位")
+        record = checkpoints.get(user_id)
+        # 有未完成的翻页日志时说明确有新内容，不再探测
+        resuming = bool(record and record['state'] in ('running', 'failed') and record['start_date'] == start_date)
+        latest = None
+        if url and known_before and not resuming:
+            latest = probe_latest_timestamp(probe_session, user_id, controller)
+        failed = False
+        if not url:
+            user_result, failed = ["[未找到该用户主页URL]"], True
+            logger.warning(f"用户{user_id}未找到主页URL")
+        elif latest is not None and latest <= known_before:
+            # 探测到最新帖不晚于高水位，无需打开浏览器
+            user_result = None
+            with state['lock']:
+                state['skipped'].append(user_id)
+            logger.info(f"[worker-{worker_id}] 用户{user_name}没有新内容（最新{latest}），跳过")
         else:
-            old_blocks = []
-
-        user_articles = results.get(user_id, [])
-        new_blocks = split_blocks(user_articles)
-
-        def block_hash(block):
-            return hashlib.md5('\n'.join(block).strip().encode('utf-8')).hexdigest()
-
-        old_pinned = old_blocks[0] if old_blocks and is_pinned_block(old_blocks[0]) else None
-        new_pinned = new_blocks[0] if new_blocks and is_pinned_block(new_blocks[0]) else None
+            user_result, failed = _crawl_user_with_checkpoint(
+                worker_id, pool, controller, fetcher, user_id, url, user_name, start_date, start_dt,
+                known_before, state
+            )
+        done += 1
+        # 用户完成后立即合并写入存档，内容行随即释放；写入先于检查点完成，中断后重爬也只会去重
+        with state['persist_lock']:
+            history_file = track_store.store_path(user_name, HISTORY_DIR)
+            # 未爬取或失败的用户与时间窗口内跳过的用户一样保留上次的近期文章
+            recent_dicts = state['previous_recent'].get(user_id, [])
+            if failed:
+                # 失败时不写入存档，保留翻页日志与检查点供下次续爬
+                checkpoints.fail(user_id, user_result[0], time.monotonic() - started)
+                logger.warning(f"[worker-{worker_id}] 用户{user_name}爬取失败：{user_result[0]}")
+            elif user_result is None:
+                # 探测后跳过的用户没有新文章，近期文章仍按起始日期从文章库读取
+                stored_recent = load_recent_articles(user_name, start_date)
+                if stored_recent is not None:
+                    recent_dicts = stored_recent
+                checkpoints.start(user_id, start_date)
+                checkpoints.finish(user_id, 'skipped', seconds=time.monotonic() - started)
+            else:
+                try:
+                    recent_dicts, inserted = merge_user_articles(user_id, user_name, user_result, state['watermarks'],
+                                                                  start_date)
+                    save_user_watermarks(state['watermarks'])
+                    CrawlJournal(user_id, base_dir=state['journal_dir']).remove()
+                    checkpoints.finish(user_id, 'done', articles=inserted, seconds=time.monotonic() - started)
+                    logger.info(f"用户{user_name}新增{inserted}篇文章到文章库")
+                    vector_index.update_user_index_in_background(user_name)
+                except Exception as e:
+                    checkpoints.fail(user_id, f"写入存档失败: {e}", time.monotonic() - started)
+                    logger.error(f"用户{user_name}写入存档失败: {e}")
+            try:
+                update_recent_track(user_id, recent_dicts)
+            except Exception as e:
+                logger.error(f"更新近期跟踪数据失败: {e}")
+            if state['on_user_done'] is not None:
+                try:
+                    state['on_user_done'](user_id, recent_dicts, history_file)
+                except Exception as e:
+                    logger.warning(f"用户完成回调出错: {e}")
+        with state['lock']:
+            state['recent'][user_id] = recent_dicts
+            state['history'][user_id] = history_file
+            state['worker_done'][worker_id] = done
+            state['finished'] += 1
+            finished = state['finished']
+        logger.info(f"[worker-{worker_id}] 已完成{done}个用户，总进度 {finished}/{state['total']}")
+
+def crawl_user_articles(user_ids, start_date, workers=CRAWL_WORKERS, use_watermark=True, on_user_done=None,
+                        skip_window_hours=SKIP_WINDOW_HOURS):
+    """
+    爬取用户自起始日期以来的文章，每完成一个用户即合并到历史存档并更新recent_user_track.json
+    workers: 并行的浏览器数量，多个worker从共享队列取用户，共用同一个节奏控制器，上限为MAX_WORKERS
+    use_watermark: 依据用户高水位标记先探测是否有新内容，无新内容的用户跳过，翻页在已知文章处停止
+    on_user_done: 可选回调 on_user_done(user_id, 近期文章列表, 文章库路径)，在worker线程中调用
+    skip_window_hours: 在该时间内已完成（且起始日期不晚于本次）的用户直接跳过，0表示全部重爬；
+        中断后重新运行即据此跳过已完成的用户，未完成的用户按检查点从中断的页续爬
+    返回: {"recent": {user_id: 近期文章列表}, "history": {user_id: 文章库路径}}
+    """
+    start_dt = datetime.strptime(start_date, "%Y-%m-%d")
+    cookie_str = get_cookie_str_from_file(COOKIE_FILE)
+    cookie_list = parse_cookie_str(cookie_str)
+    id_name_map = load_id_name_map(ID_NAME_FILE)
+    user_url_map = load_user_urls(USER_URLS_FILE)
+    ensure_dir(OUTPUT_DIR)
+    ensure_dir(HISTORY_DIR)
 
-        old_body_blocks = old_blocks[1:] if old_pinned else old_blocks
-        new_body_blocks = new_blocks[1:] if new_pinned else new_blocks
+    checkpoints = track_store.open_checkpoints(HISTORY_DIR)
+    # 近期跟踪文件只保留本次跳过的用户上次的结果，其余用户随完成逐个写入
+    previous_recent = load_recent_track()
+    recent_skipped = [uid for uid in dict.fromkeys(user_ids)
+                      if checkpoints.should_skip(uid, start_date, skip_window_hours)]
+    save_recent_track({uid: previous_recent[uid] for uid in recent_skipped if uid in previous_recent})
+    state = {
+        'lock': threading.Lock(),
+        'persist_lock': threading.Lock(),
+        'recent': {},
+        'history': {},
+        'on_user_done': on_user_done,
+        'finished': 0,
+        'worker_done': {},
+        'total': 0,
+        'cookie_list': cookie_list,
+        'use_watermark': use_watermark,
+        'watermarks': load_user_watermarks(),
+        'skipped': [],
+        'checkpoints': checkpoints,
+        'previous_recent': previous_recent,
+        'journal_dir': track_store.page_journal_dir(HISTORY_DIR),
+    }
+    for uid in recent_skipped:
+        history_file = track_store.store_path(id_name_map.get(uid, 'unknown'), HISTORY_DIR)
+        state['recent'][uid] = previous_recent.get(uid, [])
+        state['history'][uid] = history_file
+        if on_user_done is not None:
+            on_user_done(uid, state['recent'][uid], history_file)
+    if recent_skipped:
+        logger.info(f"{len(recent_skipped)}个用户在{skip_window_hours}小时内已完成爬取，本次跳过")
+
+    tasks = queue.Queue()
+    for user_id in dict.fromkeys(user_ids):
+        if user_id not in state['recent']:
+            tasks.put(user_id)
+    state['total'] = tasks.qsize()
+    if state['total'] == 0:
+        checkpoints.close()
+        return {"recent": state['recent'], "history": state['history']}
+
+    workers = max(1, min(int(workers), MAX_WORKERS))
+    controller = rate_controller.get_controller(BROWSER_HOST)
+    if workers == 1:
+        # 会话池常驻已登录的浏览器，与评论爬虫共用，不再为每个用户重复首页、Cookie与刷新
+        pool = session_pool.get_shared_pool(create_driver, cookie_list)
+    else:
+        # 多个相互隔离的浏览器进程，爬取结束后关闭
+        pool = session_pool.BrowserSessionPool(create_driver, cookie_list, size=workers, controller=controller)
+    # 长文抓取线程池由所有worker共用，并发数有上限
+    fetcher = article_fetcher.ArticleFetcher(cookie_list, controller=controller)
 
-        final_blocks = []
-        if new_pinned:
-            new_pinned_text = '\n'.join(new_pinned).strip()
-            old_pinned_text = '\n'.join(old_pinned).strip() if old_pinned else None
-            if not old_pinned or old_pinned_text != new_pinned_text:
-                final_blocks.append(new_pinned)
-            else:
-                final_blocks.append(old_pinned)
-        elif old_pinned:
-            final_blocks.append(old_pinned)
-
-        history_hashes = set()
-        for b in new_body_blocks:
-            h = block_hash(b)
-            if h not in history_hashes:
-                final_blocks.append(b)
-                history_hashes.add(h)
-        for b in old_body_blocks:
-            h = block_hash(b)
-            if h not in history_hashes:
-                final_blocks.append(b)
-                history_hashes.add(h)
-
-        with open(user_history_file, 'w', encoding='utf-8') as f:
-            for block in final_blocks:
-                for l in block:
-                    f.write(l+'\n')
-                f.write('\n')
-
-        recent_dicts = [block_to_dict(b) for b in new_body_blocks]
-        history_dicts = [block_to_dict(b) for b in final_blocks]
-
-        import json
-        with open(user_history_json, 'w', encoding='utf-8') as f_json:
-            json.dump(history_dicts, f_json, ensure_ascii=False, indent=2)
-
-        recent_results[user_id] = recent_dicts
-        history_results[user_id] = history_dicts
-
-    # 保存近期跟踪数据到recent_user_track.json
     try:
-        from storage import save_recent_track
-        save_recent_track(recent_results)
-        logger.info(f"成功保存近期跟踪数据到 {RECENT_TRACK_FILE}")
-    except Exception as e:
-        logger.error(f"保存近期跟踪数据失败: {str(e)}")
-        
+        threads = []
+        for worker_id in range(1, workers + 1):
+            thread = threading.Thread(
+                target=_user_worker, name=f"track-worker-{worker_id}",
+                args=(worker_id, tasks, pool, controller, fetcher, user_url_map, id_name_map, start_date, start_dt,
+                      state)
+            )
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+    finally:
+        fetcher.close()
+        logger.info(f"长文抓取完成{fetcher.fetched}篇，失败{fetcher.failed}篇")
+        controller.log_stats()
+        if workers > 1:
+            pool.close()
+        report = checkpoints.report(list(state['history']))
+        checkpoints.close()
+
+    logger.info(f"各worker完成用户数: {state['worker_done']}，无新内容跳过{len(state['skipped'])}个用户")
+    logger.info("本次爬取成本（按累计耗时排序）：\n" + '\n'.join(track_store.format_cost_report(report, COST_REPORT_TOP)))
     return {
-        "recent": recent_results,
-        "history": history_results
+        "recent": state['recent'],
+        "history": state['history']
     }
 
+def iter_user_articles(user_ids, start_date, **kwargs):
+    """
+    在后台线程中运行crawl_user_articles，每完成一个用户即产出 (user_id, 近期文章列表)
+    供界面逐个展示已完成的用户；参数同crawl_user_articles
+    """
+    done = queue.Queue()
+    finished = object()
+    errors = []
+
+    def run():
+        try:
+            crawl_user_articles(user_ids, start_date,
+                                on_user_done=lambda uid, recent, history_file: done.put((uid, recent)), **kwargs)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            done.put(finished)
+
+    thread = threading.Thread(target=run, name="track-crawl", daemon=True)
+    thread.start()
+    while True:
+        item = done.get()
+        if item is finished:
+            break
+        yield item
+    thread.join()
+    if errors:
+        raise errors[0]
+
 if __name__ == "__main__":
     id_name_map = load_id_name_map(ID_NAME_FILE)
     user_ids = list(id_name_map.keys())
     today = datetime.now().strftime("%Y-%m-%d")
     results = crawl_user_articles(user_ids, today)
 
-    # 新增：保存近期跟踪数据到recent_user_track.json
-    from storage import save_recent_track
-    save_recent_track(results["recent"])
-
     for uid, articles in results["recent"].items():
         print(f"\n用户 {id_name_map.get(uid, uid)}（近期跟踪去除置顶）：")
         for i, art in enumerate(articles, 1):
@@ -600,7 +980,8 @@ if __name__ == "__main__":
             print(f"是否置顶: {art['is_pinned']}")
             print(f"正文: {art['content'][:100]}...")
 
-    for uid, articles in results["history"].items():
+    for uid in results["history"]:
+        articles = track_store.load_user_history(id_name_map.get(uid, 'unknown'), HISTORY_DIR)
         print(f"\n用户 {id_name_map.get(uid, uid)}（历史存档）：")
         for i, art in enumerate(articles, 1):
             print(f"\n文章 {i}:")
@@ -0,0 +1,500 @@
+import os
+import sys
+import json
+import difflib
+import logging
+import sqlite3
+import threading
+from datetime import datetime
+
+# ==== 配置 ====
+HISTORY_DIR = 'history_track'  # 存储文件与JSON导出所在目录
+TXT_EXPORT_DIR = 'history_track_txt'  # TXT导出目录
+STORE_SUFFIX = '_all.db'  # 用户文章库：history_track/{user_name}_all.db，与JSON导出同名
+CHECKPOINT_FILE = 'crawl_checkpoints.db'  # 按用户的爬取检查点：history_track/crawl_checkpoints.db
+BACKFILL_CHECKPOINT_FILE = 'backfill_checkpoints.db'  # 全量回填的检查点，与日常爬取分开记录
+PAGE_JOURNAL_DIR = 'journals'  # 用户翻页日志：history_track/journals/{user_id}.journal.jsonl
+DELTA_CHAR_LIMIT = 20000  # 修订差量按字符比较的文本长度上限，更长的按行比较
+
+logger = logging.getLogger(__name__)
+
+def store_path(user_name, base_dir=HISTORY_DIR):
+    return os.path.join(base_dir, f"{user_name}{STORE_SUFFIX}")
+
+def json_export_path(user_name, base_dir=HISTORY_DIR):
+    """原有的 history_track/{user_name}_all.json"""
+    return os.path.join(base_dir, f"{user_name}_all.json")
+
+def txt_export_path(user_name, user_id, txt_dir=TXT_EXPORT_DIR):
+    """原有的 history_track_txt/{user_name}_{user_id}_all.txt"""
+    return os.path.join(txt_dir, f"{user_name}_{user_id}_all.txt")
+
+def make_delta(new_text, old_text):
+    """
+    生成由新版本还原旧版本的差量（反向差量），只记录不同的片段
+    短文本按字符比较，长文本按行比较
+    """
+    by_line = max(len(new_text), len(old_text)) > DELTA_CHAR_LIMIT
+    new_tokens = new_text.splitlines(keepends=True) if by_line else new_text
+    old_tokens = old_text.splitlines(keepends=True) if by_line else old_text
+    matcher = difflib.SequenceMatcher(None, new_tokens, old_tokens, autojunk=False)
+    ops = [[i1, i2, ''.join(old_tokens[j1:j2])]
+           for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != 'equal']
+    return {'mode': 'line' if by_line else 'char', 'ops': ops}
+
+def apply_delta(new_text, delta):
+    """将反向差量应用到新版本，还原出旧版本"""
+    tokens = new_text.splitlines(keepends=True) if delta['mode'] == 'line' else new_text
+    pieces = []
+    cursor = 0
+    for i1, i2, replacement in delta['ops']:
+        pieces.append(''.join(tokens[cursor:i1]))
+        pieces.append(replacement)
+        cursor = i2
+    pieces.append(''.join(tokens[cursor:]))
+    return ''.join(pieces)
+
+def _lines_text(lines):
+    return '\n'.join(lines)
+
+def _atomic_write(path, write):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+class UserArticleStore:
+    """
+    单个用户的文章库，置顶帖单独记录在meta中
+    每篇文章以稳定的post_key标识（帖子ID，页面未提供时退化为内容哈希），表中只保存最新修订，
+    被编辑的帖子原位更新，旧版本以反向差量存入revisions表，检索与AI分析只看到最新修订
+    每次爬取的新文章作为一个批次写入，写入量只与新文章数成正比
+    存档顺序与原TXT一致：置顶帖在前，其后按批次从新到旧、批次内按爬取顺序
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS articles ("
+            "hash TEXT PRIMARY KEY, batch INTEGER NOT NULL, pos INTEGER NOT NULL, "
+            "published TEXT, title TEXT, content TEXT, is_pinned INTEGER, lines TEXT)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS articles_order ON articles (batch DESC, pos)")
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(articles)")}
+        if 'post_key' not in columns:
+            # 早期版本的库没有修订信息，原有文章以内容哈希作为post_key
+            self._conn.execute("ALTER TABLE articles ADD COLUMN post_key TEXT")
+            self._conn.execute("ALTER TABLE articles ADD COLUMN revision INTEGER DEFAULT 0")
+            self._conn.execute("UPDATE articles SET post_key = hash WHERE post_key IS NULL")
+        self._conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS articles_key ON articles (post_key)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS revisions ("
+            "post_key TEXT NOT NULL, revision INTEGER NOT NULL, hash TEXT, published TEXT, delta TEXT, "
+            "replaced_at TEXT, PRIMARY KEY (post_key, revision))"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._conn.commit()
+
+    def _get_meta(self, key, default=None):
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def _set_meta(self, key, value):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, json.dumps(value, ensure_ascii=False))
+        )
+
+    def get_meta(self, key, default=None):
+        with self._lock:
+            return self._get_meta(key, default)
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM articles").fetchone()[0]
+
+    def __contains__(self, art_hash):
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM articles WHERE hash = ?", (art_hash,)).fetchone()
+        return row is not None
+
+    def _revise(self, post_key, current, article):
+        """以新内容原位替换文章，旧版本存为反向差量，返回是否更新"""
+        old_hash, old_lines, old_published, revision = current
+        new_lines = article['lines']
+        try:
+            self._conn.execute(
+                "UPDATE articles SET hash = ?, published = ?, title = ?, content = ?, is_pinned = ?, lines = ?, "
+                "revision = ? WHERE post_key = ?",
+                (article['hash'], article.get('published'), article['title'], article['content'],
+                 int(bool(article.get('is_pinned'))), json.dumps(new_lines, ensure_ascii=False), revision + 1,
+                 post_key)
+            )
+        except sqlite3.IntegrityError:
+            # 新内容与库中另一篇文章完全相同，保留原状
+            return False
+        delta = make_delta(_lines_text(new_lines), _lines_text(json.loads(old_lines)))
+        self._conn.execute(
+            "INSERT OR REPLACE INTO revisions (post_key, revision, hash, published, delta, replaced_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (post_key, revision, old_hash, old_published, json.dumps(delta, ensure_ascii=False),
+             datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+        )
+        return True
+
+    def upsert(self, articles, pinned=None, batch=None):
+        """
+        写入一次爬取的文章，articles为按时间线顺序排列的
+        {'key', 'hash', 'title', 'content', 'is_pinned', 'lines', 'published'}
+        key为帖子ID，缺失时以哈希代替：同一key内容未变的跳过，内容变化的记为新修订，
+        没有key的文章与库中相同哈希的文章视为同一篇
+        pinned为本次看到的置顶帖，与已记录的不同时替换
+        batch默认为新批次（排在已有文章之前）；全量回填传入负数批次，排在日常爬取的文章之后
+        返回 (新增文章数, 修订文章数)
+        """
+        with self._lock:
+            new_batch = batch is None
+            if new_batch:
+                batch = self._get_meta('next_batch', 1)
+            inserted = 0
+            revised = 0
+            for pos, article in enumerate(articles):
+                post_key = article.get('key') or article['hash']
+                current = self._conn.execute(
+                    "SELECT hash, lines, published, revision FROM articles WHERE post_key = ?", (post_key,)
+                ).fetchone()
+                if current is not None:
+                    if current[0] != article['hash'] and self._revise(post_key, current, article):
+                        revised += 1
+                    continue
+                cur = self._conn.execute(
+                    "INSERT OR IGNORE INTO articles "
+                    "(post_key, revision, hash, batch, pos, published, title, content, is_pinned, lines) "
+                    "VALUES (?, 0, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (post_key, article['hash'], batch, pos, article.get('published'), article['title'],
+                     article['content'], int(bool(article.get('is_pinned'))),
+                     json.dumps(article['lines'], ensure_ascii=False))
+                )
+                if cur.rowcount:
+                    inserted += 1
+                elif article.get('key'):
+                    # 内容已以哈希作为key存在（早期存档），补上帖子ID，之后的编辑即可识别为修订
+                    self._conn.execute(
+                        "UPDATE articles SET post_key = ? WHERE hash = ? AND post_key = hash",
+                        (post_key, article['hash'])
+                    )
+            changed = inserted > 0 or revised > 0
+            if pinned is not None:
+                current = self._get_meta('pinned')
+                if current is None or current.get('hash') != pinned['hash']:
+                    self._set_meta('pinned', {
+                        'hash': pinned['hash'],
+                        'title': pinned['title'],
+                        'content': pinned['content'],
+                        'lines': pinned['lines'],
+                        'seen_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                    })
+                    changed = True
+            if inserted and new_batch:
+                self._set_meta('next_batch', batch + 1)
+            if changed:
+                self._set_meta('version', self._get_meta('version', 0) + 1)
+            self._conn.commit()
+        return inserted, revised
+
+    def load_revisions(self, post_key):
+        """返回文章从新到旧的各修订 [{'revision', 'hash', 'published', 'lines'}]，由反向差量依次还原"""
+        with self._lock:
+            current = self._conn.execute(
+                "SELECT hash, published, lines, revision FROM articles WHERE post_key = ?", (post_key,)
+            ).fetchone()
+            if current is None:
+                return []
+            rows = self._conn.execute(
+                "SELECT revision, hash, published, delta FROM revisions WHERE post_key = ? ORDER BY revision DESC",
+                (post_key,)
+            ).fetchall()
+        lines = json.loads(current[2])
+        versions = [{'revision': current[3], 'hash': current[0], 'published': current[1], 'lines': lines}]
+        text = _lines_text(lines)
+        for revision, old_hash, published, delta in rows:
+            text = apply_delta(text, json.loads(delta))
+            versions.append({'revision': revision, 'hash': old_hash, 'published': published,
+                             'lines': text.split('\n')})
+        return versions
+
+    def revision_count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM revisions").fetchone()[0]
+
+    def _rows(self):
+        """按存档顺序产出 (is_pinned, hash, title, content, lines)"""
+        pinned = self._get_meta('pinned')
+        if pinned is not None:
+            yield True, pinned['hash'], pinned['title'], pinned['content'], pinned['lines']
+        for art_hash, title, content, is_pinned, lines in self._conn.execute(
+                "SELECT hash, title, content, is_pinned, lines FROM articles ORDER BY batch DESC, pos"):
+            yield bool(is_pinned), art_hash, title, content, json.loads(lines)
+
+    def load_articles(self):
+        """按存档顺序返回文章列表，格式与原JSON存档相同"""
+        with self._lock:
+            return [
+                {"hash": art_hash, "title": title, "content": content, "is_pinned": is_pinned}
+                for is_pinned, art_hash, title, content, _ in self._rows()
+            ]
+
+    def load_since(self, since):
+        """发布时间不早于since（'YYYY-MM-DD'）的非置顶文章，按存档顺序，格式与原JSON存档相同"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT hash, title, content FROM articles WHERE published >= ? AND NOT is_pinned "
+                "ORDER BY batch DESC, pos", (since,)
+            ).fetchall()
+        return [{"hash": art_hash, "title": title, "content": content, "is_pinned": False}
+                for art_hash, title, content in rows]
+
+    def export_json(self, path):
+        articles = self.load_articles()
+        _atomic_write(path, lambda f: json.dump(articles, f, ensure_ascii=False, indent=2))
+
+    def export_txt(self, path):
+        def write(f):
+            for _, _, _, _, lines in self._rows():
+                for line in lines:
+                    f.write(line + '\n')
+                f.write('\n')
+        with self._lock:
+            _atomic_write(path, write)
+
+    def is_bootstrapped(self):
+        with self._lock:
+            return self._get_meta('bootstrapped_at') is not None
+
+    def mark_bootstrapped(self, user_id=None):
+        with self._lock:
+            self._set_meta('bootstrapped_at', datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+            if user_id is not None:
+                self._set_meta('user_id', user_id)
+            self._conn.commit()
+
+    def mark_exported(self, version):
+        with self._lock:
+            self._set_meta('exported_version', version)
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+def open_user_store(user_name, base_dir=HISTORY_DIR):
+    """打开（必要时创建）用户的文章库"""
+    os.makedirs(base_dir, exist_ok=True)
+    return UserArticleStore(store_path(user_name, base_dir))
+
+def load_user_history(user_name, base_dir=HISTORY_DIR):
+    """读取用户的历史存档：优先文章库，尚未迁移的用户读取原JSON存档"""
+    path = store_path(user_name, base_dir)
+    if os.path.exists(path):
+        store = UserArticleStore(path)
+        try:
+            return store.load_articles()
+        finally:
+            store.close()
+    json_path = json_export_path(user_name, base_dir)
+    if not os.path.exists(json_path):
+        return []
+    with open(json_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def export_user_history(user_name, base_dir=HISTORY_DIR, txt_dir=TXT_EXPORT_DIR, force=False):
+    """
+    按需从文章库导出TXT与JSON存档，库自上次导出后没有变化时跳过
+    返回是否进行了导出
+    """
+    path = store_path(user_name, base_dir)
+    if not os.path.exists(path):
+        return False
+    store = UserArticleStore(path)
+    try:
+        version = store.get_meta('version', 0)
+        if not force and store.get_meta('exported_version') == version:
+            return False
+        store.export_json(json_export_path(user_name, base_dir))
+        user_id = store.get_meta('user_id')
+        if user_id is not None:
+            os.makedirs(txt_dir, exist_ok=True)
+            store.export_txt(txt_export_path(user_name, user_id, txt_dir))
+        store.mark_exported(version)
+    finally:
+        store.close()
+    logger.info(f"已导出用户{user_name}的历史存档")
+    return True
+
+class CrawlCheckpoints:
+    """
+    按用户ID记录的爬取检查点，取代只记一个列表下标的crawl_progress.txt
+    每个用户记录状态（running/done/skipped/failed/paused）、起始日期、已完成页数与游标、连续错误次数，
+    以及本次与累计的耗时、页数、新增文章数，用于精确续爬、跳过近期已完成的用户和统计爬取成本
+    """
+    COLUMNS = ('user_id', 'state', 'start_date', 'last_page', 'cursor', 'errors', 'last_error',
+               'pages', 'articles', 'seconds', 'runs', 'total_pages', 'total_articles', 'total_seconds',
+               'started_at', 'updated_at', 'finished_at')
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS checkpoints ("
+            "user_id TEXT PRIMARY KEY, state TEXT, start_date TEXT, last_page INTEGER DEFAULT 0, cursor TEXT, "
+            "errors INTEGER DEFAULT 0, last_error TEXT, pages INTEGER DEFAULT 0, articles INTEGER DEFAULT 0, "
+            "seconds REAL DEFAULT 0, runs INTEGER DEFAULT 0, total_pages INTEGER DEFAULT 0, "
+            "total_articles INTEGER DEFAULT 0, total_seconds REAL DEFAULT 0, "
+            "started_at TEXT, updated_at TEXT, finished_at TEXT)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def _now():
+        return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+    def get(self, user_id):
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(self.COLUMNS)} FROM checkpoints WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        record = dict(zip(self.COLUMNS, row))
+        record['cursor'] = json.loads(record['cursor']) if record['cursor'] else None
+        return record
+
+    def should_skip(self, user_id, start_date, window_hours):
+        """用户在时间窗口内已完成，且当时的起始日期不晚于本次，则无需重爬"""
+        if window_hours <= 0:
+            return False
+        record = self.get(user_id)
+        if not record or record['state'] not in ('done', 'skipped') or not record['finished_at']:
+            return False
+        if (record['start_date'] or '') > start_date:
+            return False
+        finished = datetime.strptime(record['finished_at'], '%Y-%m-%d %H:%M:%S')
+        return (datetime.now() - finished).total_seconds() < window_hours * 3600
+
+    def start(self, user_id, start_date, resume=False):
+        """开始（或续爬）一个用户；非续爬时清零页数与游标"""
+        now = self._now()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO checkpoints (user_id) VALUES (?)", (user_id,)
+            )
+            if resume:
+                self._conn.execute(
+                    "UPDATE checkpoints SET state = 'running', runs = runs + 1, updated_at = ? WHERE user_id = ?",
+                    (now, user_id)
+                )
+            else:
+                self._conn.execute(
+                    "UPDATE checkpoints SET state = 'running', start_date = ?, last_page = 0, cursor = NULL, "
+                    "pages = 0, articles = 0, seconds = 0, runs = runs + 1, started_at = ?, updated_at = ?, "
+                    "finished_at = NULL WHERE user_id = ?",
+                    (start_date, now, now, user_id)
+                )
+            self._conn.commit()
+
+    def page_done(self, user_id, page, cursor, articles=0):
+        """记录一页已落盘（写入翻页日志或文章库），articles为该页直接写入文章库的新增数"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE checkpoints SET last_page = ?, cursor = ?, pages = pages + 1, "
+                "total_pages = total_pages + 1, articles = articles + ?, total_articles = total_articles + ?, "
+                "updated_at = ? WHERE user_id = ?",
+                (page, json.dumps(cursor, ensure_ascii=False), articles, articles, self._now(), user_id)
+            )
+            self._conn.commit()
+
+    def finish(self, user_id, state='done', articles=0, seconds=0.0):
+        """用户完成（done）或因无新内容跳过（skipped），清零连续错误次数"""
+        now = self._now()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE checkpoints SET state = ?, errors = 0, last_error = NULL, articles = articles + ?, "
+                "total_articles = total_articles + ?, seconds = seconds + ?, total_seconds = total_seconds + ?, "
+                "updated_at = ?, finished_at = ? WHERE user_id = ?",
+                (state, articles, articles, seconds, seconds, now, now, user_id)
+            )
+            self._conn.commit()
+
+    def fail(self, user_id, error, seconds=0.0):
+        """用户爬取失败：保留页数与游标供下次续爬，错误次数加一"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE checkpoints SET state = 'failed', errors = errors + 1, last_error = ?, "
+                "seconds = seconds + ?, total_seconds = total_seconds + ?, updated_at = ? WHERE user_id = ?",
+                (str(error)[:500], seconds, seconds, self._now(), user_id)
+            )
+            self._conn.commit()
+
+    def pause(self, user_id, reason, seconds=0.0):
+        """用户未完成但主动停止（达到页数上限或被中止），保留进度，不计为错误"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE checkpoints SET state = 'paused', last_error = ?, seconds = seconds + ?, "
+                "total_seconds = total_seconds + ?, updated_at = ? WHERE user_id = ?",
+                (reason, seconds, seconds, self._now(), user_id)
+            )
+            self._conn.commit()
+
+    def report(self, user_ids=None):
+        """按累计耗时从高到低返回各用户的爬取成本记录"""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(self.COLUMNS)} FROM checkpoints ORDER BY total_seconds DESC"
+            ).fetchall()
+        records = [dict(zip(self.COLUMNS, row)) for row in rows]
+        if user_ids is not None:
+            wanted = set(user_ids)
+            records = [r for r in records if r['user_id'] in wanted]
+        return records
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+def open_checkpoints(base_dir=HISTORY_DIR, file_name=CHECKPOINT_FILE):
+    """打开（必要时创建）爬取检查点库"""
+    os.makedirs(base_dir, exist_ok=True)
+    return CrawlCheckpoints(os.path.join(base_dir, file_name))
+
+def page_journal_dir(base_dir=HISTORY_DIR):
+    return os.path.join(base_dir, PAGE_JOURNAL_DIR)
+
+def format_cost_report(records, limit=None):
+    """将检查点记录格式化为成本报表文本行"""
+    lines = [f"{'用户ID':<12}{'状态':<9}{'本次页数':>8}{'本次新增':>8}{'本次耗时':>10}{'累计次数':>8}"
+             f"{'累计页数':>8}{'累计耗时':>10}{'连续错误':>8}"]
+    for r in records[:limit]:
+        lines.append(
+            f"{r['user_id']:<12}{r['state'] or '-':<9}{r['pages']:>8}{r['articles']:>8}{r['seconds']:>9.1f}s"
+            f"{r['runs']:>8}{r['total_pages']:>8}{r['total_seconds']:>9.1f}s{r['errors']:>8}"
+        )
+    return lines
+
+def list_store_users(base_dir=HISTORY_DIR):
+    if not os.path.isdir(base_dir):
+        return []
+    return sorted(name[:-len(STORE_SUFFIX)] for name in os.listdir(base_dir) if name.endswith(STORE_SUFFIX))
+
+# 导出存档：python track_store.py [用户名 ...]，不指定用户名时导出全部用户
+# 爬取成本报表：python track_store.py --report
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if sys.argv[1:] == ['--report']:
+        checkpoints = open_checkpoints()
+        print('\n'.join(format_cost_report(checkpoints.report())))
+        checkpoints.close()
+        sys.exit(0)
+    names = sys.argv[1:] or list_store_users()
+    exported = sum(export_user_history(name) for name in names)
+    print(f"共{len(names)}个用户，导出{exported}个有变化的存档")
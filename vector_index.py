@@ -0,0 +1,330 @@
+import os
+import re
+import sys
+import struct
+import functools
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import comment_store
+import track_store
+import embedding_service
+import embedding_store
+
+# ==== 配置 ====
+# 入库时建立的向量索引：爬取写入新数据后只为新增的文本计算嵌入，搜索时只需请求查询词的嵌入
+INDEX_ENABLED = os.getenv('XUEQIU_VECTOR_INDEX', '1') == '1'
+# 索引与存档放在一起：history_comments/{code}.{模型}-{维度}.vec.npy、history_track/{user_name}_all.{模型}-{维度}.vec.npy
+VECTOR_SUFFIX = '.vec.npy'  # 按行L2归一化的float32矩阵
+ID_SUFFIX = '.ids.npy'  # 每行对应的文本ID（uint64，即嵌入文本MD5的前64位），与矩阵按行对应
+RAW_VECTOR_SUFFIX = '.vec'  # 旧格式：未归一化的原始向量，首次打开时转换
+RAW_ID_SUFFIX = '.vecids'
+ID_DTYPE = np.dtype('<u8')
+NPY_HEADER_LEN = 128  # .npy文件头固定长度，行数变化时原地改写
+TEXT_ID_CACHE_SIZE = 200000
+BUILD_WORKERS = 1  # 后台建索引的线程数，多个爬取完成时排队依次建立
+STOCK_CODE_PATTERN = re.compile(r'^(\d{5,6}|[A-Z]{1,5})$')
+
+logger = logging.getLogger(__name__)
+
+def preprocess_text(text):
+    """与各搜索模块的预处理一致：合并空白"""
+    if not text:
+        return ""
+    text = re.sub(r'\s+', ' ', text).strip()
+    return re.sub(r'[\r\n]+', ' ', text)
+
+def comment_text(comment):
+    """评论用于嵌入的文本"""
+    return preprocess_text(comment.get('content', ''))
+
+def article_text(article):
+    """文章用于嵌入的文本：标题与正文合并"""
+    return f"{preprocess_text(article.get('title', ''))} {preprocess_text(article.get('content', ''))}"
+
+@functools.lru_cache(maxsize=TEXT_ID_CACHE_SIZE)
+def text_id(text):
+    return int.from_bytes(embedding_store.text_key(text)[:8], 'little')
+
+def text_ids(texts):
+    """文本ID数组，同一进程内重复搜索同一存档时直接取缓存，不再逐条计算哈希"""
+    return np.fromiter((text_id(text) for text in texts), dtype=ID_DTYPE, count=len(texts))
+
+def stock_index_prefix(stock_code, service, base_dir=comment_store.OUTPUT_DIR):
+    return os.path.join(base_dir, f"{stock_code}.{embedding_service.store_name(service.model, service.dim)}")
+
+def user_index_prefix(user_name, service, base_dir=track_store.HISTORY_DIR):
+    return os.path.join(base_dir, f"{user_name}_all.{embedding_service.store_name(service.model, service.dim)}")
+
+def _npy_header(dtype, shape):
+    """固定长度的.npy文件头，追加行后原地改写行数"""
+    header = repr({'descr': np.lib.format.dtype_to_descr(np.dtype(dtype)), 'fortran_order': False, 'shape': shape})
+    header = header.ljust(NPY_HEADER_LEN - 11) + '\n'
+    return np.lib.format.MAGIC_PREFIX + b'\x01\x00' + struct.pack('<H', len(header)) + header.encode('latin1')
+
+def _npy_rows(path):
+    """.npy文件头中记录的行数，文件不存在时为0"""
+    if not os.path.exists(path):
+        return 0
+    with open(path, 'rb') as f:
+        np.lib.format.read_magic(f)
+        shape, _, _ = np.lib.format.read_array_header_1_0(f)
+    return shape[0]
+
+def _npy_append(path, dtype, width, rows, data):
+    """
+    在前rows行之后追加数据并改写文件头，超出rows的部分（上次追加中途崩溃留下的）先截掉
+    先写数据并落盘再改写行数，读取方按文件头只会看到完整的行
+    """
+    row_shape = (width,) if width else ()
+    if not os.path.exists(path):
+        with open(path, 'wb') as f:
+            f.write(_npy_header(dtype, (0,) + row_shape))
+    row_bytes = np.dtype(dtype).itemsize * (width or 1)
+    total = rows + len(data) // row_bytes
+    with open(path, 'r+b') as f:
+        end = NPY_HEADER_LEN + rows * row_bytes
+        # 只在有残留时截断：Windows上不能截断仍被映射的文件
+        if f.seek(0, os.SEEK_END) != end:
+            f.truncate(end)
+        f.seek(end)
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+        f.seek(0)
+        f.write(_npy_header(dtype, (total,) + row_shape))
+        f.flush()
+        os.fsync(f.fileno())
+
+def normalize_rows(matrix):
+    """按行L2归一化，零向量保持为零"""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
+
+class VectorIndex:
+    """
+    单只股票或单个用户的向量索引：{prefix}.vec.npy 为按行L2归一化的float32矩阵，
+    {prefix}.ids.npy 为每行对应的文本ID（uint64）
+    矩阵以np.memmap只读映射，多个会话共用操作系统的页缓存；相似度为一次矩阵-向量乘法
+    先追加向量再追加ID，行数以两者中较小的为准，中途崩溃留下的多余行在下次追加时截掉
+    相同文本只存一行；文本ID不在索引中的记录（新爬取、被编辑或重新提取）在同步时补算
+    """
+    def __init__(self, prefix, dim):
+        self.prefix = prefix
+        self.dim = dim
+        self.vector_path = f"{prefix}{VECTOR_SUFFIX}"
+        self.id_path = f"{prefix}{ID_SUFFIX}"
+        self._lock = threading.RLock()
+        self._ids = None
+        self._order = None  # ID升序排列的行号，用于二分查找
+        self._matrix = None
+        self._stamp = None
+
+    def _file_stamp(self):
+        try:
+            return tuple((os.path.getsize(path), os.path.getmtime(path)) for path in (self.vector_path, self.id_path))
+        except OSError:
+            return None
+
+    def _migrate_raw(self):
+        """转换旧格式的索引（未归一化的 .vec 原始向量与 .vecids），调用方持有锁"""
+        raw_vectors, raw_ids = f"{self.prefix}{RAW_VECTOR_SUFFIX}", f"{self.prefix}{RAW_ID_SUFFIX}"
+        if os.path.exists(self.id_path) or not (os.path.exists(raw_vectors) and os.path.exists(raw_ids)):
+            return
+        ids = np.fromfile(raw_ids, dtype=ID_DTYPE)
+        vectors = np.fromfile(raw_vectors, dtype=np.float32)
+        rows = min(len(ids), len(vectors) // self.dim)
+        if rows:
+            self._append(ids[:rows], vectors[:rows * self.dim].reshape(rows, self.dim), 0)
+        os.remove(raw_vectors)
+        os.remove(raw_ids)
+        logger.info(f"已将向量索引{self.prefix}转换为归一化矩阵，共{rows}行")
+
+    def _ensure_loaded(self):
+        """加载ID并映射向量矩阵，其他进程（爬虫）追加后重新加载；调用方持有锁"""
+        if self._ids is None:
+            self._migrate_raw()
+        stamp = self._file_stamp()
+        if self._ids is not None and stamp == self._stamp:
+            return
+        rows = min(_npy_rows(self.vector_path), _npy_rows(self.id_path)) if stamp is not None else 0
+        if rows:
+            self._ids = np.array(np.load(self.id_path, mmap_mode='r')[:rows])
+            self._matrix = np.load(self.vector_path, mmap_mode='r')[:rows]
+        else:
+            self._ids = np.empty(0, dtype=ID_DTYPE)
+            self._matrix = np.zeros((0, self.dim), dtype=np.float32)
+        self._order = np.argsort(self._ids, kind='stable')
+        self._stamp = stamp
+
+    def __len__(self):
+        with self._lock:
+            self._ensure_loaded()
+            return len(self._ids)
+
+    def rows_of(self, ids):
+        """返回ids对应的行号数组，不在索引中的为-1"""
+        ids = np.asarray(ids, dtype=ID_DTYPE)
+        with self._lock:
+            self._ensure_loaded()
+            if not len(self._ids):
+                return np.full(len(ids), -1, dtype=np.int64)
+            sorted_ids = self._ids[self._order]
+            pos = np.minimum(np.searchsorted(sorted_ids, ids), len(sorted_ids) - 1)
+            return np.where(sorted_ids[pos] == ids, self._order[pos], -1)
+
+    def _append(self, ids, vectors, rows):
+        """在前rows行之后追加，调用方持有锁"""
+        os.makedirs(os.path.dirname(self.vector_path) or '.', exist_ok=True)
+        _npy_append(self.vector_path, np.float32, self.dim, rows, normalize_rows(vectors).tobytes())
+        _npy_append(self.id_path, ID_DTYPE, None, rows, np.ascontiguousarray(ids, dtype=ID_DTYPE).tobytes())
+        self._ids = None
+        self._matrix = None
+
+    def add(self, ids, vectors):
+        """追加向量（写入时归一化），已在索引中的ID忽略；返回追加的行数"""
+        ids = np.asarray(ids, dtype=ID_DTYPE)
+        with self._lock:
+            self._ensure_loaded()
+            keep = self.rows_of(ids) < 0
+            _, first = np.unique(ids, return_index=True)
+            keep &= np.isin(np.arange(len(ids)), first)
+            if not keep.any():
+                return 0
+            self._append(ids[keep], np.asarray(vectors, dtype=np.float32)[keep], len(self._ids))
+            return int(keep.sum())
+
+    def sync(self, texts, service, api_keys=None, ids=None):
+        """为不在索引中的文本计算嵌入并追加，返回追加的行数"""
+        if ids is None:
+            ids = text_ids(texts)
+        missing = np.flatnonzero(self.rows_of(ids) < 0)
+        if not len(missing):
+            return 0
+        missing_texts = list(dict.fromkeys(texts[i] for i in missing if texts[i]))
+        vectors = service.embed_many(missing_texts, api_keys=api_keys)
+        fetched = [(text, vector) for text, vector in zip(missing_texts, vectors) if vector is not None]
+        if not fetched:
+            return 0
+        return self.add(text_ids([text for text, _ in fetched]), np.vstack([vector for _, vector in fetched]))
+
+    def similarities(self, query_vector, texts, service, api_keys=None):
+        """
+        返回query_vector与texts的余弦相似度数组：先补算索引中缺少的文本，无法获取嵌入的文本为0
+        整个索引矩阵与查询向量做一次矩阵-向量乘法；索引已在爬取后建好时不发起任何请求
+        """
+        query = normalize_rows(np.asarray(query_vector, dtype=np.float32).reshape(1, -1))[0]
+        ids = text_ids(texts)
+        with self._lock:
+            added = self.sync(texts, service, api_keys, ids)
+            if added:
+                logger.info(f"向量索引{self.prefix}补充了{added}条文本")
+            rows = self.rows_of(ids)
+            matrix = self._matrix
+        if not len(matrix):
+            return np.zeros(len(texts), dtype=np.float32)
+        scores = matrix @ query
+        return np.where(rows >= 0, scores[rows], 0).astype(np.float32)
+
+_indexes = {}
+_indexes_guard = threading.Lock()
+
+def get_index(prefix, dim):
+    """按路径共享的索引实例，同一进程内的搜索与后台建索引共用同一把锁"""
+    with _indexes_guard:
+        index = _indexes.get(prefix)
+        if index is None:
+            index = VectorIndex(prefix, dim)
+            _indexes[prefix] = index
+        return index
+
+def stock_index(stock_code, service=None, base_dir=comment_store.OUTPUT_DIR):
+    service = service or embedding_service.get_embedding_service()
+    return get_index(stock_index_prefix(stock_code, service, base_dir), service.dim)
+
+def user_index(user_name, service=None, base_dir=track_store.HISTORY_DIR):
+    service = service or embedding_service.get_embedding_service()
+    return get_index(user_index_prefix(user_name, service, base_dir), service.dim)
+
+def update_stock_index(stock_code, base_dir=comment_store.OUTPUT_DIR):
+    """为股票存档中尚未建索引的评论计算嵌入，返回新增的行数"""
+    service = embedding_service.get_embedding_service()
+    comments = comment_store.load_comments(stock_code, base_dir=base_dir)
+    texts = [comment_text(c) for c in comments if c.get('content')]
+    added = stock_index(stock_code, service, base_dir).sync(texts, service)
+    logger.info(f"股票{stock_code}的向量索引新增{added}条")
+    return added
+
+def update_user_index(user_name, base_dir=track_store.HISTORY_DIR):
+    """为用户存档中尚未建索引的文章计算嵌入，返回新增的行数"""
+    service = embedding_service.get_embedding_service()
+    texts = [article_text(a) for a in track_store.load_user_history(user_name, base_dir)]
+    added = user_index(user_name, service, base_dir).sync(texts, service)
+    logger.info(f"用户{user_name}的向量索引新增{added}条")
+    return added
+
+_builder = None
+_pending = set()
+_pending_guard = threading.Lock()
+
+def _schedule(target, update, name):
+    """提交后台建索引任务，同一对象已在排队时不重复提交；未开启或未配置API密钥时跳过"""
+    global _builder
+    if not INDEX_ENABLED:
+        return None
+    if not embedding_service.get_embedding_service().api_keys:
+        logger.debug("未配置QWEN_API_KEY，跳过建立向量索引")
+        return None
+    with _pending_guard:
+        if target in _pending:
+            return None
+        _pending.add(target)
+        if _builder is None:
+            _builder = ThreadPoolExecutor(max_workers=BUILD_WORKERS, thread_name_prefix='vector-index')
+
+    def run():
+        with _pending_guard:
+            _pending.discard(target)
+        try:
+            return update(name)
+        except Exception as e:
+            logger.warning(f"建立{target}的向量索引失败: {e}")
+            return 0
+
+    return _builder.submit(run)
+
+def update_stock_index_in_background(stock_code):
+    """爬取写入新评论后调用，不阻塞爬取"""
+    return _schedule(f"股票{stock_code}", update_stock_index, stock_code)
+
+def update_user_index_in_background(user_name):
+    """文章写入文章库后调用，不阻塞爬取"""
+    return _schedule(f"用户{user_name}", update_user_index, user_name)
+
+def list_stock_codes(base_dir=comment_store.OUTPUT_DIR):
+    """存档目录中的股票代码（A股6位、港股5位数字，美股1-5位字母）"""
+    if not os.path.isdir(base_dir):
+        return []
+    names = (name[:-len('.json')] for name in os.listdir(base_dir) if name.endswith('.json'))
+    return sorted(name for name in names if STOCK_CODE_PATTERN.match(name))
+
+def list_user_names(base_dir=track_store.HISTORY_DIR):
+    """有历史存档（文章库或原JSON存档）的用户名"""
+    if not os.path.isdir(base_dir):
+        return []
+    names = {name[:-len('_all.json')] for name in os.listdir(base_dir) if name.endswith('_all.json')}
+    return sorted(names | set(track_store.list_store_users(base_dir)))
+
+# 为已有存档建立索引：python vector_index.py [comments [股票代码 ...] | track [用户名 ...]]，不带参数时为全部存档建立
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    command = sys.argv[1] if len(sys.argv) > 1 else 'all'
+    targets = sys.argv[2:]
+    if command in ('comments', 'all'):
+        for code in targets or list_stock_codes():
+            update_stock_index(code)
+    if command in ('track', 'all'):
+        for name in targets or list_user_names():
+            update_user_index(name)